@@ -2,6 +2,11 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 import subprocess
 import os
+import sys
+
+# The shared ffmpeg helpers live with the other tools in Utilities
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Utilities'))
+from ffmpeg_capabilities import capabilities, find_tool
 
 def open_file_dialog():
     filename = filedialog.askopenfilename()
@@ -37,6 +42,15 @@ def convert_videos():
     max_br = max_bitrate_entry.get()
     step_br = step_bitrate_entry.get()
 
+    ffmpeg = find_tool("ffmpeg")
+    if not ffmpeg:
+        messagebox.showerror("Error", "ffmpeg not found. Install it with: brew install ffmpeg")
+        return
+    encoder = capabilities(ffmpeg).first_encoder("libx265", "hevc_videotoolbox")
+    if not encoder:
+        messagebox.showerror("Error", f"{ffmpeg} has no HEVC encoder (libx265 or hevc_videotoolbox).")
+        return
+
     try:
         min_br_int = int(min_br)
         max_br_int = int(max_br)
@@ -53,9 +67,9 @@ def convert_videos():
             scale_cmd = ["-vf", "scale=iw/2:ih/2"] if br < 15000 else []
             audio_cmd = ["-i", audio_source, "-c:a", "copy"] if audio_source else ["-c:a", "copy"]
             ffmpeg_command = [
-                "ffmpeg", "-i", source, 
+                ffmpeg, "-i", source, 
                 *audio_cmd,
-                "-c:v", "hevc", "-tag:v", "hvc1", 
+                "-c:v", encoder, "-tag:v", "hvc1", 
                 *scale_cmd, 
                 "-b:v", bitrate, 
                 transcoded_file
@@ -3,9 +3,17 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 from tkinter import filedialog
+import shutil
 import subprocess
+import tempfile
 import threading
 
+from ffmpeg_capabilities import find_tool
+
+# Best audio-only stream, or the best muxed audio+video file when the site
+# offers no separate audio (a site with neither has no audio to merge)
+AUDIO_FORMAT = 'ba/b'
+
 def download_and_convert():
     url = url_entry.get()
     cookies_path = cookies_entry.get()
@@ -17,18 +25,27 @@ def download_and_convert():
         messagebox.showerror("Error", "Please enter a video URL")
         return
 
+    ytdlp, ffmpeg = find_tool('yt-dlp'), find_tool('ffmpeg')
+    if not ytdlp or not ffmpeg:
+        missing = ' and '.join(name for name, path in (('yt-dlp', ytdlp), ('ffmpeg', ffmpeg)) if not path)
+        messagebox.showerror("Error", f"{missing} not found. Install with: brew install yt-dlp ffmpeg")
+        return
+
+    # Each download lands in its own folder, so only its files are converted
+    download_dir = tempfile.mkdtemp(prefix='webvid_', dir=downloads_path)
+
     def run_download():
         try:
-            # Construct the download command
-            download_command = f'yt-dlp -o "{downloads_path}/%(title)s.%(ext)s"'
+            # Only the audio is kept, so ask for audio rather than the whole video
+            download_command = [ytdlp, '-f', AUDIO_FORMAT, '-o', os.path.join(download_dir, '%(title)s.%(ext)s')]
 
             # Add cookies file path if provided
             if cookies_path:
-                download_command += f' --cookies "{cookies_path}"'
+                download_command += ['--cookies', cookies_path]
 
-            download_command += f' {url}'
+            download_command.append(url)
 
-            process = subprocess.Popen(download_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            process = subprocess.Popen(download_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
 
             while True:
                 output = process.stdout.readline()
@@ -36,33 +53,39 @@ def download_and_convert():
                     break
                 if output:
                     print(output.strip())  # or update this to reflect in the GUI
+            if process.returncode != 0:
+                raise RuntimeError(f"yt-dlp exited {process.returncode}")
 
             # Post-download processing
             convert_downloaded_video()
 
         except Exception as e:
             messagebox.showerror("Error", str(e))
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
 
     def convert_downloaded_video():
         try:
-            for file in os.listdir(downloads_path):
-                if file.endswith(('.mp4', '.webm')):
-                    input_file = os.path.join(downloads_path, file)
-                    output_file = os.path.splitext(input_file)[0] + f'.{format_choice}'
+            downloaded = [file for file in os.listdir(download_dir) if not file.endswith(('.part', '.ytdl'))]
+            if not downloaded:
+                raise RuntimeError("yt-dlp did not download anything")
+            for file in downloaded:
+                input_file = os.path.join(download_dir, file)
+                output_file = os.path.join(downloads_path, os.path.splitext(file)[0] + f'.{format_choice}')
 
-                    # Convert to WAV 48kHz 24-bit if selected
-                    if format_choice == 'wav':
-                        convert_command = f'ffmpeg -i "{input_file}" -ar 48000 -acodec pcm_s24le "{output_file}"'
+                # Convert to WAV 48kHz 24-bit if selected (-vn drops picture from a muxed fallback)
+                if format_choice == 'wav':
+                    convert_command = [ffmpeg, '-i', input_file, '-vn', '-ar', '48000', '-acodec', 'pcm_s24le', output_file]
 
-                    # Convert to highest quality FLAC if selected
-                    elif format_choice == 'flac':
-                        convert_command = f'ffmpeg -i "{input_file}" -q:a 0 "{output_file}"'
+                # Convert to highest quality FLAC if selected
+                elif format_choice == 'flac':
+                    convert_command = [ffmpeg, '-i', input_file, '-vn', '-q:a', '0', output_file]
 
-                    subprocess.run(convert_command, shell=True, check=True)
+                subprocess.run(convert_command, check=True)
 
-                    # Remove the original video file if checkbox is checked
-                    if delete_original:
-                        os.remove(input_file)
+                # Keep the original download beside the conversion unless the checkbox is checked
+                if not delete_original:
+                    shutil.move(input_file, os.path.join(downloads_path, file))
 
             messagebox.showinfo("Success", f"Video downloaded and converted to {format_choice.upper()} successfully!")
 
@@ -107,7 +130,7 @@ format_dropdown.pack()
 
 # Checkbox for deleting the original video
 delete_var = tk.BooleanVar(value=True)  # Checkbox is checked by default
-delete_checkbox = ttk.Checkbutton(window, text="Delete original video after conversion", variable=delete_var)
+delete_checkbox = ttk.Checkbutton(window, text="Delete original download after conversion", variable=delete_var)
 delete_checkbox.pack()
 
 # Download button
@@ -4,7 +4,17 @@ import os
 import subprocess
 from datetime import datetime
 
+from ffmpeg_capabilities import capabilities, find_tool
+
 def convert_videos():
+    ffmpeg = find_tool('ffmpeg')
+    if not ffmpeg:
+        messagebox.showerror("FFmpeg not found", "Install ffmpeg (brew install ffmpeg) and try again.")
+        return
+    if not capabilities(ffmpeg).has_encoder('libx264'):
+        messagebox.showerror("Missing encoder", f"{ffmpeg} was built without libx264.")
+        return
+
     directory = filedialog.askdirectory()
     if not directory:
         return
@@ -25,7 +35,7 @@ def convert_videos():
             output_file = os.path.join(output_directory, file[:-4] + '.mov')
 
             cmd = [
-                'ffmpeg',
+                ffmpeg,
                 '-i', input_file,
                 '-c:v', 'libx264',
                 '-preset', preset,
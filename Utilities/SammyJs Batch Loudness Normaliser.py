@@ -5,18 +5,24 @@ SammyJ Batch Loudness Normaliser - Professional Audio Processing
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext, font
-import os
+import sys
+import queue
 import threading
 from pathlib import Path
-import soundfile as sf
-import numpy as np
-import pyloudnorm as pyln
-import subprocess
-import tempfile
-from typing import List, Tuple, Optional, Dict
 import traceback
 import platform
-from datetime import datetime
+
+from loudness_cache import LoudnessCache
+from resampler import DEFAULT_QUALITY, QUALITY_PRESETS
+from normaliser_pipeline import (AUDIO_EXTENSIONS, VIDEO_EXTENSIONS, BatchNormaliser,
+                                 NormaliserSettings, cli_main, discover_media, summary_table)
+
+# Worker threads queue log messages; the Tk loop drains them in batches
+LOG_FRAME_MS = 50        # pump interval (~20 fps)
+LOG_MAX_BATCH = 2000     # messages drained per frame
+LOG_MAX_LINES = 5000     # scrollback kept in the results view
+# Failed files named in the end-of-batch summary dialog
+MAX_LISTED_FAILURES = 20
 
 
 class LoudnessNormalizer:
@@ -53,7 +59,20 @@ class LoudnessNormalizer:
         self.true_peak = tk.DoubleVar(value=-1.5)
         self.sample_rate = tk.IntVar(value=48000)
         self.bit_depth = tk.IntVar(value=24)
+        self.resample_quality = tk.StringVar(value=DEFAULT_QUALITY)
+        self.stream_video_audio = tk.BooleanVar(value=True)
+        self.use_cache = tk.BooleanVar(value=True)
+        self.include_subfolders = tk.BooleanVar(value=False)
+        self.io_retries = tk.IntVar(value=0)
+        self.use_float32 = tk.BooleanVar(value=False)
+        self.export_curves = tk.BooleanVar(value=False)
+        self.link_stems = tk.BooleanVar(value=False)
+        self.remux_video = tk.BooleanVar(value=False)
+        self.all_audio_streams = tk.BooleanVar(value=False)
+        self.report_memory = tk.BooleanVar(value=False)
+        self.cache = None
         self.is_processing = False
+        self.log_queue = queue.SimpleQueue()
         
         # Limiter variables
         self.use_limiter = tk.BooleanVar(value=False)
@@ -74,12 +93,13 @@ class LoudnessNormalizer:
         self.limiter_makeup_gain.trace_add('write', self.update_instructions)
         
         # Supported formats
-        self.audio_extensions = {'.wav', '.flac', '.aiff', '.aif', '.mp3', '.ogg', '.m4a'}
-        self.video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m4v'}
+        self.audio_extensions = AUDIO_EXTENSIONS
+        self.video_extensions = VIDEO_EXTENSIONS
         
         # Configure ttk styles
         self.setup_styles()
         self.setup_ui()
+        self.root.after(LOG_FRAME_MS, self.pump_log)
         
     def setup_styles(self):
         style = ttk.Style()
@@ -198,6 +218,9 @@ class LoudnessNormalizer:
         self.output_button = ttk.Button(folder_frame, text="Browse", command=self.select_output_folder, style='Accent.TButton', state='disabled')
         self.output_button.grid(row=1, column=2, pady=(10, 0))
         
+        ttk.Checkbutton(folder_frame, text="Include subfolders", variable=self.include_subfolders,
+                        style='Dark.TCheckbutton').grid(row=2, column=1, sticky=tk.W, pady=(10, 0))
+        
         # Limiter section (Step 1 in processing chain)
         limiter_frame = ttk.Frame(main_frame, style='Medium.TFrame', padding="15")
         limiter_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=(0, 15))
@@ -267,6 +290,41 @@ class LoudnessNormalizer:
                                   values=[16, 24, 32], width=12, style='Dark.TCombobox')
         depth_combo.grid(row=2, column=3, sticky=tk.W, padx=10, pady=5)
         
+        ttk.Label(params_frame, text="I/O Retries:", style='Dark.TLabel').grid(row=3, column=0, sticky=tk.W, pady=5)
+        retries_spin = ttk.Spinbox(params_frame, from_=0, to=5, increment=1,
+                                   textvariable=self.io_retries, width=12, style='Dark.TSpinbox')
+        retries_spin.grid(row=3, column=1, sticky=tk.W, padx=(10, 30), pady=5)
+        
+        ttk.Label(params_frame, text="Resample Quality:", style='Dark.TLabel').grid(row=3, column=2, sticky=tk.W, pady=5)
+        quality_combo = ttk.Combobox(params_frame, textvariable=self.resample_quality, state='readonly',
+                                     values=list(QUALITY_PRESETS), width=12, style='Dark.TCombobox')
+        quality_combo.grid(row=3, column=3, sticky=tk.W, padx=10, pady=5)
+        
+        ttk.Checkbutton(params_frame, text="Stream video audio from ffmpeg (no temporary WAV)",
+                        variable=self.stream_video_audio,
+                        style='Dark.TCheckbutton').grid(row=4, column=0, columnspan=4, sticky=tk.W, pady=(10, 0))
+        ttk.Checkbutton(params_frame, text="Cache measurements (re-targeting skips analysis, unchanged files are skipped)",
+                        variable=self.use_cache,
+                        style='Dark.TCheckbutton').grid(row=5, column=0, columnspan=4, sticky=tk.W, pady=(5, 0))
+        ttk.Checkbutton(params_frame, text="Process in 32-bit float (half the memory, within 0.01 LU of 64-bit)",
+                        variable=self.use_float32,
+                        style='Dark.TCheckbutton').grid(row=6, column=0, columnspan=4, sticky=tk.W, pady=(5, 0))
+        ttk.Checkbutton(params_frame, text="Export momentary/short-term loudness curves (CSV beside each output)",
+                        variable=self.export_curves,
+                        style='Dark.TCheckbutton').grid(row=7, column=0, columnspan=4, sticky=tk.W, pady=(5, 0))
+        ttk.Checkbutton(params_frame, text="Link stems: <mix>_DX / _MX / _FX files share one gain (limiter not applied)",
+                        variable=self.link_stems,
+                        style='Dark.TCheckbutton').grid(row=8, column=0, columnspan=4, sticky=tk.W, pady=(5, 0))
+        ttk.Checkbutton(params_frame, text="Remux videos: normalised audio back into a copy of the video (video not re-encoded)",
+                        variable=self.remux_video,
+                        style='Dark.TCheckbutton').grid(row=9, column=0, columnspan=4, sticky=tk.W, pady=(5, 0))
+        ttk.Checkbutton(params_frame, text="Every audio stream of videos (one WAV per stream, decoded in a single pass)",
+                        variable=self.all_audio_streams,
+                        style='Dark.TCheckbutton').grid(row=10, column=0, columnspan=4, sticky=tk.W, pady=(5, 0))
+        ttk.Checkbutton(params_frame, text="Trace peak memory for the batch (exact, but processing is much slower)",
+                        variable=self.report_memory,
+                        style='Dark.TCheckbutton').grid(row=11, column=0, columnspan=4, sticky=tk.W, pady=(5, 0))
+        
         # Process button
         button_frame = ttk.Frame(main_frame, style='Dark.TFrame')
         button_frame.grid(row=5, column=0, pady=(0, 15))
@@ -308,6 +366,8 @@ class LoudnessNormalizer:
                                    wrap=tk.WORD,
                                    bd=0)
         self.results_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
+        for tag in ('accent', 'success', 'error'):
+            self.results_text.tag_config(tag, foreground=self.colors[tag])
         
         # Scrollbar for text widget
         scrollbar = ttk.Scrollbar(text_frame, orient="vertical", command=self.results_text.yview)
@@ -387,222 +447,119 @@ class LoudnessNormalizer:
         self.process_btn.config(state='disabled')
         self.progress.start()
         self.results_text.delete(1.0, tk.END)
+        if self.use_cache.get() and self.cache is None:
+            self.cache = LoudnessCache()
         
         # Start processing in a separate thread
         thread = threading.Thread(target=self.process_files)
         thread.daemon = True
         thread.start()
         
+    def settings(self) -> NormaliserSettings:
+        """Snapshot of the current UI settings for the pipeline"""
+        return NormaliserSettings(
+            target_loudness=self.target_loudness.get(),
+            true_peak=self.true_peak.get(),
+            sample_rate=self.sample_rate.get(),
+            bit_depth=self.bit_depth.get(),
+            resample_quality=self.resample_quality.get(),
+            use_limiter=self.use_limiter.get(),
+            limiter_threshold=self.limiter_threshold.get(),
+            limiter_true_peak=self.limiter_true_peak.get(),
+            limiter_makeup_gain=self.limiter_makeup_gain.get(),
+            output_path=self.output_path.get(),
+            stream_video_audio=self.stream_video_audio.get(),
+            use_cache=self.use_cache.get(),
+            io_retries=self.io_retries.get(),
+            precision='float32' if self.use_float32.get() else 'float64',
+            export_curves='csv' if self.export_curves.get() else '',
+            link_stems='suffix' if self.link_stems.get() else '',
+            remux_video=self.remux_video.get(),
+            all_audio_streams=self.all_audio_streams.get(),
+            report_memory=self.report_memory.get(),
+        )
+        
     def process_files(self):
+        failures = []
         try:
             folder = Path(self.folder_path.get())
             
             # Find all audio and video files
-            audio_files = []
-            video_files = []
-            
-            for file in folder.iterdir():
-                if file.is_file():
-                    ext = file.suffix.lower()
-                    if ext in self.audio_extensions:
-                        audio_files.append(file)
-                    elif ext in self.video_extensions:
-                        video_files.append(file)
+            audio_files, video_files = discover_media(folder, recursive=self.include_subfolders.get())
             
             self.log(f"Found {len(audio_files)} audio files and {len(video_files)} video files\n", 'accent')
             
-            # Process audio files
-            for file in audio_files:
-                self.process_audio_file(file)
-                
-            # Process video files
-            for file in video_files:
-                self.process_video_file(file)
+            # Subfolders are mirrored under the output folder
+            output_root = Path(self.output_path.get()) if self.output_path.get() else folder
+            def output_dir_for(file_path):
+                output_dir = output_root / file_path.parent.relative_to(folder)
+                output_dir.mkdir(parents=True, exist_ok=True)
+                return output_dir
+            
+            normaliser = BatchNormaliser(self.settings(), log=self.log, cache=self.cache)
+            normaliser.process_files(audio_files, video_files, output_dir_for)
+            failures = normaliser.failures()
+            if normaliser.results:
+                self.log("\n" + summary_table(normaliser.results) + "\n", 'accent')
                 
         except Exception as e:
             self.log(f"Error during processing: {str(e)}\n{traceback.format_exc()}")
         finally:
-            self.root.after(0, self.processing_complete)
+            self.root.after(0, self.processing_complete, failures)
             
-    def processing_complete(self):
+    def processing_complete(self, failures=()):
         self.progress.stop()
         self.process_btn.config(state='normal')
         self.is_processing = False
-        self.log("\n✓ Processing complete!\n", 'success')
+        if not failures:
+            self.log("\n✓ Processing complete!\n", 'success')
+            return
+        
+        # One summary for the whole batch instead of a dialog per file
+        self.log(f"\n✓ Processing complete with {len(failures)} failed file(s):\n", 'error')
+        for result in failures:
+            self.log(f"  {Path(result.source).name}: {result.error}\n", 'error')
+        shown = [f"{Path(r.source).name}: {r.error.splitlines()[0] if r.error else ''}" for r in failures[:MAX_LISTED_FAILURES]]
+        if len(failures) > MAX_LISTED_FAILURES:
+            shown.append(f"...and {len(failures) - MAX_LISTED_FAILURES} more (see the log)")
+        messagebox.showerror("Processing Errors",
+                             f"{len(failures)} file(s) could not be processed:\n\n" + "\n".join(shown))
         
     def log(self, message, color=None):
-        def _log():
-            # Insert with color tag if specified
-            if color:
-                start_index = self.results_text.index(tk.END)
-                self.results_text.insert(tk.END, message)
-                end_index = self.results_text.index(tk.END)
-                self.results_text.tag_add(color, start_index, end_index)
-                self.results_text.tag_config(color, foreground=self.colors.get(color, self.colors['text_primary']))
-            else:
-                self.results_text.insert(tk.END, message)
-            self.results_text.see(tk.END)
-        self.root.after(0, _log)
-        
-    def measure_loudness(self, audio: np.ndarray, rate: int) -> Tuple[float, float]:
-        """Measure integrated loudness and true peak"""
-        meter = pyln.Meter(rate)
-        loudness = meter.integrated_loudness(audio)
-        
-        # Calculate true peak
-        if len(audio.shape) == 1:
-            true_peak_db = 20 * np.log10(np.max(np.abs(audio)) + 1e-10)
-        else:
-            true_peak_db = 20 * np.log10(np.max(np.abs(audio)) + 1e-10)
-            
-        return loudness, true_peak_db
+        """Queue a message for the results view; safe from any thread"""
+        self.log_queue.put((message, color))
         
-    def process_audio_file(self, file_path: Path):
+    def pump_log(self):
+        """Drain queued messages once per frame, one insert per run of same-colour text"""
+        runs = []
         try:
-            self.log(f"\nProcessing: {file_path.name}")
-            
-            # Read audio file
-            audio, rate = sf.read(str(file_path))
-            
-            # Ensure audio is float64 for pyloudnorm
-            audio = audio.astype(np.float64)
-            
-            # Measure original loudness
-            original_loudness, original_peak = self.measure_loudness(audio, rate)
-            self.log(f"  Original: {original_loudness:.1f} LKFS, Peak: {original_peak:.1f} dBFS")
-            
-            # Step 1: Apply limiter first (if enabled)
-            processed_audio = audio.copy()
-            if self.use_limiter.get():
-                self.log(f"  Applying limiter (threshold: {self.limiter_threshold.get():.1f} dBFS)")
-                threshold = 10 ** (self.limiter_threshold.get() / 20)
-                peak_limit = 10 ** (self.limiter_true_peak.get() / 20)
-                
-                # Simple soft-knee limiter
-                for i in range(len(processed_audio)):
-                    if len(processed_audio.shape) == 1:
-                        # Mono
-                        if abs(processed_audio[i]) > threshold:
-                            # Apply soft knee compression above threshold
-                            ratio = 10.0  # 10:1 ratio
-                            excess = abs(processed_audio[i]) - threshold
-                            compressed_excess = excess / ratio
-                            new_value = threshold + compressed_excess
-                            processed_audio[i] = new_value * np.sign(processed_audio[i])
-                    else:
-                        # Stereo/multichannel
-                        for ch in range(processed_audio.shape[1]):
-                            if abs(processed_audio[i, ch]) > threshold:
-                                excess = abs(processed_audio[i, ch]) - threshold
-                                compressed_excess = excess / ratio
-                                new_value = threshold + compressed_excess
-                                processed_audio[i, ch] = new_value * np.sign(processed_audio[i, ch])
-                
-                # Apply makeup gain
-                makeup_gain_linear = 10 ** (self.limiter_makeup_gain.get() / 20)
-                processed_audio = processed_audio * makeup_gain_linear
-                
-                # Apply limiter true peak limiting (after makeup gain)
-                max_peak = np.max(np.abs(processed_audio))
-                if max_peak > peak_limit:
-                    processed_audio = processed_audio * (peak_limit / max_peak)
-                
-                # Measure post-limiter levels
-                post_limiter_loudness, post_limiter_peak = self.measure_loudness(processed_audio, rate)
-                self.log(f"  Post-limiter: {post_limiter_loudness:.1f} LKFS, Peak: {post_limiter_peak:.1f} dBFS")
-            
-            # Step 2: Apply loudness normalization
-            meter = pyln.Meter(rate)
-            current_loudness, _ = self.measure_loudness(processed_audio, rate)
-            normalized_audio = pyln.normalize.loudness(processed_audio, current_loudness, 
-                                                      self.target_loudness.get())
-            
-            # Apply normalization true peak limiting
-            peak_limit = 10 ** (self.true_peak.get() / 20)
-            max_peak = np.max(np.abs(normalized_audio))
-            if max_peak > peak_limit:
-                normalized_audio = normalized_audio * (peak_limit / max_peak)
-            
-            # Measure new loudness
-            new_loudness, new_peak = self.measure_loudness(normalized_audio, rate)
-            self.log(f"  Normalized: {new_loudness:.1f} LKFS, Peak: {new_peak:.1f} dBFS")
-            
-            # Resample if necessary
-            target_rate = self.sample_rate.get()
-            if rate != target_rate:
-                import resampy
-                normalized_audio = resampy.resample(normalized_audio, rate, target_rate, axis=0)
-                self.log(f"  Resampled: {rate} Hz → {target_rate} Hz")
-            
-            # Convert bit depth
-            bit_depth = self.bit_depth.get()
-            if bit_depth == 16:
-                subtype = 'PCM_16'
-            elif bit_depth == 24:
-                subtype = 'PCM_24'
-            else:
-                subtype = 'PCM_32'
-            
-            # Generate output filename with stats
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            loudness_str = f"{abs(int(self.target_loudness.get()))}lkfs"
-            
-            if self.use_limiter.get():
-                peak_str = f"tp{abs(self.limiter_true_peak.get()):.1f}dbfs".replace('.', '_')
-                threshold_str = f"_lim{abs(self.limiter_threshold.get()):.1f}db".replace('.', '_')
-                output_filename = f"{file_path.stem}_normalized_{loudness_str}_{peak_str}{threshold_str}_{timestamp}{file_path.suffix}"
-            else:
-                peak_str = f"tp{abs(self.true_peak.get()):.1f}dbfs".replace('.', '_')
-                output_filename = f"{file_path.stem}_normalized_{loudness_str}_{peak_str}_{timestamp}{file_path.suffix}"
-            
-            # Determine output directory
-            output_dir = Path(self.output_path.get()) if self.output_path.get() else file_path.parent
-            output_path = output_dir / output_filename
-            
-            # Save normalized file
-            sf.write(str(output_path), normalized_audio, target_rate, subtype=subtype)
-            self.log(f"  ✓ Saved: {output_path.name}\n", 'success')
-            
-        except Exception as e:
-            self.log(f"  ✗ ERROR: {str(e)}\n", 'error')
-            messagebox.showerror("Processing Error", f"Error processing {file_path.name}:\n{str(e)}")
-            
-    def process_video_file(self, file_path: Path):
-        try:
-            self.log(f"\nProcessing video: {file_path.name}")
-            
-            # Extract audio to temporary file
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                tmp_path = tmp_file.name
-                
-            # Use ffmpeg to extract audio
-            cmd = [
-                'ffmpeg', '-i', str(file_path),
-                '-vn',  # No video
-                '-acodec', 'pcm_s24le',  # 24-bit PCM
-                '-ar', str(self.sample_rate.get()),  # Sample rate
-                '-y',  # Overwrite
-                tmp_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            
-            if result.returncode != 0:
-                raise Exception(f"FFmpeg error: {result.stderr}")
-                
-            # Process the extracted audio
-            self.process_audio_file(Path(tmp_path))
-            
-            # Clean up
-            os.unlink(tmp_path)
-            
-        except Exception as e:
-            self.log(f"  ✗ ERROR extracting audio: {str(e)}\n", 'error')
-            messagebox.showerror("Video Processing Error", 
-                               f"Failed to extract audio from {file_path.name}:\n{str(e)}\n\nContinuing with other files...")
+            for _ in range(LOG_MAX_BATCH):
+                message, color = self.log_queue.get_nowait()
+                if runs and runs[-1][0] == color:
+                    runs[-1][1].append(message)
+                else:
+                    runs.append((color, [message]))
+        except queue.Empty:
+            pass
+        
+        if runs:
+            text = self.results_text
+            for color, messages in runs:
+                if color and color not in text.tag_names():
+                    text.tag_config(color, foreground=self.colors.get(color, self.colors['text_primary']))
+                text.insert(tk.END, ''.join(messages), (color,) if color else ())
+            # Cap the scrollback
+            excess = int(text.index('end-1c').split('.')[0]) - LOG_MAX_LINES
+            if excess > 0:
+                text.delete('1.0', f'{excess + 1}.0')
+            text.see(tk.END)
+        self.root.after(LOG_FRAME_MS, self.pump_log)
 
 
 def main():
+    # Any arguments mean a headless run (see normaliser_pipeline.py)
+    if len(sys.argv) > 1:
+        sys.exit(cli_main(sys.argv[1:]))
     root = tk.Tk()
     app = LoudnessNormalizer(root)
     root.mainloop()
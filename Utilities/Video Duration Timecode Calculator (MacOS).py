@@ -4,6 +4,8 @@ import os
 import subprocess
 import csv  # Importing csv module
 
+from ffmpeg_capabilities import find_tool
+
 def select_folder():
     folder_path = filedialog.askdirectory()
     if folder_path:
@@ -23,12 +25,16 @@ def list_videos(folder_path):
         messagebox.showinfo("No Videos", "No video files found in the selected directory.")
 
 def get_durations(video_files):
+    ffprobe = find_tool('ffprobe')
+    if not ffprobe:
+        messagebox.showerror("FFprobe not found", "Install ffmpeg (brew install ffmpeg) and try again.")
+        return
     total_seconds = 0
     listbox.delete(0, tk.END)
     global durations  # Define a global list to store video details
     durations = []
     for video in video_files:
-        cmd = ['/opt/homebrew/bin/ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+        cmd = [ffprobe, '-v', 'error', '-show_entries', 'format=duration',
                '-of', 'default=noprint_wrappers=1:nokey=1', video]
         result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         output = result.stdout.strip()
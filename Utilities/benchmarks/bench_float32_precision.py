@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Error analysis for the normaliser's float32 processing mode.
+
+Renders deterministic test signals through BatchNormaliser in float64 and
+float32 (limiter on and off, with and without resampling) and compares the
+results: integrated loudness and sample peak of the two outputs, re-metered
+in float64, and the largest sample difference relative to full scale. Also
+reports the peak memory of each render. Exits non-zero if the float32 path
+differs by more than --tolerance LU or dB.
+
+    python benchmarks/bench_float32_precision.py [--seconds 60]
+"""
+
+import argparse
+import os
+import sys
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from loudness_meter import measure  # noqa: E402
+from normaliser_pipeline import BatchNormaliser, DecodedFile, FileResult, NormaliserSettings  # noqa: E402
+
+
+def test_signal(seconds: float, channels: int, rate: int, seed: int = 0) -> np.ndarray:
+    """Noise with a quiet passage and loud 1 kHz bursts, so the gates and the limiter do work"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * rate)
+    audio = rng.standard_normal((n, channels)) * 0.05
+    t = np.arange(n) / rate
+    bursts = (np.sin(2 * np.pi * 0.5 * t) > 0.9) * 0.9 * np.sin(2 * np.pi * 1000 * t)
+    audio += bursts[:, None]
+    audio[n // 4:n // 4 + n // 10] *= 0.01
+    return audio
+
+
+def render(audio: np.ndarray, rate: int, settings: NormaliserSettings):
+    """Rendered output (as float64) and peak traced memory in MB"""
+    decoded = DecodedFile(FileResult('bench.wav', 'audio'), Path('bench.wav'), output_dir=Path('.'),
+                          audio=audio.astype(settings.precision), rate=rate)
+    tracemalloc.start()
+    try:
+        rendered = BatchNormaliser(settings).render(decoded)
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+    return rendered.audio.astype(np.float64), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=60.0)
+    parser.add_argument('--tolerance', type=float, default=0.01, help="max difference in LU / dB")
+    args = parser.parse_args()
+
+    cases = [
+        ("stereo 48k", 2, 48000, False),
+        ("stereo 48k lim", 2, 48000, True),
+        ("stereo 44.1k lim", 2, 44100, True),
+        ("5.1 96k", 6, 96000, False),
+        ("mono 44.1k", 1, 44100, False),
+    ]
+
+    print(f"{'case':<18}{'Δ LU':>10}{'Δ peak dB':>11}{'max err dBFS':>14}{'f64 MB':>9}{'f32 MB':>9}")
+    failed = False
+    for name, channels, rate, limiter in cases:
+        audio = test_signal(args.seconds, channels, rate)
+        if channels == 1:
+            audio = audio[:, 0]
+        outputs = {}
+        for precision in ('float64', 'float32'):
+            settings = NormaliserSettings(sample_rate=48000, use_limiter=limiter, use_cache=False,
+                                          precision=precision)
+            outputs[precision] = render(audio, rate, settings)
+        (out64, mem64), (out32, mem32) = outputs['float64'], outputs['float32']
+        levels64, levels32 = measure(out64, 48000), measure(out32, 48000)
+        d_loudness = levels32.loudness - levels64.loudness
+        d_peak = levels32.peak - levels64.peak
+        max_err = 20 * np.log10(np.max(np.abs(out32 - out64)) + 1e-20)
+        failed |= abs(d_loudness) > args.tolerance or abs(d_peak) > args.tolerance
+        print(f"{name:<18}{d_loudness:>10.1e}{d_peak:>11.1e}{max_err:>14.1f}{mem64:>9.0f}{mem32:>9.0f}")
+
+    if failed:
+        print(f"FAIL: float32 output differs from float64 by more than {args.tolerance} LU / dB")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
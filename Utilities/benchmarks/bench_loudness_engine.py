@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark the native BS.1770 engine in loudness_meter against pyloudnorm.
+
+Runs both meters on deterministic test signals (1 minute stereo, 1 hour
+stereo, 1 minute 5.0, and 1 minute of stereo "speech" broken by stretches
+of digital silence, where an unguarded filter decays into slow subnormal
+floats) and reports wall time, speedup and the difference in
+integrated loudness for the float64 and float32 paths. Exits non-zero if
+either path disagrees with pyloudnorm by more than --tolerance LU.
+
+    python benchmarks/bench_loudness_engine.py [--quick] [--skip-long]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pyloudnorm as pyln
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from loudness_meter import integrated_loudness  # noqa: E402
+
+
+def test_signal(seconds: float, channels: int, rate: int, seed: int = 0) -> np.ndarray:
+    """Noise with a quiet passage and a 1 kHz tone, so both gates do work"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * rate)
+    audio = rng.standard_normal((n, channels)) * 0.05
+    t = np.arange(n) / rate
+    audio += 0.1 * np.sin(2 * np.pi * 1000 * t)[:, None]
+    # A passage 40 dB down, caught by the relative gate
+    quiet = slice(n // 4, n // 4 + n // 10)
+    audio[quiet] *= 0.01
+    return audio
+
+
+def speech_with_pauses(seconds: float, channels: int, rate: int, seed: int = 0) -> np.ndarray:
+    """Bursts of noise separated by pauses of exact digital zero, as in a dialogue stem"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * rate)
+    audio = np.zeros((n, channels))
+    start = 0
+    while start < n:
+        # 1-4 s of talking, then 0.5-6 s of nothing
+        talk = int(rng.uniform(1, 4) * rate)
+        audio[start:start + talk] = rng.standard_normal((len(audio[start:start + talk]), channels)) * 0.05
+        start += talk + int(rng.uniform(0.5, 6) * rate)
+    return audio
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=int, default=48000)
+    parser.add_argument('--quick', action='store_true', help="divide every duration by 60")
+    parser.add_argument('--skip-long', action='store_true', help="skip the 1 hour case")
+    parser.add_argument('--tolerance', type=float, default=0.01, help="max disagreement in LU")
+    args = parser.parse_args()
+
+    scale = 60 if args.quick else 1
+    cases = [("1 min stereo", 60, 2, test_signal), ("1 hour stereo", 3600, 2, test_signal),
+             ("1 min 5.0", 60, 5, test_signal), ("1 min pauses", 60, 2, speech_with_pauses)]
+    if args.skip_long:
+        cases = [c for c in cases if c[1] <= 60]
+
+    print(f"{'case':<16}{'pyloudnorm':>12}{'native':>10}{'f32':>10}{'speedup':>9}{'Δ f64 LU':>12}{'Δ f32 LU':>12}")
+    failed = False
+    for name, seconds, channels, make_signal in cases:
+        audio = make_signal(seconds / scale, channels, args.rate)
+        reference, t_ref = timed(pyln.Meter(args.rate).integrated_loudness, audio)
+        native, t_native = timed(integrated_loudness, audio, args.rate)
+        audio32 = audio.astype(np.float32)
+        native32, t_native32 = timed(integrated_loudness, audio32, args.rate)
+        delta, delta32 = native - reference, native32 - reference
+        failed |= abs(delta) > args.tolerance or abs(delta32) > args.tolerance
+        print(f"{name:<16}{t_ref:>11.3f}s{t_native:>9.3f}s{t_native32:>9.3f}s"
+              f"{t_ref / t_native:>8.1f}x{delta:>12.2e}{delta32:>12.2e}")
+
+    if failed:
+        print(f"FAIL: native engine disagrees with pyloudnorm by more than {args.tolerance} LU")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
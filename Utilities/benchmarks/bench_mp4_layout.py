@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Wall time and bytes written by yt_wav_mux's MP4 layouts.
+
+Muxes a synthetic picture file (high-bitrate H.264 test pattern with noise,
+so it does not compress away) against a WAV with each --mp4-layout:
+faststart, which writes the file and then rewrites it to move the index to
+the front, and fragmented and reserved, which write it once. Bytes written
+are the ffmpeg process's own I/O counters (/proc/<pid>/io on Linux; block
+output counts from getrusage elsewhere), so the faststart rewrite shows up
+as roughly double the output size. Results are saved as JSON, tagged with
+the git commit:
+
+    python benchmarks/bench_mp4_layout.py --seconds 300 --resolution 3840x2160 --mbps 60
+
+Fixtures are cached in --fixtures (default: the system temp folder). Each
+layout is run --repeat times and the fastest run is kept.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ffmpeg_capabilities import capabilities, ffmpeg_path  # noqa: E402
+from yt_wav_mux import MP4_LAYOUTS, mux_command  # noqa: E402
+
+WAV_RATE = 48000
+WAV_CHUNK = 1 << 20
+
+
+def picture_fixture(folder: Path, ffmpeg: str, resolution: str, fps: int, seconds: float, mbps: float) -> Path:
+    """Write (once) and return a constant-bitrate test pattern"""
+    path = folder / f"picture_{resolution}_{fps}_{seconds:g}s_{mbps:g}M.mp4"
+    if path.exists():
+        return path
+    encoder = capabilities(ffmpeg).first_encoder('libx264', 'h264_videotoolbox', 'mpeg4')
+    if encoder is None:
+        raise RuntimeError("ffmpeg has no H.264 or MPEG-4 encoder for the picture fixture")
+    rate = f"{mbps:g}M"
+    partial = path.with_suffix('.partial.mp4')
+    subprocess.run([
+        ffmpeg, '-hide_banner', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', f"testsrc2=size={resolution}:rate={fps}",
+        '-vf', 'noise=alls=12:allf=t', '-t', f"{seconds:g}", '-pix_fmt', 'yuv420p',
+        '-c:v', encoder, *(['-preset', 'ultrafast'] if encoder == 'libx264' else []),
+        '-b:v', rate, '-minrate', rate, '-maxrate', rate, '-bufsize', rate,
+        str(partial),
+    ], check=True)
+    partial.rename(path)
+    return path
+
+
+def wav_fixture(folder: Path, seconds: float) -> Path:
+    """Write (once) and return a stereo 24-bit WAV of quiet noise"""
+    path = folder / f"mix_{seconds:g}s.wav"
+    if path.exists():
+        return path
+    total = int(seconds * WAV_RATE)
+    partial = path.with_suffix('.partial')
+    with sf.SoundFile(str(partial), 'w', WAV_RATE, 2, 'PCM_24', format='WAV') as f:
+        for start in range(0, total, WAV_CHUNK):
+            rng = np.random.default_rng(start // WAV_CHUNK)
+            f.write(rng.standard_normal((min(WAV_CHUNK, total - start), 2)) * 0.05)
+    partial.rename(path)
+    return path
+
+
+def run_counted(cmd) -> dict:
+    """Run cmd; wall seconds and bytes it wrote"""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_oublock
+    start = time.perf_counter()
+    # A file rather than a pipe, so ffmpeg never blocks on output nobody reads yet
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=stderr)
+        counters = {}
+        io_path = f"/proc/{proc.pid}/io"
+        if os.path.exists(io_path) and hasattr(os, 'waitid'):
+            # Wait without reaping, so the finished process's counters can still be read
+            os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+            with open(io_path) as f:
+                counters = {key: int(value) for key, _, value in (line.partition(': ') for line in f)}
+        proc.wait()
+        seconds = time.perf_counter() - start
+        if proc.returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode(errors='replace').strip()[-500:]
+            raise RuntimeError(f"ffmpeg exited {proc.returncode}: {message}")
+    if counters:
+        return {'seconds': seconds, 'bytes_written': counters['wchar'], 'bytes_read': counters['rchar'],
+                'counter': 'proc'}
+    blocks = resource.getrusage(resource.RUSAGE_CHILDREN).ru_oublock - before
+    return {'seconds': seconds, 'bytes_written': blocks * 512, 'bytes_read': None, 'counter': 'rusage'}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=120)
+    parser.add_argument('--resolution', default='1920x1080')
+    parser.add_argument('--fps', type=int, default=24)
+    parser.add_argument('--mbps', type=float, default=40, help="picture bitrate")
+    parser.add_argument('--fixtures', type=Path, default=Path(tempfile.gettempdir()) / 'sweejscripts_bench_fixtures')
+    parser.add_argument('--out-dir', type=Path, help="where muxes are written (default: a temp folder); "
+                        "use the disk you mux to in practice")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per layout; the fastest is kept")
+    parser.add_argument('-o', '--output', type=Path, help="JSON results (default bench_mp4_layout_<commit>.json)")
+    args = parser.parse_args()
+
+    ffmpeg = ffmpeg_path()
+    args.fixtures.mkdir(parents=True, exist_ok=True)
+    print("Preparing fixtures…", flush=True)
+    picture = picture_fixture(args.fixtures, ffmpeg, args.resolution, args.fps, args.seconds, args.mbps)
+    wav = wav_fixture(args.fixtures, args.seconds)
+    commit = git_commit()
+    report = {
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'picture': {'path': str(picture), 'bytes': picture.stat().st_size, 'resolution': args.resolution,
+                    'fps': args.fps, 'seconds': args.seconds, 'mbps': args.mbps},
+        'ffmpeg': capabilities(ffmpeg).version,
+        'machine': {'platform': platform.platform(), 'processor': platform.processor(),
+                    'cpus': os.cpu_count(), 'python': platform.python_version()},
+        'cases': [],
+    }
+
+    print(f"{'layout':<12}{'wall':>10}{'written':>12}{'output':>12}{'written/output':>16}")
+    with tempfile.TemporaryDirectory(dir=args.out_dir) as out_dir:
+        for layout in MP4_LAYOUTS:
+            out = os.path.join(out_dir, f"{layout}.mp4")
+            runs = []
+            for _ in range(args.repeat):
+                runs.append(run_counted(mux_command(ffmpeg, str(picture), str(wav), {'mp4': out}, 0, layout)))
+                size = os.path.getsize(out)
+                os.unlink(out)
+            best = min(runs, key=lambda run: run['seconds'])
+            case = {'layout': layout, **best, 'output_bytes': size}
+            report['cases'].append(case)
+            print(f"{layout:<12}{best['seconds']:>9.2f}s{best['bytes_written'] / 2 ** 20:>10.0f}MB"
+                  f"{size / 2 ** 20:>10.0f}MB{best['bytes_written'] / size:>15.2f}x")
+
+    output = args.output or Path(f"bench_mp4_layout_{commit or 'local'}.json")
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nSaved {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
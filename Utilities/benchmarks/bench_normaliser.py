@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the normaliser pipeline on synthetic fixtures.
+
+Generates deterministic test files (white noise, log sine sweeps and a
+silence-gated speech-like signal; mono to 7.1.4; 44.1 to 192 kHz; seconds to
+an hour), then times the stages of a real BatchNormaliser: read, the
+render (split into metering, resampling to 48 kHz, and the limiter and
+normalisation gain that make up the rest) and write, plus a full
+process_file run of the same file. Memory tracing (report_memory) stays
+off, so the end-to-end time is comparable with the sum of the stages. Results are saved as JSON, tagged with the git commit, so
+runs can be compared across commits:
+
+    python benchmarks/bench_normaliser.py --suite quick -o before.json
+    python benchmarks/bench_normaliser.py --suite quick -o after.json --compare before.json
+
+Fixtures are cached in --fixtures (default: the system temp folder) and are
+bit-identical between runs and machines. Each case is timed --repeat times
+and the fastest run is kept.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import normaliser_pipeline  # noqa: E402
+from normaliser_pipeline import BatchNormaliser, NormaliserSettings  # noqa: E402
+
+LAYOUTS = {'mono': 1, 'stereo': 2, '5.1': 6, '7.1': 8, '7.1.4': 12}
+TARGET_RATE = 48000
+# Samples generated (and written) per step, so hour-long fixtures fit in memory
+FIXTURE_CHUNK = 1 << 20
+
+# (signal, layout, rate, seconds)
+SUITES = {
+    'quick': [
+        ('noise', 'stereo', 48000, 10),
+        ('sweep', 'mono', 44100, 10),
+        ('speech', 'stereo', 44100, 10),
+        ('noise', '5.1', 96000, 10),
+        ('speech', '7.1.4', 48000, 5),
+    ],
+    'standard': [
+        ('noise', 'mono', 48000, 60),
+        ('noise', 'stereo', 44100, 60),
+        ('sweep', 'stereo', 96000, 60),
+        ('speech', 'stereo', 48000, 300),
+        ('noise', '5.1', 48000, 60),
+        ('speech', '7.1', 48000, 60),
+        ('noise', '7.1.4', 48000, 60),
+        ('sweep', 'stereo', 192000, 30),
+    ],
+    'long': [
+        ('speech', 'stereo', 48000, 3600),
+        ('noise', '5.1', 48000, 1800),
+        ('speech', '7.1.4', 96000, 600),
+    ],
+}
+SIGNALS = ('noise', 'sweep', 'speech')
+# 'gain' is the render less metering and resampling: the limiter and normalisation
+STAGES = ('read', 'meter', 'gain', 'resample', 'write')
+
+
+def fixture_chunk(kind: str, channels: int, rate: int, start: int, count: int, seed: int) -> np.ndarray:
+    """Samples [start, start + count) of a fixture, independent of chunking"""
+    t = (start + np.arange(count)) / rate
+    # Noise is seeded per chunk index so any chunk can be generated alone
+    rng = np.random.default_rng([seed, start // FIXTURE_CHUNK])
+    if kind == 'noise':
+        return rng.standard_normal((count, channels)) * 0.1
+    if kind == 'sweep':
+        # 20 Hz -> 20 kHz (or Nyquist) log sweep every 10 s, phase-offset per channel
+        f0, f1, period = 20.0, min(20000.0, rate / 2.2), 10.0
+        k = np.log(f1 / f0) / period
+        phase = 2 * np.pi * f0 * (np.exp(k * (t % period)) - 1) / k
+        return 0.25 * np.sin(phase[:, None] + np.arange(channels) * np.pi / 7)
+    if kind == 'speech':
+        # Noise shaped into ~4 Hz syllables, 0.5-2 s phrases and pauses of true silence
+        syllables = np.clip(np.sin(2 * np.pi * 4.0 * t), 0, None) ** 2
+        phrase = np.sin(2 * np.pi * t / 3.7) + 0.4 * np.sin(2 * np.pi * t / 1.3) > 0.2
+        carrier = rng.standard_normal((count, channels)) * 0.2
+        # Dialogue lives in the centre; quieter bed elsewhere
+        gains = np.full(channels, 0.3)
+        gains[min(2, channels - 1) if channels >= 3 else slice(None)] = 1.0
+        return carrier * (syllables * phrase)[:, None] * gains
+    raise ValueError(f"Unknown signal '{kind}'")
+
+
+def fixture(folder: Path, kind: str, layout: str, rate: int, seconds: float) -> Path:
+    """Write (once) and return a fixture file"""
+    channels = LAYOUTS[layout]
+    path = folder / f"{kind}_{layout}_{rate}_{seconds:g}s.wav"
+    if path.exists():
+        return path
+    seed = SIGNALS.index(kind) * 1000 + channels
+    total = int(seconds * rate)
+    partial = path.with_suffix('.partial')
+    with sf.SoundFile(str(partial), 'w', rate, channels, 'FLOAT', format='WAV' if total * channels < 1 << 29 else 'RF64') as f:
+        for start in range(0, total, FIXTURE_CHUNK):
+            f.write(fixture_chunk(kind, channels, rate, start, min(FIXTURE_CHUNK, total - start), seed)
+                    .astype(np.float32))
+    partial.rename(path)
+    return path
+
+
+def time_stages(path: Path, settings: NormaliserSettings, out_dir: Path) -> dict:
+    """Seconds spent in each stage for one file, timed around BatchNormaliser's
+    own read, _render and write (and the metering and resampling render calls)"""
+    normaliser = BatchNormaliser(settings)
+    timings = dict.fromkeys(STAGES + ('render',), 0.0)
+
+    def timed(stage, fn):
+        def run(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings[stage] += time.perf_counter() - start
+        return run
+
+    normaliser.measure_levels = timed('meter', normaliser.measure_levels)
+    resample = normaliser_pipeline.resample
+    normaliser_pipeline.resample = timed('resample', resample)
+    try:
+        decoded = timed('read', normaliser.read)(path, 'audio', lambda _: out_dir)
+        rendered = timed('render', normaliser._render)(decoded)
+    finally:
+        normaliser_pipeline.resample = resample
+    if rendered is None:
+        raise RuntimeError(f"{path.name}: {decoded.result.error}")
+    timed('write', normaliser.write)(rendered)
+    rendered.output_path.unlink()
+    timings['gain'] = timings.pop('render') - timings['meter'] - timings['resample']
+    return timings
+
+
+def time_end_to_end(path: Path, settings: NormaliserSettings, out_dir: Path) -> float:
+    normaliser = BatchNormaliser(settings)
+    start = time.perf_counter()
+    normaliser.process_file(path, 'audio', out_dir)
+    seconds = time.perf_counter() - start
+    result = normaliser.results[-1]
+    if result.status != 'ok':
+        raise RuntimeError(f"{path.name}: {result.error}")
+    Path(result.output).unlink()
+    return seconds
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def compare(current: dict, previous_path: Path):
+    previous = {c['name']: c for c in json.loads(Path(previous_path).read_text())['cases']}
+    print(f"\nvs {previous_path} (ratio > 1 = slower now)")
+    print(f"{'case':<32}" + ''.join(f"{s:>10}" for s in STAGES + ('total',)))
+    for case in current['cases']:
+        old = previous.get(case['name'])
+        if old is None:
+            continue
+        cells = []
+        for stage in STAGES + ('total',):
+            new_t = case['total'] if stage == 'total' else case['stages'][stage]
+            old_t = old['total'] if stage == 'total' else old['stages'].get(stage)
+            cells.append(f"{new_t / old_t:>9.2f}x" if old_t else f"{'-':>10}")
+        print(f"{case['name']:<32}" + ''.join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', choices=list(SUITES), default='quick')
+    parser.add_argument('--fixtures', type=Path, default=Path(tempfile.gettempdir()) / 'sweejscripts_bench_fixtures')
+    parser.add_argument('--precision', choices=('float64', 'float32'), default='float64')
+    parser.add_argument('--resample-quality', default='balanced')
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case; the fastest is kept")
+    parser.add_argument('-o', '--output', type=Path, help="JSON results (default bench_normaliser_<commit>.json)")
+    parser.add_argument('--compare', type=Path, help="earlier results to compare against")
+    args = parser.parse_args()
+
+    args.fixtures.mkdir(parents=True, exist_ok=True)
+    settings = NormaliserSettings(sample_rate=TARGET_RATE, use_limiter=True, use_cache=False,
+                                  precision=args.precision, resample_quality=args.resample_quality,
+                                  pipeline_depth=0, report_memory=False)
+    commit = git_commit()
+    report = {
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'suite': args.suite,
+        'precision': args.precision,
+        'resample_quality': args.resample_quality,
+        'machine': {'platform': platform.platform(), 'processor': platform.processor(),
+                    'cpus': os.cpu_count(), 'python': platform.python_version(), 'numpy': np.__version__},
+        'cases': [],
+    }
+
+    print(f"{'case':<32}" + ''.join(f"{s:>10}" for s in STAGES) + f"{'total':>10}{'e2e':>10}{'x rt':>8}")
+    with tempfile.TemporaryDirectory() as out_dir:
+        out_dir = Path(out_dir)
+        for kind, layout, rate, seconds in SUITES[args.suite]:
+            path = fixture(args.fixtures, kind, layout, rate, seconds)
+            runs = [time_stages(path, settings, out_dir) for _ in range(args.repeat)]
+            stages = {stage: min(run[stage] for run in runs) for stage in STAGES}
+            end_to_end = min(time_end_to_end(path, settings, out_dir) for _ in range(args.repeat))
+            total = sum(stages.values())
+            case = {'name': path.stem, 'signal': kind, 'layout': layout, 'channels': LAYOUTS[layout],
+                    'rate': rate, 'seconds': seconds, 'stages': stages, 'total': total,
+                    'end_to_end': end_to_end, 'realtime_factor': seconds / end_to_end}
+            report['cases'].append(case)
+            print(f"{path.stem:<32}" + ''.join(f"{stages[s]:>9.3f}s" for s in STAGES)
+                  + f"{total:>9.3f}s{end_to_end:>9.3f}s{case['realtime_factor']:>7.0f}x")
+
+    output = args.output or Path(f"bench_normaliser_{commit or 'local'}.json")
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nSaved {output}")
+    if args.compare:
+        compare(report, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
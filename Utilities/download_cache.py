@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Persistent download cache for yt_wav_mux.
+
+Downloaded picture (and thumbnails) are stored content-addressed, as
+objects/<sha256[:2]>/<sha256>.<ext>, and indexed in SQLite by video
+(extractor:id) and yt-dlp format selector, so muxing a new mix revision
+against picture that was already fetched never touches the network.
+YouTube IDs are read straight from the URL; other sites are identified with
+a metadata-only yt-dlp call.
+
+The cache is kept under a size limit by evicting the least recently used
+downloads; objects in use by a running mux are never evicted. Every object
+is hashed in full when stored and trusted afterwards while its size and
+mtime are unchanged; otherwise it is hashed again and dropped if it no
+longer matches.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'sweejscripts' / 'downloads'
+DEFAULT_MAX_BYTES = 50 * 2 ** 30
+
+HASH_CHUNK_BYTES = 1 << 20
+# Download folders older than this are left over from a crash
+STALE_PARTIAL_SECONDS = 24 * 3600
+
+YOUTUBE_ID = re.compile(
+    r'(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:[^#]*&)?v=|embed/|shorts/|live/|v/)|youtu\.be/)'
+    r'([A-Za-z0-9_-]{11})')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    sha256 TEXT PRIMARY KEY,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS downloads (
+    video TEXT NOT NULL,
+    format TEXT NOT NULL,
+    video_sha256 TEXT NOT NULL,
+    thumbnail_sha256 TEXT,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (video, format)
+);
+"""
+
+
+class CachedDownload(NamedTuple):
+    """Paths of a cached download; its objects stay pinned until released"""
+    video: Path
+    thumbnail: Optional[Path]
+    hashes: Tuple[str, ...]
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def video_key(url: str, ytdlp: Optional[str] = None) -> Optional[str]:
+    """'extractor:id' for a URL, or None if it cannot be identified"""
+    match = YOUTUBE_ID.search(url)
+    if match:
+        return f"youtube:{match.group(1)}"
+    if ytdlp:
+        try:
+            result = subprocess.run(
+                [ytdlp, '--no-playlist', '--skip-download', '--no-warnings',
+                 '--print', '%(extractor_key)s:%(id)s', url],
+                capture_output=True, text=True, timeout=60
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        lines = result.stdout.strip().splitlines()
+        if result.returncode == 0 and lines and ':' in lines[0]:
+            extractor, _, video_id = lines[0].partition(':')
+            return f"{extractor.lower()}:{video_id}"
+    return None
+
+
+class DownloadCache:
+    """Thread-safe, size-bounded store of downloaded videos and thumbnails"""
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.objects_dir = self.cache_dir / 'objects'
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        # Downloads land here first, so storing them is a rename on one filesystem
+        self.partial_dir = self.cache_dir / 'partial'
+        self.partial_dir.mkdir(exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pins = Counter()
+        self._db = sqlite3.connect(str(self.cache_dir / 'index.sqlite'), check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._remove_strays()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def object_path(self, sha256: str, ext: str) -> Path:
+        return self.objects_dir / sha256[:2] / f"{sha256}.{ext}"
+
+    def _remove_strays(self):
+        """Delete files left by an interrupted store that the index never
+        recorded, and stale download folders"""
+        known = {f"{sha}.{ext}" for sha, ext in self._db.execute("SELECT sha256, ext FROM objects")}
+        for folder in self.objects_dir.iterdir():
+            if folder.is_dir():
+                for path in folder.iterdir():
+                    if path.name not in known:
+                        path.unlink(missing_ok=True)
+        for folder in self.partial_dir.iterdir():
+            if time.time() - folder.stat().st_mtime > STALE_PARTIAL_SECONDS:
+                shutil.rmtree(folder, ignore_errors=True)
+
+    # ---------- lookup ----------
+
+    def _check(self, sha256: str, ext: str, size: int, mtime_ns: int) -> Tuple[bool, Optional[int]]:
+        """Whether an object still holds its contents, and its new mtime if it
+        had to be hashed again; call without the lock, as hashing a large
+        file takes a while"""
+        path = self.object_path(sha256, ext)
+        try:
+            st = os.stat(path)
+            if st.st_size != size:
+                return False, None
+            if st.st_mtime_ns == mtime_ns:
+                return True, None
+            return sha256_file(path) == sha256, st.st_mtime_ns
+        except OSError:
+            return False, None
+
+    def _settle(self, sha256: str, ext: str, intact: bool, mtime_ns: Optional[int]) -> Optional[Path]:
+        """Record the outcome of _check; call with the lock held"""
+        path = self.object_path(sha256, ext)
+        if intact:
+            if mtime_ns is not None:
+                self._db.execute("UPDATE objects SET mtime_ns = ? WHERE sha256 = ?", (mtime_ns, sha256))
+            return path
+        # Missing or damaged: forget it and everything that used it
+        self._db.execute("DELETE FROM downloads WHERE video_sha256 = ? OR thumbnail_sha256 = ?", (sha256, sha256))
+        self._db.execute("DELETE FROM objects WHERE sha256 = ?", (sha256,))
+        path.unlink(missing_ok=True)
+        return None
+
+    def lookup(self, video: str, fmt: str, need_thumbnail: bool = False) -> Optional[CachedDownload]:
+        """Cached download of this video in this format (pinned), or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT video_sha256, thumbnail_sha256 FROM downloads WHERE video = ? AND format = ?",
+                (video, fmt)
+            ).fetchone()
+            if row is None or (need_thumbnail and row[1] is None):
+                return None
+            hashes = tuple(h for h in row if h)
+            objects = {sha: self._db.execute("SELECT ext, size, mtime_ns FROM objects WHERE sha256 = ?",
+                                             (sha,)).fetchone() for sha in hashes}
+            # Pinned while they are checked, so eviction cannot remove them meanwhile
+            self._pins.update(hashes)
+
+        checks = {sha: self._check(sha, *obj) for sha, obj in objects.items() if obj is not None}
+
+        with self._lock:
+            paths = {sha: self._settle(sha, objects[sha][0], *check) for sha, check in checks.items()}
+            video_path = paths.get(row[0])
+            thumbnail_path = paths.get(row[1]) if row[1] else None
+            if video_path is None or (need_thumbnail and thumbnail_path is None):
+                self._pins.subtract(hashes)
+                self._pins += Counter()
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE downloads SET last_used = ? WHERE video = ? AND format = ?",
+                             (time.time(), video, fmt))
+            self._db.commit()
+        return CachedDownload(video_path, thumbnail_path, hashes)
+
+    # ---------- store ----------
+
+    def _add_object(self, source: Path) -> Tuple[str, Path]:
+        """Hash a file and move it into the store (the hashing is done outside
+        the lock); returns its hash and stored path"""
+        sha256 = sha256_file(source)
+        ext = source.suffix.lstrip('.').lower() or 'bin'
+        with self._lock:
+            row = self._db.execute("SELECT ext FROM objects WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is not None:
+                return sha256, self.object_path(sha256, row[0])
+            target = self.object_path(sha256, ext)
+            target.parent.mkdir(exist_ok=True)
+            shutil.move(str(source), str(target))
+            st = target.stat()
+            self._db.execute("INSERT INTO objects VALUES (?, ?, ?, ?)", (sha256, ext, st.st_size, st.st_mtime_ns))
+            self._db.commit()
+        return sha256, target
+
+    def store(self, video: str, fmt: str, video_path: Path,
+              thumbnail_path: Optional[Path] = None) -> CachedDownload:
+        """Move a fresh download into the cache; returns its cached (pinned) paths"""
+        video_sha, video_path = self._add_object(Path(video_path))
+        thumbnail_sha = None
+        if thumbnail_path:
+            thumbnail_sha, thumbnail_path = self._add_object(Path(thumbnail_path))
+        hashes = tuple(h for h in (video_sha, thumbnail_sha) if h)
+        with self._lock:
+            self._pins.update(hashes)
+            self._db.execute("INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?)",
+                             (video, fmt, video_sha, thumbnail_sha, time.time()))
+            self._db.commit()
+        self.evict()
+        return CachedDownload(video_path, thumbnail_path, hashes)
+
+    def release(self, download: CachedDownload):
+        with self._lock:
+            self._pins.subtract(download.hashes)
+            self._pins += Counter()     # drop counts that reached zero
+
+    # ---------- eviction ----------
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+    def evict(self) -> int:
+        """Drop least recently used downloads until the cache fits max_bytes;
+        returns the bytes freed"""
+        freed = 0
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+            rows = self._db.execute(
+                "SELECT video, format, video_sha256, thumbnail_sha256 FROM downloads ORDER BY last_used"
+            ).fetchall()
+            for video, fmt, video_sha, thumbnail_sha in rows:
+                if total <= self.max_bytes:
+                    break
+                if self._pins[video_sha] or (thumbnail_sha and self._pins[thumbnail_sha]):
+                    continue
+                self._db.execute("DELETE FROM downloads WHERE video = ? AND format = ?", (video, fmt))
+                # Objects are shared between downloads with identical contents
+                for sha in filter(None, (video_sha, thumbnail_sha)):
+                    in_use = self._db.execute(
+                        "SELECT 1 FROM downloads WHERE video_sha256 = ? OR thumbnail_sha256 = ? LIMIT 1",
+                        (sha, sha)).fetchone()
+                    row = self._db.execute("SELECT ext, size FROM objects WHERE sha256 = ?", (sha,)).fetchone()
+                    if in_use or row is None:
+                        continue
+                    self._db.execute("DELETE FROM objects WHERE sha256 = ?", (sha,))
+                    self.object_path(sha, row[0]).unlink(missing_ok=True)
+                    total -= row[1]
+                    freed += row[1]
+            self._db.commit()
+        return freed
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Shared ffmpeg/ffprobe discovery and capability cache for the sweejscripts tools.
+
+Apps launched from the Finder do not inherit the shell's PATH, so tools are
+looked for on PATH and then in the usual Homebrew/MacPorts locations (an
+FFMPEG or FFPROBE environment variable overrides both). What a binary can do
+(version, encoders, decoders, filters, hardware acceleration methods) is
+probed once and kept in a JSON file keyed by the binary's resolved path,
+size and mtime, so it is only probed again after an upgrade.
+
+    from ffmpeg_capabilities import capabilities, ffmpeg_path, ffprobe_path
+    if capabilities().has_encoder('aac_at'): ...
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+
+DEFAULT_CACHE_PATH = Path.home() / '.cache' / 'sweejscripts' / 'ffmpeg_capabilities.json'
+
+# Searched after PATH, in order
+EXTRA_TOOL_DIRS = ('/opt/homebrew/bin', '/usr/local/bin', '/opt/local/bin', '/usr/bin')
+# Environment variables that name a specific binary
+TOOL_OVERRIDES = {'ffmpeg': 'FFMPEG', 'ffprobe': 'FFPROBE'}
+
+# " V....D libx264   libx264 H.264 ..." (codecs) / " TSC afade  A->A  Fade ..." (filters)
+_CODEC_LINE = re.compile(r'^\s*[A-Z.]{6}\s+(\S+)\s')
+_FILTER_LINE = re.compile(r'^\s*[A-Z.|]{2,3}\s+(\S+)\s+\S*->\S*\s')
+
+_lock = threading.Lock()
+
+
+@dataclass
+class Capabilities:
+    """What one ffmpeg (or ffprobe) binary reports about itself"""
+    path: str
+    version: str = ''
+    encoders: List[str] = field(default_factory=list)
+    decoders: List[str] = field(default_factory=list)
+    filters: List[str] = field(default_factory=list)
+    hwaccels: List[str] = field(default_factory=list)
+
+    def has_encoder(self, name: str) -> bool:
+        return name in self.encoders
+
+    def has_decoder(self, name: str) -> bool:
+        return name in self.decoders
+
+    def has_filter(self, name: str) -> bool:
+        return name in self.filters
+
+    def first_encoder(self, *names: str) -> Optional[str]:
+        """The first of names this build can encode with"""
+        return next((name for name in names if name in self.encoders), None)
+
+
+@lru_cache(maxsize=None)
+def find_tool(name: str) -> Optional[str]:
+    """Absolute path of a command-line tool, or None"""
+    override = os.environ.get(TOOL_OVERRIDES.get(name, ''), '')
+    if override and os.access(override, os.X_OK):
+        return override
+    found = shutil.which(name)
+    if found:
+        return found
+    for folder in EXTRA_TOOL_DIRS:
+        candidate = os.path.join(folder, name)
+        if os.access(candidate, os.X_OK):
+            return candidate
+    return None
+
+
+def require_tool(name: str) -> str:
+    """find_tool, raising FileNotFoundError with an install hint if missing"""
+    path = find_tool(name)
+    if path is None:
+        hint = " (brew install ffmpeg)" if name in TOOL_OVERRIDES else ""
+        raise FileNotFoundError(f"'{name}' not found on PATH or in {', '.join(EXTRA_TOOL_DIRS)}{hint}")
+    return path
+
+
+def ffmpeg_path() -> str:
+    return require_tool('ffmpeg')
+
+
+def ffprobe_path() -> str:
+    return require_tool('ffprobe')
+
+
+def _run(binary: str, *args: str) -> str:
+    result = subprocess.run([binary, '-hide_banner', *args], capture_output=True, text=True, timeout=60)
+    return result.stdout
+
+
+def _after_separator(text: str) -> List[str]:
+    """Lines after the ' ------' rule that ends -encoders/-decoders legends"""
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if line.strip().startswith('---'):
+            return lines[i + 1:]
+    return lines
+
+
+def probe(binary: str) -> Capabilities:
+    """Ask a binary what it supports (ffprobe only reports its version)"""
+    version_line = _run(binary, '-version').partition('\n')[0]
+    version = version_line.split(' version ', 1)[1].split()[0] if ' version ' in version_line else version_line
+    caps = Capabilities(binary, version)
+    if os.path.basename(binary).lower().startswith('ffprobe'):
+        return caps
+
+    def codecs(flag):
+        return sorted({m.group(1) for line in _after_separator(_run(binary, flag))
+                       for m in [_CODEC_LINE.match(line)] if m and m.group(1) != '='})
+
+    caps.encoders = codecs('-encoders')
+    caps.decoders = codecs('-decoders')
+    caps.filters = sorted({m.group(1) for line in _run(binary, '-filters').splitlines()
+                           for m in [_FILTER_LINE.match(line)] if m})
+    hwaccels = _run(binary, '-hwaccels').splitlines()
+    caps.hwaccels = [line.strip() for line in hwaccels[1:] if line.strip()]
+    return caps
+
+
+def _identity(binary: str) -> str:
+    st = os.stat(binary)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def _load(cache_path: Path) -> dict:
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@lru_cache(maxsize=None)
+def _capabilities(binary: str, cache_path: Path) -> Capabilities:
+    identity = _identity(binary)
+    with _lock:
+        entry = _load(cache_path).get(binary)
+    if entry and entry.get('identity') == identity:
+        return Capabilities(**entry['capabilities'])
+
+    caps = probe(binary)
+    with _lock:
+        # Re-read so entries written by another tool meanwhile are kept
+        stored = _load(cache_path)
+        stored[binary] = {'identity': identity, 'capabilities': asdict(caps)}
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            partial = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(partial, 'w') as f:
+                json.dump(stored, f, indent=1)
+            os.replace(partial, cache_path)
+        except OSError:
+            pass    # an unwritable cache only costs a probe next time
+    return caps
+
+
+def capabilities(binary: Optional[str] = None, cache_path: Path = DEFAULT_CACHE_PATH) -> Capabilities:
+    """Capabilities of ffmpeg (or the given binary), from the disk cache when
+    the binary is unchanged"""
+    binary = os.path.realpath(binary or ffmpeg_path())
+    return _capabilities(binary, Path(cache_path))
+
+
+if __name__ == '__main__':
+    for tool in ('ffmpeg', 'ffprobe'):
+        path = find_tool(tool)
+        if path is None:
+            print(f"{tool}: not found")
+            continue
+        caps = capabilities(path)
+        print(f"{tool}: {caps.path} (version {caps.version})")
+        if caps.encoders:
+            print(f"  {len(caps.encoders)} encoders, {len(caps.decoders)} decoders, {len(caps.filters)} filters")
+            print(f"  hwaccels: {', '.join(caps.hwaccels) or 'none'}")
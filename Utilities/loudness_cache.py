@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Persistent loudness measurement cache for the SammyJ Batch Loudness Normaliser.
+
+Measurements (integrated loudness, peak, loudness range, sample rate) are
+stored in SQLite, keyed by source path and an analysis key describing what
+was measured (the untouched source, the source after a given limiter, ...).
+An entry is only trusted while the file's size and a fast content hash still
+match; an unchanged mtime lets the hash be skipped altogether.
+
+The outputs written for each set of output settings are recorded too, so a
+rerun with the same settings can skip files that have not changed.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from loudness_meter import LoudnessMeasurement
+
+DEFAULT_CACHE_PATH = Path.home() / '.cache' / 'sweejscripts' / 'loudness_cache.sqlite'
+
+# Bytes read from the start, middle and end of a file for its content hash
+HASH_SAMPLE_BYTES = 1 << 16
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    path TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    loudness REAL NOT NULL,
+    peak REAL NOT NULL,
+    lra REAL,
+    sample_rate INTEGER NOT NULL,
+    PRIMARY KEY (path, analysis)
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    path TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    PRIMARY KEY (path, settings)
+);
+"""
+
+
+class FileKey(NamedTuple):
+    """Identity of a source file's current contents"""
+    path: str
+    size: int
+    mtime_ns: int
+    content_hash: str
+
+
+class CachedMeasurement(NamedTuple):
+    """A stored measurement and the sample rate it was taken at"""
+    levels: LoudnessMeasurement
+    lra: float
+    sample_rate: int
+
+
+def fast_content_hash(path: Path, size: int) -> str:
+    """BLAKE2b of the size plus the first, middle and last 64 KiB"""
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(0, size // 2 - HASH_SAMPLE_BYTES // 2), max(0, size - HASH_SAMPLE_BYTES)}):
+            f.seek(offset)
+            digest.update(f.read(HASH_SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+class LoudnessCache:
+    """Thread-safe SQLite store of measurements and written outputs"""
+
+    def __init__(self, db_path: Path = DEFAULT_CACHE_PATH):
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def key_for(self, path: Path) -> FileKey:
+        """Identify a file, reusing the stored hash when size and mtime are unchanged"""
+        path = Path(path).resolve()
+        st = os.stat(path)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_hash FROM measurements WHERE path = ? AND size = ? AND mtime_ns = ? LIMIT 1",
+                (str(path), st.st_size, st.st_mtime_ns)
+            ).fetchone()
+        content_hash = row[0] if row else fast_content_hash(path, st.st_size)
+        return FileKey(str(path), st.st_size, st.st_mtime_ns, content_hash)
+
+    def get(self, key: FileKey, analysis: str) -> Optional[CachedMeasurement]:
+        """Stored measurement for this file's contents, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, content_hash, loudness, peak, lra, sample_rate FROM measurements "
+                "WHERE path = ? AND analysis = ?",
+                (key.path, analysis)
+            ).fetchone()
+        if not row or (row[0], row[1]) != (key.size, key.content_hash):
+            return None
+        lra = float('nan') if row[4] is None else row[4]
+        return CachedMeasurement(LoudnessMeasurement(row[2], row[3]), lra, row[5])
+
+    def put(self, key: FileKey, analysis: str, levels: LoudnessMeasurement,
+            lra: float, sample_rate: int):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO measurements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key.path, analysis, key.size, key.mtime_ns, key.content_hash,
+                 float(levels.loudness), float(levels.peak),
+                 None if lra != lra else float(lra), int(sample_rate))
+            )
+            self._db.commit()
+
+    def output_for(self, key: FileKey, settings: str) -> Optional[Path]:
+        """Output previously written from these contents with these settings,
+        if it still exists"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, content_hash, output_path FROM outputs WHERE path = ? AND settings = ?",
+                (key.path, settings)
+            ).fetchone()
+        if not row or (row[0], row[1]) != (key.size, key.content_hash):
+            return None
+        output_path = Path(row[2])
+        return output_path if output_path.exists() else None
+
+    def record_output(self, key: FileKey, settings: str, output_path: Path):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?)",
+                (key.path, settings, key.size, key.content_hash, str(output_path))
+            )
+            self._db.commit()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Fast loudness triage for the SammyJ Batch Loudness Normaliser.
+
+Estimates a file's integrated loudness from a sample of its 400 ms gating
+blocks, reading only those regions:
+
+    python normaliser_pipeline.py /archive --estimate --target -23 --tolerance 1 --report triage.csv
+
+The file is split into equal strata and one block is drawn at random from
+each (stratified sampling, seeded from the path so reruns agree). Each block
+is read after a short pre-roll that lets the K-weighting filter settle, so
+the I/O is roughly blocks x 0.6 s of audio whatever the file length. The
+BS.1770 gates are applied to the sampled block powers, and a bootstrap over
+them gives the confidence interval.
+
+A file is 'in spec' or 'out of spec' when the whole interval is inside or
+outside target +/- tolerance, and 'check' (needs a full analysis) when the
+interval straddles a limit or too few blocks pass the gates. Files short
+enough that sampling would read most of them are measured in full instead.
+Sampled peaks are a lower bound on the true sample peak.
+"""
+
+import hashlib
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import soundfile as sf
+from scipy import signal
+
+from loudness_meter import (ABSOLUTE_GATE, BLOCK_SECONDS, RELATIVE_GATE, analyse, channel_weights,
+                            k_weighting_sos, power_to_lkfs)
+
+DEFAULT_BLOCKS = 200
+DEFAULT_CONFIDENCE = 0.95
+PREROLL_SECONDS = 0.2           # K-weighting settles in well under this
+BOOTSTRAP_ROUNDS = 500
+MIN_GATED_BLOCKS = 20           # fewer sampled blocks above the gates -> 'check'
+ESTIMATE_STATUSES = ('in spec', 'out of spec', 'check', 'error')
+# Measure in full when sampling would read more than this fraction anyway
+FULL_READ_FRACTION = 0.5
+
+
+@dataclass
+class EstimateResult:
+    """Triage outcome for one file, as written to the report"""
+    source: str
+    status: str = 'pending'         # one of ESTIMATE_STATUSES
+    loudness: Optional[float] = None
+    low: Optional[float] = None
+    high: Optional[float] = None
+    sampled_peak: Optional[float] = None
+    blocks: int = 0
+    gated_blocks: int = 0
+    read_fraction: float = 0.0
+    exact: bool = False
+    error: str = ''
+    seconds: float = 0.0
+
+
+def _finite_or_none(value: float) -> Optional[float]:
+    return float(value) if np.isfinite(value) else None
+
+
+def gated_loudness_rows(powers: np.ndarray) -> np.ndarray:
+    """BS.1770 gated loudness of each row of block powers (-inf if nothing passes)"""
+    loudness = power_to_lkfs(powers)
+    above = loudness >= ABSOLUTE_GATE
+    count = above.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = power_to_lkfs(np.where(above, powers, 0).sum(axis=1) / count) + RELATIVE_GATE
+        gated = (loudness > relative[:, None]) & (loudness > ABSOLUTE_GATE)
+        return power_to_lkfs(np.where(gated, powers, 0).sum(axis=1) / gated.sum(axis=1))
+
+
+def sample_block_powers(path: Path, blocks: int, rng: np.random.Generator):
+    """Channel-weighted K-weighted mean square of `blocks` stratified 400 ms
+    blocks, plus their sample peak and the fraction of the file read"""
+    with sf.SoundFile(str(path)) as f:
+        rate, channels, frames = f.samplerate, f.channels, f.frames
+        block = int(round(BLOCK_SECONDS * rate))
+        preroll = int(round(PREROLL_SECONDS * rate))
+        span = frames - block
+        edges = np.linspace(0, span, blocks + 1)
+        starts = (edges[:-1] + rng.random(blocks) * np.diff(edges)).astype(np.int64)
+
+        reads = np.zeros((blocks, preroll + block, channels))
+        for i, start in enumerate(starts):
+            first = max(0, start - preroll)
+            f.seek(first)
+            data = f.read(start + block - first, dtype='float64', always_2d=True)
+            reads[i, preroll + block - len(data):] = data
+
+    sampled_peak = float(np.max(np.abs(reads[:, preroll:]))) if blocks else 0.0
+    filtered = signal.sosfilt(k_weighting_sos(rate).copy(), reads, axis=1)[:, preroll:]
+    powers = np.mean(filtered ** 2, axis=1) @ channel_weights(channels)
+    return powers, sampled_peak, min(1.0, blocks * (preroll + block) / frames)
+
+
+def classify(low: float, high: float, target: float, tolerance: float) -> str:
+    if low >= target - tolerance and high <= target + tolerance:
+        return 'in spec'
+    if high < target - tolerance or low > target + tolerance:
+        return 'out of spec'
+    return 'check'
+
+
+def estimate_file(path: Path, target: float, tolerance: float = 1.0, blocks: int = DEFAULT_BLOCKS,
+                  confidence: float = DEFAULT_CONFIDENCE) -> EstimateResult:
+    """Estimate (or, for short files, measure) a file's loudness and classify it"""
+    result = EstimateResult(str(path))
+    started = time.perf_counter()
+    try:
+        info = sf.info(str(path))
+        block_frames = int(round((BLOCK_SECONDS + PREROLL_SECONDS) * info.samplerate))
+        if blocks * block_frames >= FULL_READ_FRACTION * info.frames:
+            # Short file: a full measurement costs about as much as sampling
+            audio, rate = sf.read(str(path))
+            analyzer = analyse(audio, rate)
+            loudness = analyzer.integrated_loudness()
+            result.loudness = result.low = result.high = _finite_or_none(loudness)
+            result.sampled_peak = _finite_or_none(analyzer.peak_db())
+            powers = analyzer.block_powers()
+            result.blocks = len(powers)
+            result.gated_blocks = int(np.sum(power_to_lkfs(powers) >= ABSOLUTE_GATE))
+            result.read_fraction = 1.0
+            result.exact = True
+            result.status = 'check' if result.loudness is None else classify(loudness, loudness, target, tolerance)
+            return result
+
+        seed = int.from_bytes(hashlib.blake2b(str(Path(path).resolve()).encode(), digest_size=8).digest(), 'little')
+        rng = np.random.default_rng(seed)
+        powers, sampled_peak, read_fraction = sample_block_powers(path, blocks, rng)
+        loudness = gated_loudness_rows(powers[None, :])[0]
+        replicates = gated_loudness_rows(powers[rng.integers(0, len(powers), (BOOTSTRAP_ROUNDS, len(powers)))])
+        tail = (1 - confidence) / 2 * 100
+        low, high = np.percentile(replicates, [tail, 100 - tail])
+
+        result.loudness = _finite_or_none(loudness)
+        result.low, result.high = _finite_or_none(low), _finite_or_none(high)
+        result.sampled_peak = _finite_or_none(20 * np.log10(sampled_peak + 1e-10))
+        result.blocks = len(powers)
+        result.gated_blocks = int(np.sum(power_to_lkfs(powers) >= ABSOLUTE_GATE))
+        result.read_fraction = read_fraction
+        if result.gated_blocks < MIN_GATED_BLOCKS or result.low is None or result.high is None:
+            result.status = 'check'
+        else:
+            result.status = classify(low, high, target, tolerance)
+    except Exception as e:
+        result.status = 'error'
+        result.error = str(e)
+    finally:
+        result.seconds = time.perf_counter() - started
+    return result
+
+
+def estimate_table(results) -> str:
+    """Fixed-width table of estimates, least certain first"""
+    def number(value):
+        return f"{value:.1f}" if value is not None else '-'
+
+    order = {status: i for i, status in enumerate(('check', 'out of spec', 'error', 'in spec'))}
+    header = f"{'File':<40}{'Status':>13}{'LKFS':>8}{'Low':>8}{'High':>8}{'Peak≥':>8}{'Read':>7}"
+    lines = [header, '-' * len(header)]
+    for r in sorted(results, key=lambda r: order.get(r.status, 0)):
+        name = Path(r.source).name
+        name = name if len(name) <= 38 else name[:35] + '...'
+        read = 'full' if r.exact else f"{r.read_fraction:.0%}"
+        lines.append(f"{name:<40}{r.status:>13}{number(r.loudness):>8}{number(r.low):>8}"
+                     f"{number(r.high):>8}{number(r.sampled_peak):>8}{read:>7}")
+    return '\n'.join(lines)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Loudness measurement layer for the SammyJ Batch Loudness Normaliser.
+
+Implements ITU-R BS.1770 gated loudness natively: K-weighting is applied to
+all channels at once with a cascaded biquad filter (kept out of subnormal
+arithmetic on silence, see DENORMAL_GUARD), squared samples are
+summed into 100 ms sub-blocks through a strided view, and the overlapping
+400 ms gating blocks are formed from cumulative sums of those sub-blocks.
+Audio can be fed whole or in chunks, and float32 input is filtered in
+float32 (energies are always accumulated in float64).
+
+K-weighting designs are built once per sample rate and reused for every
+file at that rate. When a processing stage only applies linear gain, the
+new loudness and peak are derived from the previous measurement instead of
+metering the audio again.
+
+Momentary and short-term loudness curves and the Loudness Range come from
+the same 100 ms sub-block energies as the integrated loudness, so they cost
+no extra pass over the audio.
+"""
+
+from functools import lru_cache
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+from scipy import signal
+
+BLOCK_SECONDS = 0.400          # gating block (momentary) length
+SUBBLOCK_SECONDS = 0.100       # 75 % block overlap -> 100 ms hop
+ABSOLUTE_GATE = -70.0          # LKFS
+RELATIVE_GATE = -10.0          # LU below the absolute-gated loudness
+SHORT_TERM_SECONDS = 3.0       # short-term window, also used for LRA
+LRA_RELATIVE_GATE = -20.0      # EBU Tech 3342
+LRA_PERCENTILES = (10, 95)
+
+# Added to the input before K-weighting with alternating sign (a Nyquist-rate
+# tone, which the high pass lets through, unlike a constant offset). On
+# digital silence the filter state would otherwise decay into subnormal
+# floats, which are many times slower to compute with. Its energy, about
+# -290 dBFS, is far below the -70 LKFS gate; it is normal in float32 too.
+DENORMAL_GUARD = 1e-15
+
+# Channel weights for up to five channels in L, R, C, Ls, Rs order (as used
+# by pyloudnorm). Wider layouts are assumed to be SMPTE ordered with the LFE
+# fourth: it is excluded and every channel after it is weighted as surround.
+_FIVE_CHANNEL_WEIGHTS = (1.0, 1.0, 1.0, 1.41, 1.41)
+
+
+class LoudnessMeasurement(NamedTuple):
+    """Integrated loudness (LKFS) and sample peak (dBFS) of a signal"""
+    loudness: float
+    peak: float
+
+    def with_gain(self, gain_db: float) -> 'LoudnessMeasurement':
+        """Measurement of the same signal after a linear gain of gain_db.
+
+        Exact as long as no 400 ms block crosses the -70 LKFS absolute gate,
+        which only matters for near-silent material.
+        """
+        return LoudnessMeasurement(self.loudness + gain_db, self.peak + gain_db)
+
+
+def channel_weights(channels: int) -> np.ndarray:
+    """BS.1770 channel weighting for a channel count"""
+    if channels <= len(_FIVE_CHANNEL_WEIGHTS):
+        return np.array(_FIVE_CHANNEL_WEIGHTS[:channels])
+    return np.array([1.0, 1.0, 1.0, 0.0] + [1.41] * (channels - 4))
+
+
+@lru_cache(maxsize=None)
+def k_weighting_sos(rate: int) -> np.ndarray:
+    """K-weighting (high shelf + high pass) as second-order sections.
+
+    Uses the same RBJ cookbook designs as pyloudnorm so the two meters agree
+    at any sample rate, not just 48 kHz.
+    """
+    # Stage 1: +4 dB high shelf at 1.5 kHz
+    A = 10 ** (4.0 / 40.0)
+    w0 = 2.0 * np.pi * 1500.0 / rate
+    alpha = np.sin(w0) / (2.0 * (1 / np.sqrt(2)))
+    cos_w0, sqrt_A = np.cos(w0), np.sqrt(A)
+    shelf_b = [A * ((A + 1) + (A - 1) * cos_w0 + 2 * sqrt_A * alpha),
+               -2 * A * ((A - 1) + (A + 1) * cos_w0),
+               A * ((A + 1) + (A - 1) * cos_w0 - 2 * sqrt_A * alpha)]
+    shelf_a = [(A + 1) - (A - 1) * cos_w0 + 2 * sqrt_A * alpha,
+               2 * ((A - 1) - (A + 1) * cos_w0),
+               (A + 1) - (A - 1) * cos_w0 - 2 * sqrt_A * alpha]
+
+    # Stage 2: 38 Hz high pass (RLB weighting)
+    w0 = 2.0 * np.pi * 38.0 / rate
+    alpha = np.sin(w0) / (2.0 * 0.5)
+    cos_w0 = np.cos(w0)
+    hp_b = [(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2]
+    hp_a = [1 + alpha, -2 * cos_w0, 1 - alpha]
+
+    sos = np.array([
+        np.concatenate([shelf_b, shelf_a]) / shelf_a[0],
+        np.concatenate([hp_b, hp_a]) / hp_a[0],
+    ])
+    sos.setflags(write=False)
+    return sos
+
+
+def power_to_lkfs(powers: np.ndarray) -> np.ndarray:
+    """Loudness in LKFS of channel-weighted mean squares (-inf for silence)"""
+    with np.errstate(divide='ignore'):
+        return -0.691 + 10 * np.log10(powers)
+
+
+def gated_loudness(block_powers: np.ndarray) -> float:
+    """Integrated loudness from channel-weighted 400 ms block mean squares"""
+    if block_powers.size == 0:
+        raise ValueError("Audio must have length greater than the block size.")
+    with np.errstate(divide='ignore'):
+        block_loudness = -0.691 + 10 * np.log10(block_powers)
+
+    above_absolute = block_loudness >= ABSOLUTE_GATE
+    if not above_absolute.any():
+        return float('-inf')
+    relative_gate = -0.691 + 10 * np.log10(block_powers[above_absolute].mean()) + RELATIVE_GATE
+
+    gated = block_powers[(block_loudness > relative_gate) & (block_loudness > ABSOLUTE_GATE)]
+    if gated.size == 0:
+        return float('-inf')
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+class LoudnessAnalyzer:
+    """Streaming BS.1770 meter.
+
+    Feed (samples,) or (samples, channels) arrays in order with feed(); the
+    filter state and any partial 100 ms sub-block carry over between calls.
+    """
+
+    def __init__(self, rate: int, channels: int, dtype=np.float64,
+                 weights: Optional[Sequence[float]] = None):
+        self.rate = rate
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.weights = np.asarray(weights, dtype=np.float64) if weights is not None else channel_weights(channels)
+        self.subblock_size = int(round(rate * SUBBLOCK_SECONDS))
+        self.samples = 0
+        self.max_abs = 0.0
+
+        self._sos = k_weighting_sos(rate).astype(self.dtype)
+        self._zi = np.zeros((self._sos.shape[0], 2, channels), dtype=self.dtype)
+        self._tail = np.zeros((0, channels), dtype=self.dtype)
+        self._guard = np.zeros((0, 1), dtype=self.dtype)
+        self._subblocks = []
+
+    def feed(self, chunk: np.ndarray):
+        """Analyse the next chunk of audio"""
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        if chunk.ndim == 1:
+            chunk = chunk.reshape(-1, 1)
+        if chunk.shape[1] != self.channels:
+            raise ValueError(f"Expected {self.channels} channels, got {chunk.shape[1]}")
+        if not len(chunk):
+            return
+
+        self.max_abs = max(self.max_abs, float(np.max(np.abs(chunk))))
+        if len(self._guard) < len(chunk) + 1:
+            self._guard = np.tile(np.array([DENORMAL_GUARD, -DENORMAL_GUARD], dtype=self.dtype),
+                                  len(chunk) // 2 + 1)[:, None]
+        # The sign keeps alternating across chunks
+        guard = self._guard[self.samples % 2:][:len(chunk)]
+        self.samples += len(chunk)
+
+        filtered, self._zi = signal.sosfilt(self._sos, chunk + guard, axis=0, zi=self._zi)
+        np.square(filtered, out=filtered)
+        if len(self._tail):
+            filtered = np.concatenate([self._tail, filtered])
+
+        # Strided view: (sub-blocks, sub-block samples, channels), summed in float64
+        whole = len(filtered) // self.subblock_size * self.subblock_size
+        if whole:
+            view = filtered[:whole].reshape(-1, self.subblock_size, self.channels)
+            self._subblocks.append(view.sum(axis=1, dtype=np.float64))
+        self._tail = filtered[whole:].copy()
+
+    def subblock_energies(self) -> np.ndarray:
+        """Per-channel K-weighted energy of each complete 100 ms sub-block"""
+        if not self._subblocks:
+            return np.zeros((0, self.channels))
+        if len(self._subblocks) > 1:
+            self._subblocks = [np.concatenate(self._subblocks)]
+        return self._subblocks[0]
+
+    def block_powers(self, seconds: float = BLOCK_SECONDS) -> np.ndarray:
+        """Channel-weighted mean square of every window of the given length,
+        hopping by 100 ms"""
+        span = int(round(seconds / SUBBLOCK_SECONDS))
+        weighted = self.subblock_energies() @ self.weights
+        if len(weighted) < span:
+            return np.zeros(0)
+        totals = np.concatenate([[0.0], np.cumsum(weighted)])
+        return (totals[span:] - totals[:-span]) / (span * self.subblock_size)
+
+    def integrated_loudness(self) -> float:
+        """Gated integrated loudness in LKFS"""
+        return gated_loudness(self.block_powers())
+
+    def momentary_loudness(self) -> np.ndarray:
+        """Momentary (400 ms) loudness in LKFS every 100 ms; value i covers
+        the window ending at (i + 4) x 100 ms"""
+        return power_to_lkfs(self.block_powers())
+
+    def short_term_loudness(self) -> np.ndarray:
+        """Short-term (3 s) loudness in LKFS every 100 ms; value i covers
+        the window ending at (i + 30) x 100 ms"""
+        return power_to_lkfs(self.block_powers(SHORT_TERM_SECONDS))
+
+    def loudness_range(self) -> float:
+        """Loudness Range (LU) per EBU Tech 3342, NaN if too quiet or short"""
+        short_term = self.short_term_loudness()
+        short_term = short_term[short_term >= ABSOLUTE_GATE]
+        if short_term.size == 0:
+            return float('nan')
+        relative_gate = 10 * np.log10(np.mean(10 ** (short_term / 10))) + LRA_RELATIVE_GATE
+        short_term = short_term[short_term >= relative_gate]
+        if short_term.size == 0:
+            return float('nan')
+        low, high = np.percentile(short_term, LRA_PERCENTILES)
+        return float(high - low)
+
+    def peak_db(self) -> float:
+        """Sample peak in dBFS"""
+        return 20 * np.log10(self.max_abs + 1e-10)
+
+    def measurement(self) -> LoudnessMeasurement:
+        """Integrated loudness and sample peak of everything fed so far"""
+        return LoudnessMeasurement(self.integrated_loudness(), self.peak_db())
+
+
+def analyse(audio: np.ndarray, rate: int) -> LoudnessAnalyzer:
+    """Run a whole signal through a LoudnessAnalyzer.
+
+    float32 audio stays float32 through the filter; anything else is
+    analysed in float64.
+    """
+    dtype = np.float32 if audio.dtype == np.float32 else np.float64
+    analyzer = LoudnessAnalyzer(rate, 1 if audio.ndim == 1 else audio.shape[1], dtype=dtype)
+    analyzer.feed(audio)
+    return analyzer
+
+
+def integrated_loudness(audio: np.ndarray, rate: int) -> float:
+    """Gated integrated loudness of a whole signal in LKFS"""
+    return analyse(audio, rate).integrated_loudness()
+
+
+def sample_peak_db(audio: np.ndarray) -> float:
+    """Sample peak in dBFS"""
+    return 20 * np.log10(np.max(np.abs(audio)) + 1e-10)
+
+
+def measure(audio: np.ndarray, rate: int) -> LoudnessMeasurement:
+    """Meter integrated loudness and sample peak"""
+    return analyse(audio, rate).measurement()
+
+
+def gain_to_db(gain: float) -> float:
+    """Linear amplitude factor to dB"""
+    return 20 * np.log10(gain)
+
+
+def db_to_gain(gain_db: float) -> float:
+    """dB to linear amplitude factor"""
+    return 10 ** (gain_db / 20)
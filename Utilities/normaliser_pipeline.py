@@ -0,0 +1,1614 @@
+#!/usr/bin/env python3
+"""
+Processing pipeline for the SammyJ Batch Loudness Normaliser, without Tk.
+
+The GUI and the headless command line both drive BatchNormaliser:
+
+    python normaliser_pipeline.py /deliveries --target -23 --report qc.json
+    python "SammyJs Batch Loudness Normaliser.py" /deliveries -o /normalised
+
+Source trees are walked recursively with os.scandir. --include/--exclude
+globs are matched against the path relative to the source folder (and
+against the bare file name for patterns without a '/'); excluded folders are
+not descended into. With -o, the source folder structure is mirrored under
+the output folder. A JSON or CSV report (chosen by the file extension) lists
+the outcome for every file, and the exit status is 1 if any file failed.
+Videos normally produce a WAV of their first audio stream. With
+--all-streams every audio stream is decoded in one ffmpeg run, normalised in
+parallel and written to its own WAV, with a result per stream; with --remux
+the streams go back into a copy of the video instead (video stream-copied).
+With --watch the sources are treated as drop folders instead (see
+watch_folder.py).
+"""
+
+import argparse
+import csv
+import errno
+import fnmatch
+import hashlib
+import json
+import os
+import queue
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from loudness_meter import (ABSOLUTE_GATE, BLOCK_SECONDS, SHORT_TERM_SECONDS, SUBBLOCK_SECONDS,
+                            LoudnessAnalyzer, LoudnessMeasurement, analyse, db_to_gain, gain_to_db)
+from ffmpeg_capabilities import capabilities, ffmpeg_path, ffprobe_path
+from loudness_cache import FileKey, LoudnessCache
+from resampler import DEFAULT_QUALITY, QUALITY_PRESETS, Resampler, resample
+
+AUDIO_EXTENSIONS = {'.wav', '.flac', '.aiff', '.aif', '.mp3', '.ogg', '.m4a'}
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m4v'}
+
+# Sample formats audio can be processed in. float32 halves the memory of
+# every stage and stays within 0.0001 LU / 0.0001 dB of float64 (see
+# benchmarks/bench_float32_precision.py)
+PRECISIONS = ('float64', 'float32')
+
+# Loudness curve sidecar formats: CSV, or float32 arrays in a compressed .npz
+CURVE_FORMATS = ('csv', 'npz')
+
+# Frames per read when streaming decoded audio from ffmpeg's stdout
+PIPE_CHUNK_FRAMES = 65536
+# Frames per block when streaming linked stems through the meter and gain
+GROUP_BLOCK_FRAMES = 1 << 16
+
+# Audio codec for the streams of a remuxed video, by container ('pcm' follows
+# the bit depth); lossy codecs get LOSSY_KBPS_PER_CHANNEL
+REMUX_CODECS = {'.mov': 'pcm', '.avi': 'pcm', '.mkv': 'flac', '.mp4': 'aac', '.m4v': 'aac',
+                '.flv': 'aac', '.webm': 'libopus', '.wmv': 'wmav2'}
+LOSSY_KBPS_PER_CHANNEL = 128
+
+# Why silent sources (nothing above the absolute gate) are not written
+SILENT_ERROR = f"Silent (no 400 ms block above {ABSOLUTE_GATE:g} LKFS); not normalised"
+
+# OS errors worth retrying: flaky network shares, busy or timed-out devices
+TRANSIENT_ERRNOS = {getattr(errno, name) for name in (
+    'EIO', 'EAGAIN', 'EBUSY', 'ETIMEDOUT', 'ESTALE', 'ECONNRESET', 'ECONNABORTED',
+    'ENETDOWN', 'ENETRESET', 'ENETUNREACH', 'EHOSTUNREACH') if hasattr(errno, name)}
+# libsndfile's code for an underlying OS read/write failure
+SF_ERR_SYSTEM = 2
+
+
+def is_transient_io_error(error: Exception) -> bool:
+    """True for I/O failures that may succeed if simply tried again"""
+    if isinstance(error, TimeoutError):
+        return True
+    if isinstance(error, OSError):
+        return error.errno in TRANSIENT_ERRNOS
+    return isinstance(error, sf.LibsndfileError) and error.code == SF_ERR_SYSTEM
+
+
+def probe_audio_channels(file_path: Path) -> int:
+    """Channel count of the first audio stream, via ffprobe"""
+    result = subprocess.run(
+        [ffprobe_path(), '-v', 'error', '-select_streams', 'a:0',
+         '-show_entries', 'stream=channels', '-of', 'csv=p=0', str(file_path)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0 or not result.stdout.strip():
+        raise Exception(f"No audio stream found: {result.stderr.strip()}")
+    return int(result.stdout.split()[0])
+
+
+@dataclass
+class AudioStream:
+    """One audio stream of a media file, as reported by ffprobe"""
+    index: int                  # among the file's audio streams, as in -map 0:a:<index>
+    channels: int
+    codec: str = ''
+    start_time: float = 0.0
+    language: str = ''
+    title: str = ''
+
+    def describe(self) -> str:
+        label = f"{self.channels} ch {self.codec}".strip()
+        return ', '.join(part for part in (label, self.language, self.title) if part)
+
+
+def probe_audio_streams(file_path: Path) -> Tuple[List[AudioStream], float]:
+    """Every audio stream of a file and the container's start time, via ffprobe"""
+    result = subprocess.run(
+        [ffprobe_path(), '-v', 'error', '-select_streams', 'a',
+         '-show_entries', 'stream=codec_name,channels,start_time:stream_tags=language,title:format=start_time',
+         '-of', 'json', str(file_path)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise Exception(f"ffprobe error: {result.stderr.strip()}")
+    info = json.loads(result.stdout or '{}')
+
+    def seconds(value) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+
+    streams = [AudioStream(index, int(stream.get('channels') or 2), stream.get('codec_name', ''),
+                           seconds(stream.get('start_time')), stream.get('tags', {}).get('language', ''),
+                           stream.get('tags', {}).get('title', ''))
+               for index, stream in enumerate(info.get('streams', []))]
+    if not streams:
+        raise Exception("No audio stream found")
+    return streams, seconds(info.get('format', {}).get('start_time'))
+
+
+def iter_ffmpeg_audio(file_path: Path, rate: int, channels: int, chunk_frames: int = PIPE_CHUNK_FRAMES,
+                      stream: int = 0):
+    """Yield (frames, channels) float32 chunks of one audio stream (the
+    first by default), read as raw PCM straight from ffmpeg's stdout while
+    it decodes"""
+    cmd = [
+        ffmpeg_path(), '-nostdin', '-v', 'error',
+        '-i', str(file_path),
+        '-map', f'0:a:{stream}', '-vn',
+        '-f', 'f32le', '-acodec', 'pcm_f32le',
+        '-ar', str(rate), '-ac', str(channels),
+        'pipe:1'
+    ]
+    frame_bytes = 4 * channels
+    # stderr goes to a file so a chatty ffmpeg can never block on a full pipe
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        finished = False
+        try:
+            while True:
+                data = proc.stdout.read(chunk_frames * frame_bytes)
+                if not data:
+                    break
+                usable = len(data) - len(data) % frame_bytes
+                yield np.frombuffer(data[:usable], dtype='<f4').reshape(-1, channels)
+            finished = True
+        finally:
+            if not finished:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise Exception(f"FFmpeg error: {stderr.read().decode(errors='replace')}")
+
+
+def decode_ffmpeg_streams(file_path: Path, rate: int, streams: Sequence[AudioStream],
+                          consume: Callable[[int, np.ndarray], None], chunk_frames: int = PIPE_CHUNK_FRAMES):
+    """Decode several audio streams of a file in a single ffmpeg run, each
+    mapped to its own pipe.
+
+    consume(position, chunk) receives (frames, channels) float32 chunks of
+    streams[position], in order, from one reader thread per stream, so the
+    streams are drained (and can be metered) in parallel.
+    """
+    pipes = [os.pipe() for _ in streams]
+    cmd = [ffmpeg_path(), '-nostdin', '-v', 'error', '-i', str(file_path)]
+    for (_, write_fd), stream in zip(pipes, streams):
+        cmd += ['-map', f'0:a:{stream.index}', '-vn', '-f', 'f32le', '-acodec', 'pcm_f32le',
+                '-ar', str(rate), '-ac', str(stream.channels), f'pipe:{write_fd}']
+    errors = []
+
+    with tempfile.TemporaryFile() as stderr:
+        try:
+            proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr,
+                                    pass_fds=[write_fd for _, write_fd in pipes])
+        except Exception:
+            for fds in pipes:
+                for fd in fds:
+                    os.close(fd)
+            raise
+        for _, write_fd in pipes:
+            os.close(write_fd)
+
+        def drain(position: int, read_fd: int):
+            frame_bytes = 4 * streams[position].channels
+            with open(read_fd, 'rb') as pipe:
+                try:
+                    pending = b''
+                    while True:
+                        data = pipe.read(chunk_frames * frame_bytes)
+                        if not data:
+                            break
+                        data = pending + data
+                        usable = len(data) - len(data) % frame_bytes
+                        pending = data[usable:]
+                        consume(position, np.frombuffer(data[:usable], dtype='<f4')
+                                .reshape(-1, streams[position].channels))
+                except Exception as e:
+                    # An undrained pipe would stall every other stream
+                    errors.append(e)
+                    proc.kill()
+
+        readers = [threading.Thread(target=drain, args=(position, read_fd), daemon=True)
+                   for position, (read_fd, _) in enumerate(pipes)]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        proc.wait()
+        if errors:
+            raise errors[0]
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise Exception(f"FFmpeg error: {stderr.read().decode(errors='replace')}")
+
+
+def remux_codec_args(suffix: str, stream: int, channels: int, bit_depth: int) -> List[str]:
+    """ffmpeg encoder options for output audio stream `stream` of a remux"""
+    codec = REMUX_CODECS.get(suffix.lower(), 'aac')
+    if codec not in ('pcm', 'flac') and not capabilities().has_encoder(codec):
+        codec = 'aac'   # e.g. an ffmpeg built without libopus
+    if codec == 'pcm':
+        return [f'-c:a:{stream}', f'pcm_s{bit_depth}le']
+    if codec == 'flac':
+        return [f'-c:a:{stream}', 'flac', f'-sample_fmt:a:{stream}', 's16' if bit_depth == 16 else 's32']
+    return [f'-c:a:{stream}', codec, f'-b:a:{stream}', f'{LOSSY_KBPS_PER_CHANNEL * channels}k']
+
+
+def remux_audio(source: Path, output_path: Path, tracks: Sequence[np.ndarray], rate: int,
+                streams: Sequence[AudioStream], start_time: float = 0.0, bit_depth: int = 24):
+    """Write a copy of source with its audio streams replaced by tracks, in
+    one ffmpeg run.
+
+    Video, subtitles and metadata are stream-copied; each track is fed as raw
+    float32 through its own pipe (offset to where its source stream started),
+    so nothing is written to disk but the output.
+    """
+    pipes = [os.pipe() for _ in tracks]
+    cmd = [ffmpeg_path(), '-nostdin', '-v', 'error', '-y', '-i', str(source)]
+    for (read_fd, _), audio, stream in zip(pipes, tracks, streams):
+        cmd += ['-itsoffset', f"{stream.start_time - start_time:.6f}",
+                '-f', 'f32le', '-ar', str(rate), '-ac', str(audio.shape[1] if audio.ndim > 1 else 1),
+                '-i', f'pipe:{read_fd}']
+    cmd += ['-map', '0', '-map', '-0:a']
+    cmd += [arg for i in range(len(tracks)) for arg in ('-map', f'{i + 1}:a')]
+    cmd += ['-c', 'copy', '-c:v', 'copy', '-map_metadata', '0']
+    for i, audio in enumerate(tracks):
+        cmd += [f'-map_metadata:s:a:{i}', f'0:s:a:{i}']
+        cmd += remux_codec_args(output_path.suffix, i, audio.shape[1] if audio.ndim > 1 else 1, bit_depth)
+    cmd.append(str(output_path))
+
+    def feed(write_fd: int, audio: np.ndarray):
+        with open(write_fd, 'wb') as pipe:
+            try:
+                for start in range(0, len(audio), PIPE_CHUNK_FRAMES):
+                    pipe.write(np.ascontiguousarray(audio[start:start + PIPE_CHUNK_FRAMES], dtype='<f4').tobytes())
+            except BrokenPipeError:
+                pass    # ffmpeg stopped reading; its error is raised below
+
+    with tempfile.TemporaryFile() as stderr:
+        try:
+            proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr,
+                                    pass_fds=[read_fd for read_fd, _ in pipes])
+        except Exception:
+            for fds in pipes:
+                for fd in fds:
+                    os.close(fd)
+            raise
+        for read_fd, _ in pipes:
+            os.close(read_fd)
+        # One feeder per pipe: ffmpeg interleaves its reads across inputs
+        feeders = [threading.Thread(target=feed, args=(write_fd, audio), daemon=True)
+                   for (_, write_fd), audio in zip(pipes, tracks)]
+        for feeder in feeders:
+            feeder.start()
+        for feeder in feeders:
+            feeder.join()
+        proc.wait()
+        if proc.returncode != 0:
+            stderr.seek(0)
+            try:
+                os.unlink(output_path)
+            except OSError:
+                pass
+            raise Exception(f"FFmpeg error: {stderr.read().decode(errors='replace')}")
+
+
+def matches_patterns(rel_path: str, patterns: Sequence[str]) -> bool:
+    """True if a relative path (or, for patterns without '/', its name) matches a glob"""
+    name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatch(rel_path, p) or ('/' not in p and fnmatch.fnmatch(name, p))
+               for p in patterns)
+
+
+def discover_media(root: Path, recursive: bool = True, include: Sequence[str] = (),
+                   exclude: Sequence[str] = ()) -> Tuple[List[Path], List[Path]]:
+    """Audio and video files under root, each list sorted by path"""
+    audio_files, video_files = [], []
+    stack = [(Path(root), '')]
+    while stack:
+        folder, rel_folder = stack.pop()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                rel_path = f"{rel_folder}{entry.name}"
+                if exclude and matches_patterns(rel_path, exclude):
+                    continue
+                if entry.is_dir():
+                    if recursive:
+                        stack.append((Path(entry.path), rel_path + '/'))
+                    continue
+                if not entry.is_file() or (include and not matches_patterns(rel_path, include)):
+                    continue
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext in AUDIO_EXTENSIONS:
+                    audio_files.append(Path(entry.path))
+                elif ext in VIDEO_EXTENSIONS:
+                    video_files.append(Path(entry.path))
+    return sorted(audio_files), sorted(video_files)
+
+
+# Stem names recognised by link_stems='suffix': "Reel1_DX.wav", "Reel1 MX.wav", "Reel1-FX2.wav"
+STEM_SUFFIXES = ('DX', 'DIA', 'DIAL', 'VO', 'MX', 'MUS', 'MUSIC', 'FX', 'SFX', 'BG', 'AMB', 'FOL', 'FOLEY')
+STEM_SUFFIX_PATTERN = rf"^(.+?)[ _.-]+(?:{'|'.join(STEM_SUFFIXES)})(?:[ _.-]*\d+)?$"
+
+
+def group_stems(files: Iterable[Path], mode: str) -> Tuple[Dict[str, List[Path]], List[Path]]:
+    """Split audio files into linked stem groups and files processed alone.
+
+    mode is 'folder' (every file in a folder is one group), 'suffix' (files
+    named <mix>_DX, <mix>_MX, ... in one folder) or a regular expression whose
+    first group, matched against the file stem, names the group. Groups of
+    one file are processed alone.
+    """
+    pattern = None if mode == 'folder' else re.compile(
+        STEM_SUFFIX_PATTERN if mode == 'suffix' else mode, re.IGNORECASE)
+    groups: Dict[str, List[Path]] = {}
+    singles = []
+    for file in files:
+        if pattern is None:
+            name = str(file.parent)
+        else:
+            match = pattern.match(file.stem)
+            if not match:
+                singles.append(file)
+                continue
+            name = str(file.parent / match.group(1))
+        groups.setdefault(name, []).append(file)
+    for name in [n for n, members in groups.items() if len(members) == 1]:
+        singles.extend(groups.pop(name))
+    return groups, sorted(singles)
+
+
+def group_analysis(keys: Sequence[FileKey]) -> str:
+    """Cache analysis key for a stem group, which changes when any member does"""
+    digest = hashlib.blake2b(digest_size=16)
+    for key in sorted(keys):
+        digest.update(f"{key.path}\0{key.size}\0{key.content_hash}\n".encode())
+    return f"group:{digest.hexdigest()}"
+
+
+@dataclass
+class NormaliserSettings:
+    """Processing options shared by the GUI and the command line"""
+    target_loudness: float = -18.0
+    true_peak: float = -1.5
+    sample_rate: int = 48000
+    bit_depth: int = 24
+    resample_quality: str = DEFAULT_QUALITY
+    use_limiter: bool = False
+    limiter_threshold: float = -1.0
+    limiter_true_peak: float = -0.3
+    limiter_makeup_gain: float = 0.0
+    output_path: str = ''
+    stream_video_audio: bool = True
+    use_cache: bool = True
+    io_retries: int = 0
+    retry_backoff: float = 2.0
+    pipeline_depth: int = 1
+    precision: str = 'float64'
+    export_curves: str = ''     # '' or one of CURVE_FORMATS
+    link_stems: str = ''        # '' or a group_stems() mode
+    remux_video: bool = False   # write videos with normalised audio instead of a WAV
+    all_audio_streams: bool = False   # one WAV per audio stream of a video, not just the first
+    report_memory: bool = False    # trace allocations for exact peak memory (slows processing)
+    per_file_memory: bool = True   # traced peaks per file when files render one at a time
+
+    def limiter_settings(self) -> Optional[str]:
+        if not self.use_limiter:
+            return None
+        return f"limiter:{self.limiter_threshold:g}:{self.limiter_true_peak:g}:{self.limiter_makeup_gain:g}"
+
+    def output_settings(self, output_dir: Path) -> str:
+        """Everything that affects the written output, as a cache key"""
+        settings = {
+            'target_loudness': self.target_loudness,
+            'true_peak': self.true_peak,
+            'limiter': self.limiter_settings(),
+            'sample_rate': self.sample_rate,
+            'bit_depth': self.bit_depth,
+            'resample_quality': self.resample_quality,
+            'precision': self.precision,
+            'export_curves': self.export_curves,
+            'remux_video': self.remux_video,
+            'all_audio_streams': self.all_audio_streams,
+            'output_path': str(output_dir),
+        }
+        return json.dumps(settings, sort_keys=True)
+
+    def subtype(self) -> str:
+        if self.bit_depth == 16:
+            return 'PCM_16'
+        elif self.bit_depth == 24:
+            return 'PCM_24'
+        return 'PCM_32'
+
+    def output_filename(self, file_path: Path, limited: bool = True) -> str:
+        """filename_normalized_<settings>_<timestamp>.ext; limited=False names
+        an output the limiter was not applied to (linked stems)"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        loudness_str = f"{abs(int(self.target_loudness))}lkfs"
+        if self.use_limiter and limited:
+            peak_str = f"tp{abs(self.limiter_true_peak):.1f}dbfs".replace('.', '_')
+            threshold_str = f"_lim{abs(self.limiter_threshold):.1f}db".replace('.', '_')
+            return f"{file_path.stem}_normalized_{loudness_str}_{peak_str}{threshold_str}_{timestamp}{file_path.suffix}"
+        peak_str = f"tp{abs(self.true_peak):.1f}dbfs".replace('.', '_')
+        return f"{file_path.stem}_normalized_{loudness_str}_{peak_str}_{timestamp}{file_path.suffix}"
+
+
+@dataclass
+class FileResult:
+    """Outcome for one source file, as written to the report"""
+    source: str
+    kind: str
+    status: str = 'pending'
+    output: str = ''
+    original_loudness: Optional[float] = None
+    original_peak: Optional[float] = None
+    loudness: Optional[float] = None
+    peak: Optional[float] = None
+    lra: Optional[float] = None
+    max_momentary: Optional[float] = None
+    max_short_term: Optional[float] = None
+    curves: str = ''
+    group: str = ''             # linked stem group; loudness figures are then the group's
+    stream: Optional[int] = None    # audio stream, for videos processed stream by stream
+    cached_analysis: bool = False
+    error: str = ''
+    attempts: int = 0
+    seconds: float = 0.0
+    peak_memory_mb: Optional[float] = None      # traced; see BatchNormaliser
+    buffer_memory_mb: Optional[float] = None    # the file's decoded and rendered audio
+
+
+def _finite_or_none(value: float) -> Optional[float]:
+    return float(value) if np.isfinite(value) else None
+
+
+def soft_knee_limit(audio: np.ndarray, threshold: float, ratio: float = 10.0) -> np.ndarray:
+    """Compress every sample above threshold (linear) by ratio, in place"""
+    magnitude = np.abs(audio)
+    over = magnitude > threshold
+    audio[over] = np.sign(audio[over]) * (threshold + (magnitude[over] - threshold) / ratio)
+    return audio
+
+
+# Marks the end of a pipeline queue
+_DONE = object()
+
+
+def _audio_bytes(item) -> int:
+    """Bytes of audio held by a DecodedFile or RenderedFile, streams included"""
+    own = item.audio.nbytes if item.audio is not None else 0
+    return own + sum(_audio_bytes(track) for track in item.tracks)
+
+
+@contextmanager
+def _tracing_memory(enabled: bool):
+    """Trace allocations (numpy buffers included) for peak memory, if enabled"""
+    started = enabled and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+@dataclass
+class DecodedFile:
+    """A source read into memory, waiting to be processed"""
+    result: FileResult
+    name_path: Path                 # stem and suffix given to the output
+    output_dir: Optional[Path] = None
+    key: Optional[FileKey] = None
+    analysis: str = 'source'
+    audio: Optional[np.ndarray] = None   # stays None if skipped or failed
+    rate: int = 0
+    levels: Optional[LoudnessMeasurement] = None   # when metered while decoding
+    analyzer: Optional[LoudnessAnalyzer] = None     # the meter behind levels, if not cached
+    notes: list = field(default_factory=list)      # log lines held back for the writer to emit
+    # Video processed per audio stream: one DecodedFile each, instead of audio
+    tracks: List['DecodedFile'] = field(default_factory=list)
+    streams: List[AudioStream] = field(default_factory=list)
+    start_time: float = 0.0
+
+
+@dataclass
+class RenderedFile:
+    """Processed audio waiting to be written"""
+    result: FileResult
+    key: Optional[FileKey]
+    output_dir: Path
+    output_path: Path
+    audio: Optional[np.ndarray]
+    rate: int
+    curves: Optional[Tuple[np.ndarray, np.ndarray]] = None   # momentary, short-term LKFS
+    # Video processed per audio stream: one RenderedFile each, in place of
+    # audio, remuxed into a copy of source (if set) or written separately
+    source: Optional[Path] = None
+    tracks: List['RenderedFile'] = field(default_factory=list)
+    streams: List[AudioStream] = field(default_factory=list)
+    start_time: float = 0.0
+
+
+class BatchNormaliser:
+    """Limit, normalise, resample and write audio and video sources.
+
+    Each file goes through three stages: read (identify, skip check, decode),
+    render (meter, limit, normalise, resample) and write. With
+    settings.pipeline_depth > 0 the stages run on separate threads joined by
+    bounded queues, so reading file N+1 and writing file N-1 overlap the DSP
+    for file N; at most about 2 x depth + 3 files are held in memory.
+
+    Every file's decoded and rendered audio buffers are logged and kept as
+    its buffer_memory_mb, which costs nothing. Exact peaks need tracemalloc,
+    which slows processing considerably, so they are only taken with
+    settings.report_memory. Traced memory is process-wide: with
+    settings.per_file_memory and files processed one at a time, the peak
+    while each file is rendered is logged and kept as its peak_memory_mb;
+    otherwise (pipelined, or per-file tracing turned off) one peak for the
+    whole batch is logged and kept as self.peak_memory_mb.
+
+    log(message, color=None) receives progress text; lines logged while a
+    file is read ahead are held back until that file is processed, so the log
+    still reads one file at a time. A failing file never stops the batch: it
+    is logged, recorded in results (see failures()) and, for transient I/O
+    errors, retried up to settings.io_retries times with exponential backoff.
+    """
+
+    def __init__(self, settings: NormaliserSettings,
+                 log: Callable[..., None] = None,
+                 cache: Optional[LoudnessCache] = None):
+        self.settings = settings
+        self._sink = log or (lambda message, color=None: None)
+        self._deferred = threading.local()
+        self.cache = cache if settings.use_cache else None
+        self.results: List[FileResult] = []
+        self.peak_memory_mb: Optional[float] = None
+        self._per_file_memory = settings.per_file_memory
+
+    def log(self, message: str, color: Optional[str] = None):
+        notes = getattr(self._deferred, 'notes', None)
+        if notes is not None:
+            notes.append((message, color))
+        else:
+            self._sink(message, color)
+
+    # ---------- batch ----------
+
+    def process_files(self, audio_files: Iterable[Path], video_files: Iterable[Path],
+                      output_dir_for: Optional[Callable[[Path], Path]] = None) -> List[FileResult]:
+        """Process every file; output_dir_for maps a source to its output folder"""
+        groups = {}
+        if self.settings.link_stems:
+            groups, audio_files = group_stems(audio_files, self.settings.link_stems)
+        sources = [(file, 'audio') for file in audio_files] + [(file, 'video') for file in video_files]
+        depth = self.settings.pipeline_depth
+        # Pipelined files overlap, so their peaks would include each other's buffers
+        self._per_file_memory = self.settings.per_file_memory and depth <= 0
+        with _tracing_memory(self.settings.report_memory):
+            batch_peak = tracemalloc.is_tracing() and not self._per_file_memory
+            if batch_peak:
+                tracemalloc.reset_peak()
+            if depth <= 0:
+                for file, kind in sources:
+                    self._render_and_write(self.read(file, kind, output_dir_for))
+            else:
+                self._run_pipeline(sources, output_dir_for, depth)
+            for name, stems in groups.items():
+                self.process_group(name, stems, output_dir_for)
+            if batch_peak:
+                peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                self.peak_memory_mb = round(max(peak, self.peak_memory_mb or 0), 1)
+                self.log(f"\nPeak memory for the batch: {peak:.0f} MB")
+        return self.results
+
+    def _run_pipeline(self, sources, output_dir_for, depth: int):
+        decoded = queue.Queue(maxsize=depth)
+        rendered = queue.Queue(maxsize=depth)
+        reader = threading.Thread(target=self._reader, args=(sources, output_dir_for, decoded), daemon=True)
+        writer = threading.Thread(target=self._writer, args=(rendered,), daemon=True)
+        reader.start()
+        writer.start()
+        try:
+            while True:
+                item = decoded.get()
+                if item is _DONE:
+                    break
+                # Render lines join the reader's; the writer logs them, then its
+                # own, so each file's lines stay together
+                self._deferred.notes = item.notes
+                try:
+                    output = self._render(item)
+                finally:
+                    self._deferred.notes = None
+                rendered.put((item.notes, output))
+        finally:
+            rendered.put(_DONE)
+            writer.join()
+
+    def process_file(self, file_path: Path, kind: str = 'audio', output_dir: Optional[Path] = None):
+        """Read, render and write one source in the calling thread"""
+        self._per_file_memory = self.settings.per_file_memory
+        with _tracing_memory(self.settings.report_memory):
+            self._render_and_write(self.read(file_path, kind, lambda _: output_dir))
+
+    def _reader(self, sources, output_dir_for, decoded: queue.Queue):
+        try:
+            for file, kind in sources:
+                self._deferred.notes = notes = []
+                item = self.read(file, kind, output_dir_for)
+                item.notes = notes
+                self._deferred.notes = None
+                decoded.put(item)
+        finally:
+            self._deferred.notes = None
+            decoded.put(_DONE)
+
+    def _writer(self, rendered: queue.Queue):
+        while True:
+            item = rendered.get()
+            if item is _DONE:
+                return
+            notes, output = item
+            for message, color in notes:
+                self._sink(message, color)
+            if output is not None:
+                self._attempt(output.result, f"  ✗ ERROR writing {output.output_path.name}",
+                              lambda: self.write(output))
+
+    def _render(self, decoded: DecodedFile) -> Optional[RenderedFile]:
+        if decoded.audio is None and not decoded.tracks:
+            return None
+        measure = self._per_file_memory and tracemalloc.is_tracing()
+        if measure:
+            tracemalloc.reset_peak()
+        buffers = _audio_bytes(decoded)
+        output = None
+        try:
+            # Rendering works in place, so a retry could apply gain twice
+            output = self._attempt(decoded.result, "  ✗ ERROR", lambda: self.render(decoded), retry=False)
+            return output
+        finally:
+            decoded.audio = None
+            decoded.tracks = []
+            # Only this file's own arrays, so it holds with files in flight in other stages
+            if output is not None:
+                buffers += _audio_bytes(output)
+            decoded.result.buffer_memory_mb = round(buffers / 2 ** 20, 1)
+            message = f"  Audio buffers: {buffers / 2 ** 20:.0f} MB"
+            if measure:
+                peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                decoded.result.peak_memory_mb = round(peak, 1)
+                message += f", peak memory: {peak:.0f} MB"
+            self.log(message)
+
+    def _render_and_write(self, decoded: DecodedFile):
+        output = self._render(decoded)
+        if output is not None:
+            self._attempt(output.result, "  ✗ ERROR", lambda: self.write(output))
+
+    def _start(self, file_path: Path, kind: str) -> FileResult:
+        result = FileResult(str(file_path), kind)
+        self.results.append(result)
+        return result
+
+    def _attempt(self, result: FileResult, error_prefix: str, work: Callable[[], object],
+                 retry: bool = True):
+        """Run work() for one stage of a file, retrying transient I/O errors
+        and recording anything else as a failure (returns None)"""
+        started = time.perf_counter()
+        retries = self.settings.io_retries if retry else 0
+        try:
+            for attempt in range(retries + 1):
+                result.attempts = max(result.attempts, attempt + 1)
+                try:
+                    return work()
+                except Exception as e:
+                    if attempt < retries and is_transient_io_error(e):
+                        delay = self.settings.retry_backoff * 2 ** attempt
+                        self.log(f"  Transient I/O error: {str(e)} (retrying in {delay:g} s)\n", 'error')
+                        time.sleep(delay)
+                        continue
+                    self.log(f"{error_prefix}: {str(e)}\n", 'error')
+                    result.status = 'error'
+                    result.error = str(e)
+                    return None
+        finally:
+            result.seconds += time.perf_counter() - started
+
+    def failures(self) -> List[FileResult]:
+        return [r for r in self.results if r.status == 'error']
+
+    # ---------- caching ----------
+
+    def output_dir(self, file_path: Path, output_dir: Optional[Path] = None) -> Path:
+        if output_dir is not None:
+            return Path(output_dir)
+        return Path(self.settings.output_path) if self.settings.output_path else file_path.parent
+
+    def cache_key(self, file_path: Path) -> Optional[FileKey]:
+        """Cache identity of a source, or None when caching is off"""
+        if self.cache is None:
+            return None
+        return self.cache.key_for(file_path)
+
+    def skip_unchanged(self, key: Optional[FileKey], output_dir: Path, result: FileResult) -> bool:
+        """True (and logged) if this source was already written with the current settings"""
+        if key is None:
+            return False
+        previous = self.cache.output_for(key, self.settings.output_settings(output_dir))
+        if previous is None:
+            return False
+        self.log(f"  Unchanged since last run, skipping (output: {previous.name})\n", 'success')
+        result.status = 'skipped'
+        result.output = str(previous)
+        return True
+
+    def measure_levels(self, key: Optional[FileKey], analysis: str, audio_fn, rate: int,
+                       result: Optional[FileResult] = None
+                       ) -> Tuple[LoudnessMeasurement, Optional[LoudnessAnalyzer]]:
+        """Measurement from the cache, or from metering audio_fn() and storing it.
+
+        The analyzer is returned when the audio was metered (always, when
+        curves are being exported); result.lra is filled in either way.
+        """
+        if key is not None and not self.settings.export_curves:
+            cached = self.cache.get(key, analysis)
+            if cached is not None and cached.sample_rate == rate:
+                self.log("  Using cached analysis")
+                if result is not None:
+                    result.cached_analysis = True
+                    result.lra = _finite_or_none(cached.lra)
+                return cached.levels, None
+        analyzer = analyse(audio_fn(), rate)
+        levels = analyzer.measurement()
+        lra = analyzer.loudness_range()
+        if key is not None:
+            self.cache.put(key, analysis, levels, lra, rate)
+        if result is not None:
+            result.lra = _finite_or_none(lra)
+        return levels, analyzer
+
+    # ---------- read ----------
+
+    def read(self, file_path: Path, kind: str,
+             output_dir_for: Optional[Callable[[Path], Optional[Path]]] = None) -> DecodedFile:
+        """Reader stage: identify, skip-check and decode one source"""
+        result = self._start(file_path, kind)
+        decoded = DecodedFile(result, file_path)
+        if kind == 'audio':
+            self.log(f"\nProcessing: {file_path.name}")
+            work, error_prefix = self._read_audio_file, "  ✗ ERROR"
+        else:
+            self.log(f"\nProcessing video: {file_path.name}")
+            if self.settings.remux_video or self.settings.all_audio_streams:
+                work = self._read_video_tracks
+            else:
+                work = self._read_video_stream if self.settings.stream_video_audio else self._read_video_temp
+            error_prefix = "  ✗ ERROR extracting audio"
+
+        def attempt():
+            decoded.output_dir = self.output_dir(file_path, output_dir_for(file_path) if output_dir_for else None)
+            work(file_path, decoded)
+        self._attempt(result, error_prefix, attempt)
+        return decoded
+
+    def _read_audio_file(self, file_path: Path, decoded: DecodedFile):
+        decoded.key = self.cache_key(file_path)
+        if self.skip_unchanged(decoded.key, decoded.output_dir, decoded.result):
+            return
+
+        # Read audio file
+        decoded.audio, decoded.rate = sf.read(str(file_path), dtype=self.settings.precision)
+
+    def _read_video_temp(self, file_path: Path, decoded: DecodedFile):
+        """Extract a video's audio to a temporary WAV and read that back"""
+        # Extract audio to temporary file
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
+            tmp_path = tmp_file.name
+
+        try:
+            # Use ffmpeg to extract audio
+            cmd = [
+                ffmpeg_path(), '-i', str(file_path),
+                '-vn',  # No video
+                '-acodec', 'pcm_s24le',  # 24-bit PCM
+                '-ar', str(self.settings.sample_rate),  # Sample rate
+                '-y',  # Overwrite
+                tmp_path
+            ]
+
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+
+            if proc.returncode != 0:
+                raise Exception(f"FFmpeg error: {proc.stderr}")
+
+            decoded.audio, decoded.rate = sf.read(tmp_path, dtype=self.settings.precision)
+            decoded.name_path = file_path.with_suffix('.wav')
+        finally:
+            # Clean up
+            os.unlink(tmp_path)
+
+    def _read_video_stream(self, file_path: Path, decoded: DecodedFile):
+        """Decode a video's audio through an ffmpeg pipe, metering each chunk
+        as it arrives, without touching disk in between"""
+        key = decoded.key = self.cache_key(file_path)
+        if self.skip_unchanged(key, decoded.output_dir, decoded.result):
+            return
+
+        rate = self.settings.sample_rate
+        decoded.analysis = f"video:{rate}"
+        cached = self._cached_analysis(key, decoded.analysis)
+        channels = probe_audio_channels(file_path)
+        analyzer = LoudnessAnalyzer(rate, channels)
+        chunks = []
+        for chunk in iter_ffmpeg_audio(file_path, rate, channels):
+            if cached is None:
+                analyzer.feed(chunk)
+            chunks.append(chunk)
+        self._finish_video_audio(decoded, cached, analyzer, chunks)
+        decoded.name_path = file_path.with_suffix('.wav')
+
+    def _read_video_tracks(self, file_path: Path, decoded: DecodedFile):
+        """Decode every audio stream of a video in one ffmpeg run, metering
+        each as it arrives, for remuxing or for one WAV per stream.
+
+        The first stream's figures go in the file's own result; every other
+        stream gets a result of its own.
+        """
+        key = decoded.key = self.cache_key(file_path)
+        if self.skip_unchanged(key, decoded.output_dir, decoded.result):
+            return
+
+        rate = self.settings.sample_rate
+        streams, decoded.start_time = probe_audio_streams(file_path)
+        tracks = []
+        for stream in streams:
+            self.log(f"  Audio stream {stream.index + 1}/{len(streams)}: {stream.describe()}")
+            if self.settings.remux_video:
+                name_path = file_path
+            elif len(streams) == 1:
+                name_path = file_path.with_suffix('.wav')
+            else:
+                name_path = file_path.with_name(f"{file_path.stem}_a{stream.index + 1}.wav")
+            result = decoded.result if stream.index == 0 else FileResult(str(file_path), 'video')
+            result.stream = stream.index
+            analysis = f"video:{rate}" if stream.index == 0 else f"video:{rate}:a{stream.index}"
+            tracks.append(DecodedFile(result, name_path, decoded.output_dir, key, analysis))
+        cached = [self._cached_analysis(key, track.analysis) for track in tracks]
+        analyzers = [LoudnessAnalyzer(rate, stream.channels) for stream in streams]
+        chunks = [[] for _ in streams]
+
+        def consume(position: int, chunk: np.ndarray):
+            if cached[position] is None:
+                analyzers[position].feed(chunk)
+            chunks[position].append(chunk)
+
+        decode_ffmpeg_streams(file_path, rate, streams, consume)
+        for position, track in enumerate(tracks):
+            self._finish_video_audio(track, cached[position], analyzers[position], chunks[position])
+        chunks.clear()
+        decoded.tracks, decoded.streams, decoded.rate = tracks, streams, rate
+        self.results.extend(track.result for track in tracks[1:])
+
+    def _cached_analysis(self, key: Optional[FileKey], analysis: str):
+        if key is None or self.settings.export_curves:
+            return None
+        return self.cache.get(key, analysis)
+
+    def _finish_video_audio(self, decoded: DecodedFile, cached, analyzer: LoudnessAnalyzer, chunks: list):
+        """Fill decoded from streamed chunks and their cached or fresh measurement"""
+        if not chunks:
+            raise Exception("FFmpeg produced no audio")
+        rate = self.settings.sample_rate
+        if cached is not None:
+            self.log("  Using cached analysis")
+            decoded.result.cached_analysis = True
+            decoded.result.lra = _finite_or_none(cached.lra)
+            levels = cached.levels
+        else:
+            levels = analyzer.measurement()
+            lra = analyzer.loudness_range()
+            if decoded.key is not None:
+                self.cache.put(decoded.key, decoded.analysis, levels, lra, rate)
+            decoded.result.lra = _finite_or_none(lra)
+            decoded.analyzer = analyzer
+
+        audio = np.concatenate(chunks).astype(self.settings.precision, copy=False)
+        chunks.clear()
+        if audio.shape[1] == 1:
+            audio = audio[:, 0]
+        decoded.audio, decoded.rate, decoded.levels = audio, rate, levels
+
+    # ---------- render ----------
+
+    def render(self, decoded: DecodedFile) -> RenderedFile:
+        """Limit, normalise and resample decoded audio.
+
+        The source measurement and any post-limiter measurement are cached
+        under the file's analysis key. Loudness curves come from the last
+        stage that was metered, shifted by the gain applied after it.
+        """
+        if decoded.tracks:
+            return self.render_tracks(decoded)
+        s = self.settings
+        result, key, analysis, rate = decoded.result, decoded.key, decoded.analysis, decoded.rate
+        audio = decoded.audio
+
+        # Measure original loudness
+        levels, analyzer = decoded.levels, decoded.analyzer
+        if levels is None:
+            levels, analyzer = self.measure_levels(key, analysis, lambda: audio, rate, result)
+        metered = levels
+        result.original_loudness = _finite_or_none(levels.loudness)
+        result.original_peak = _finite_or_none(levels.peak)
+        self.log(f"  Original: {levels.loudness:.1f} LKFS, Peak: {levels.peak:.1f} dBFS")
+        if not np.isfinite(levels.loudness):
+            # No gain can bring silence to the target (it would be infinite)
+            raise Exception(SILENT_ERROR)
+
+        # Step 1: Apply limiter first (if enabled)
+        # The decoded buffer belongs to this file alone, so every gain stage
+        # works on it in place (and in its dtype) rather than on copies
+        processed_audio = audio
+        if s.use_limiter:
+            self.log(f"  Applying limiter (threshold: {s.limiter_threshold:.1f} dBFS)")
+            threshold = 10 ** (s.limiter_threshold / 20)
+            peak_limit = 10 ** (s.limiter_true_peak / 20)
+            # The soft knee is the only non-linear stage; if nothing
+            # crosses the threshold the limiter is just gain
+            knee_engaged = np.max(np.abs(processed_audio)) > threshold
+
+            # Simple soft-knee limiter (10:1 above threshold)
+            soft_knee_limit(processed_audio, threshold)
+
+            # Apply makeup gain
+            makeup_gain_linear = 10 ** (s.limiter_makeup_gain / 20)
+            processed_audio *= makeup_gain_linear
+            linear_gain = makeup_gain_linear
+
+            # Apply limiter true peak limiting (after makeup gain)
+            max_peak = np.max(np.abs(processed_audio))
+            if max_peak > peak_limit:
+                processed_audio *= peak_limit / max_peak
+                linear_gain *= peak_limit / max_peak
+
+            # Measure post-limiter levels
+            if knee_engaged:
+                levels, analyzer = self.measure_levels(key, f"{analysis}|{s.limiter_settings()}",
+                                                       lambda: processed_audio, rate, result)
+                metered = levels
+            else:
+                levels = levels.with_gain(gain_to_db(linear_gain))
+            self.log(f"  Post-limiter: {levels.loudness:.1f} LKFS, Peak: {levels.peak:.1f} dBFS")
+
+        # Step 2: Apply loudness normalization (linear gain, so the
+        # result is derived from the last measurement rather than re-metered)
+        gain_db = s.target_loudness - levels.loudness
+        normalized_audio = processed_audio
+        normalized_audio *= db_to_gain(gain_db)
+        levels = levels.with_gain(gain_db)
+
+        # Apply normalization true peak limiting
+        peak_limit = 10 ** (s.true_peak / 20)
+        max_peak = np.max(np.abs(normalized_audio))
+        if max_peak > peak_limit:
+            normalized_audio *= peak_limit / max_peak
+            levels = levels.with_gain(gain_to_db(peak_limit / max_peak))
+
+        self.log(f"  Normalized: {levels.loudness:.1f} LKFS, Peak: {levels.peak:.1f} dBFS")
+        result.loudness = _finite_or_none(levels.loudness)
+        result.peak = _finite_or_none(levels.peak)
+
+        # Curves are ungated, so after linear gain they shift exactly
+        curves = None
+        if analyzer is not None:
+            offset = levels.peak - metered.peak
+            momentary = analyzer.momentary_loudness() + offset
+            short_term = analyzer.short_term_loudness() + offset
+            result.max_momentary = _finite_or_none(momentary.max()) if momentary.size else None
+            result.max_short_term = _finite_or_none(short_term.max()) if short_term.size else None
+            curves = (momentary, short_term)
+        if result.lra is not None:
+            self.log(f"  Loudness range: {result.lra:.1f} LU")
+
+        # Resample if necessary
+        target_rate = s.sample_rate
+        if rate != target_rate:
+            normalized_audio = resample(normalized_audio, rate, target_rate, s.resample_quality)
+            self.log(f"  Resampled: {rate} Hz → {target_rate} Hz ({s.resample_quality})")
+
+        output_path = decoded.output_dir / s.output_filename(decoded.name_path)
+        return RenderedFile(result, key, decoded.output_dir, output_path, normalized_audio, target_rate,
+                            curves if s.export_curves else None)
+
+    def render_tracks(self, decoded: DecodedFile) -> RenderedFile:
+        """Render the audio streams of a video in parallel, each stream's log
+        lines kept together and in stream order"""
+        def render_track(track: DecodedFile):
+            self._deferred.notes = notes = []
+            try:
+                return self.render(track), notes
+            except Exception as e:
+                track.result.status, track.result.error = 'error', str(e)
+                raise
+            finally:
+                self._deferred.notes = None
+                track.audio = None
+
+        many = len(decoded.tracks) > 1
+        try:
+            with ThreadPoolExecutor(max_workers=min(len(decoded.tracks), os.cpu_count() or 1)) as pool:
+                outcomes = list(pool.map(render_track, decoded.tracks))
+        except Exception as e:
+            # The streams are delivered together, so one failure fails them all
+            for track in decoded.tracks:
+                if track.result.status != 'error':
+                    track.result.status, track.result.error = 'error', str(e)
+            raise
+        for stream, (_, notes) in zip(decoded.streams, outcomes):
+            if many:
+                self.log(f"  Audio stream {stream.index + 1}/{len(decoded.streams)}")
+            for message, color in notes:
+                self.log(message, color)
+
+        tracks = [rendered for rendered, _ in outcomes]
+        if not self.settings.remux_video:
+            return RenderedFile(decoded.result, decoded.key, decoded.output_dir, tracks[0].output_path, None,
+                                decoded.rate, tracks=tracks)
+        output_path = decoded.output_dir / self.settings.output_filename(decoded.name_path)
+        return RenderedFile(decoded.result, decoded.key, decoded.output_dir, output_path, None, decoded.rate,
+                            source=decoded.name_path, tracks=tracks, streams=decoded.streams,
+                            start_time=decoded.start_time)
+
+    # ---------- write ----------
+
+    def write(self, rendered: RenderedFile):
+        """Writer stage: save the normalised file and record it in the cache"""
+        s = self.settings
+        if rendered.tracks:
+            return self.write_tracks(rendered)
+        sf.write(str(rendered.output_path), rendered.audio, rendered.rate, subtype=s.subtype())
+        if rendered.curves is not None:
+            curves_path = write_loudness_curves(rendered.output_path, *rendered.curves, s.export_curves)
+            rendered.result.curves = str(curves_path)
+        if rendered.key is not None:
+            self.cache.record_output(rendered.key, s.output_settings(rendered.output_dir), rendered.output_path)
+        rendered.result.status = 'ok'
+        rendered.result.output = str(rendered.output_path)
+        self.log(f"  ✓ Saved: {rendered.output_path.name}\n", 'success')
+
+    def write_tracks(self, rendered: RenderedFile):
+        """Write the audio streams of a video: remuxed into a copy of it, or
+        as one file each. Each stream's result records where it went."""
+        s = self.settings
+        tracks = rendered.tracks
+        try:
+            if rendered.source is not None:
+                self.log(f"  Remuxing {len(tracks)} audio stream(s), video copied")
+                remux_audio(rendered.source, rendered.output_path, [t.audio for t in tracks], rendered.rate,
+                            rendered.streams, rendered.start_time, s.bit_depth)
+                outputs = [rendered.output_path] * len(tracks)
+                if len(tracks) > 1:
+                    # Curves of the remuxed streams are told apart by stream number
+                    curve_paths = [rendered.output_path.with_name(
+                        f"{rendered.output_path.stem}_a{i + 1}{rendered.output_path.suffix}")
+                        for i in range(len(tracks))]
+                else:
+                    curve_paths = outputs
+            else:
+                for track in tracks:
+                    sf.write(str(track.output_path), track.audio, track.rate, subtype=s.subtype())
+                outputs = curve_paths = [track.output_path for track in tracks]
+            for track, curve_path in zip(tracks, curve_paths):
+                if track.curves is not None:
+                    track.result.curves = str(write_loudness_curves(curve_path, *track.curves, s.export_curves))
+        except Exception as e:
+            for track in tracks:
+                track.result.status, track.result.error = 'error', str(e)
+            raise
+        if rendered.key is not None:
+            self.cache.record_output(rendered.key, s.output_settings(rendered.output_dir), outputs[0])
+        for track, output in zip(tracks, outputs):
+            track.result.status = 'ok'
+            track.result.output = str(output)
+        for output in dict.fromkeys(outputs):
+            self.log(f"  ✓ Saved: {output.name}", 'success')
+        self.log('')
+
+    # ---------- linked stems ----------
+
+    def process_group(self, name: str, stems: Sequence[Path],
+                      output_dir_for: Optional[Callable[[Path], Optional[Path]]] = None):
+        """Normalise stems of one mix with a single shared gain.
+
+        The stems are read together block by block and summed only in memory
+        to meter the mix. The gain that brings the mix to the target (pulled
+        down if any stem, or the mix itself, would exceed the peak ceiling)
+        is then applied to every stem in parallel, streaming each from source
+        to output. Loudness curves, if exported, are those of the mix. The
+        limiter is not used (nor named in the outputs): limiting stems
+        independently would change the balance between them.
+
+        With the cache on, the mix measurement is cached under a key covering
+        every stem, and the group is skipped when no stem has changed and
+        all its outputs for the current settings still exist.
+        """
+        s = self.settings
+        results = [self._start(stem, 'audio') for stem in stems]
+        for result in results:
+            result.group = Path(name).name
+        self.log(f"\nProcessing stem group: {Path(name).name} ({len(stems)} stems)")
+        for stem in stems:
+            self.log(f"  {stem.name}")
+        if s.use_limiter:
+            self.log("  Limiter skipped for linked stems")
+
+        def output_dir(stem):
+            return self.output_dir(stem, output_dir_for(stem) if output_dir_for else None)
+
+        def measure():
+            keys = [self.cache.key_for(stem) for stem in stems] if self.cache is not None else None
+            if keys and self.skip_unchanged_group(keys, [output_dir(stem) for stem in stems], results):
+                return None
+            return keys, self.measure_group_levels(stems, keys, results)
+
+        measured = self._attempt(results[0], "  ✗ ERROR", measure)
+        if results[0].status == 'error':
+            for result in results[1:]:
+                result.status, result.error = 'error', results[0].error
+            return
+        if measured is None:
+            return
+        keys, (levels, lra, stem_peaks, analyzer) = measured
+        self.log(f"  Summed: {levels.loudness:.1f} LKFS, Peak: {levels.peak:.1f} dBFS")
+        if not np.isfinite(levels.loudness):
+            self.log(f"  ✗ ERROR: {SILENT_ERROR}\n", 'error')
+            for result in results:
+                result.status, result.error = 'error', SILENT_ERROR
+            return
+
+        gain_db = s.target_loudness - levels.loudness
+        loudest_peak = max(levels.peak, gain_to_db(max(stem_peaks.max(), 1e-10)))
+        if loudest_peak + gain_db > s.true_peak:
+            gain_db = s.true_peak - loudest_peak
+        gain = db_to_gain(gain_db)
+        self.log(f"  Linked gain: {gain_db:+.2f} dB → {levels.loudness + gain_db:.1f} LKFS")
+
+        lra = _finite_or_none(lra)
+        if analyzer is not None:
+            momentary = analyzer.momentary_loudness() + gain_db
+            short_term = analyzer.short_term_loudness() + gain_db
+        else:
+            momentary = short_term = np.zeros(0)
+        curves_path = ''
+        if s.export_curves:
+            curves_path = str(write_loudness_curves(output_dir(stems[0]) / f"{Path(name).name}_mix.wav",
+                                                    momentary, short_term, s.export_curves))
+        for result, stem_peak in zip(results, stem_peaks):
+            result.original_loudness = _finite_or_none(levels.loudness)
+            result.loudness = _finite_or_none(levels.loudness + gain_db)
+            result.original_peak = _finite_or_none(gain_to_db(stem_peak + 1e-10))
+            result.peak = _finite_or_none(gain_to_db(stem_peak + 1e-10) + gain_db)
+            result.lra = lra
+            result.max_momentary = _finite_or_none(momentary.max()) if momentary.size else None
+            result.max_short_term = _finite_or_none(short_term.max()) if short_term.size else None
+            result.curves = curves_path
+
+        def apply(stem, result, key):
+            def work():
+                folder = output_dir(stem)
+                output_path = self.apply_gain(stem, gain, folder)
+                if key is not None:
+                    self.cache.record_output(key, self.group_output_settings(keys, folder), output_path)
+                return output_path
+            output_path = self._attempt(result, f"  ✗ ERROR writing {stem.name}", work)
+            if output_path is not None:
+                result.status = 'ok'
+                result.output = str(output_path)
+                self.log(f"  ✓ Saved: {output_path.name}", 'success')
+
+        with ThreadPoolExecutor(max_workers=min(len(stems), os.cpu_count() or 1)) as pool:
+            list(pool.map(apply, stems, results, keys or [None] * len(stems)))
+
+    def group_output_settings(self, keys: Sequence[FileKey], output_dir: Path) -> str:
+        """Output cache key for a linked stem: the settings and the whole group"""
+        return f"{self.settings.output_settings(output_dir)}|{group_analysis(keys)}"
+
+    def skip_unchanged_group(self, keys: Sequence[FileKey], output_dirs: Sequence[Path],
+                             results: Sequence[FileResult]) -> bool:
+        """True (and logged) if every stem was already written, as this group, with the current settings"""
+        previous = [self.cache.output_for(key, self.group_output_settings(keys, output_dir))
+                    for key, output_dir in zip(keys, output_dirs)]
+        if not all(previous):
+            return False
+        self.log("  Unchanged since last run, skipping\n", 'success')
+        for result, output_path in zip(results, previous):
+            result.status = 'skipped'
+            result.output = str(output_path)
+        return True
+
+    def measure_group_levels(self, stems: Sequence[Path], keys: Optional[Sequence[FileKey]],
+                             results: Sequence[FileResult]
+                             ) -> Tuple[LoudnessMeasurement, float, np.ndarray, Optional[LoudnessAnalyzer]]:
+        """Levels and loudness range of the mix and each stem's sample peak,
+        from the cache or from measure_group() (then stored).
+
+        The mix is cached on the first stem and each stem's peak on that
+        stem, all under the group's analysis key. The analyzer is returned
+        when the mix was metered (always, when curves are being exported).
+        """
+        analysis = group_analysis(keys) if keys else None
+        if analysis is not None and not self.settings.export_curves:
+            mix = self.cache.get(keys[0], f"{analysis}|mix")
+            cached = [self.cache.get(key, analysis) for key in keys]
+            if mix is not None and all(cached):
+                self.log("  Using cached analysis")
+                for result in results:
+                    result.cached_analysis = True
+                stem_peaks = np.array([db_to_gain(c.levels.peak) for c in cached])
+                return mix.levels, mix.lra, stem_peaks, None
+        analyzer, stem_peaks = self.measure_group(stems)
+        levels, lra = analyzer.measurement(), analyzer.loudness_range()
+        if analysis is not None:
+            self.cache.put(keys[0], f"{analysis}|mix", levels, lra, analyzer.rate)
+            for key, stem_peak in zip(keys, stem_peaks):
+                self.cache.put(key, analysis, LoudnessMeasurement(levels.loudness, gain_to_db(max(stem_peak, 1e-10))),
+                               lra, analyzer.rate)
+        return levels, lra, stem_peaks, analyzer
+
+    def measure_group(self, stems: Sequence[Path]) -> Tuple[LoudnessAnalyzer, np.ndarray]:
+        """Meter the sum of the stems and find each stem's sample peak, in one
+        pass over all of them"""
+        dtype = self.settings.precision
+        handles = [sf.SoundFile(str(stem)) for stem in stems]
+        try:
+            rate, channels = handles[0].samplerate, handles[0].channels
+            for stem, handle in zip(stems, handles):
+                if (handle.samplerate, handle.channels) != (rate, channels):
+                    raise Exception(f"{stem.name} is {handle.samplerate} Hz / {handle.channels} ch, "
+                                    f"expected {rate} Hz / {channels} ch like {stems[0].name}")
+            analyzer = LoudnessAnalyzer(rate, channels, dtype=dtype)
+            stem_peaks = np.zeros(len(stems))
+            while True:
+                blocks = [h.read(GROUP_BLOCK_FRAMES, dtype=dtype, always_2d=True) for h in handles]
+                frames = max(len(block) for block in blocks)
+                if not frames:
+                    break
+                # Shorter stems are treated as silent once they end
+                mix = np.zeros((frames, channels), dtype=dtype)
+                for i, block in enumerate(blocks):
+                    if len(block):
+                        mix[:len(block)] += block
+                        stem_peaks[i] = max(stem_peaks[i], float(np.max(np.abs(block))))
+                analyzer.feed(mix)
+        finally:
+            for handle in handles:
+                handle.close()
+        return analyzer, stem_peaks
+
+    def apply_gain(self, file_path: Path, gain: float, output_dir: Path) -> Path:
+        """Stream a source through a fixed gain (and the resampler) to its output"""
+        s = self.settings
+        output_path = output_dir / s.output_filename(file_path, limited=False)
+        with sf.SoundFile(str(file_path)) as source:
+            resampler = None
+            if source.samplerate != s.sample_rate:
+                resampler = Resampler(source.samplerate, s.sample_rate, source.channels,
+                                      s.resample_quality, s.precision)
+            with sf.SoundFile(str(output_path), 'w', s.sample_rate, source.channels, s.subtype()) as output:
+                for block in source.blocks(GROUP_BLOCK_FRAMES, dtype=s.precision, always_2d=True):
+                    block *= gain
+                    output.write(resampler.process(block) if resampler else block)
+                if resampler:
+                    output.write(resampler.flush())
+        return output_path
+
+
+# ---------- reports ----------
+
+def write_loudness_curves(output_path: Path, momentary: np.ndarray, short_term: np.ndarray,
+                          fmt: str = 'csv') -> Path:
+    """Write <output>.loudness.csv or .npz beside an output file.
+
+    Values are LKFS every 100 ms. The CSV has one row per hop, timed at the
+    end of the window, with short-term blank for the first 3 s; the npz holds
+    the two float32 arrays plus their hop and window lengths.
+    """
+    path = Path(output_path).with_suffix(f'.loudness.{fmt}')
+    if fmt == 'npz':
+        np.savez_compressed(path, momentary=momentary.astype(np.float32),
+                            short_term=short_term.astype(np.float32), hop_seconds=SUBBLOCK_SECONDS,
+                            momentary_seconds=BLOCK_SECONDS, short_term_seconds=SHORT_TERM_SECONDS)
+        return path
+
+    lead = int(round((SHORT_TERM_SECONDS - BLOCK_SECONDS) / SUBBLOCK_SECONDS))
+    first = int(round(BLOCK_SECONDS / SUBBLOCK_SECONDS))
+
+    def cell(value):
+        return f"{value:.2f}" if np.isfinite(value) else ''
+
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['time_s', 'momentary_lkfs', 'short_term_lkfs'])
+        for i, value in enumerate(momentary):
+            j = i - lead
+            writer.writerow([f"{(i + first) * SUBBLOCK_SECONDS:.1f}", cell(value),
+                             cell(short_term[j]) if 0 <= j < len(short_term) else ''])
+    return path
+
+
+def summary_table(results: Sequence[FileResult]) -> str:
+    """Fixed-width table of the loudness figures for a batch"""
+    def number(value):
+        return f"{value:.1f}" if value is not None else '-'
+
+    header = f"{'File':<40}{'Status':>8}{'LKFS':>8}{'LRA':>7}{'Max M':>8}{'Max S':>8}{'Peak':>8}"
+    lines = [header, '-' * len(header)]
+    for r in results:
+        name = Path(r.source).name
+        label = f" [a{r.stream + 1}]" if r.stream is not None else ''
+        name = name + label if len(name + label) <= 38 else name[:35 - len(label)] + '...' + label
+        lines.append(f"{name:<40}{r.status:>8}{number(r.loudness):>8}{number(r.lra):>7}"
+                     f"{number(r.max_momentary):>8}{number(r.max_short_term):>8}{number(r.peak):>8}")
+    return '\n'.join(lines)
+
+
+def write_report(results: Sequence, path: Path, statuses: Sequence[str] = ('ok', 'skipped', 'error'),
+                 result_type: type = FileResult, peak_memory_mb: Optional[float] = None):
+    """Write results (dataclasses of result_type) as CSV if path ends in .csv,
+    otherwise JSON with a count per status (and the batch's peak memory, if
+    it was measured for the batch rather than per file)"""
+    path = Path(path)
+    rows = [asdict(r) for r in results]
+    if path.suffix.lower() == '.csv':
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(result_type.__dataclass_fields__))
+            writer.writeheader()
+            writer.writerows(rows)
+        return
+    summary = {status: sum(r.status == status for r in results) for status in statuses}
+    report = {'generated': datetime.now().isoformat(timespec='seconds'), 'summary': summary}
+    if peak_memory_mb is not None:
+        report['peak_memory_mb'] = peak_memory_mb
+    with open(path, 'w') as f:
+        json.dump({**report, 'files': rows}, f, indent=2)
+
+
+# ---------- command line ----------
+
+def positive_int(text: str) -> int:
+    """argparse type for counts that must be at least 1"""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a whole number, not '{text}'")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Batch loudness normalisation without the GUI.",
+        epilog="Patterns are shell globs matched against paths relative to each source folder.")
+    parser.add_argument('sources', nargs='+', type=Path, help="source folders (or individual files)")
+    parser.add_argument('-o', '--output', type=Path, help="output folder (default: beside each source)")
+    parser.add_argument('--target', type=float, default=-18.0, help="target loudness in LKFS (default -18)")
+    parser.add_argument('--true-peak', type=float, default=-1.5, help="peak ceiling in dBFS (default -1.5)")
+    parser.add_argument('--sample-rate', type=int, default=48000)
+    parser.add_argument('--bit-depth', type=int, choices=(16, 24, 32), default=24)
+    parser.add_argument('--resample-quality', choices=list(QUALITY_PRESETS), default=DEFAULT_QUALITY,
+                        help="resampler preset (see resampler.py for the trade-offs)")
+    parser.add_argument('--limiter', action='store_true', help="enable the step 1 limiter")
+    parser.add_argument('--limiter-threshold', type=float, default=-1.0)
+    parser.add_argument('--limiter-true-peak', type=float, default=-0.3)
+    parser.add_argument('--makeup-gain', type=float, default=0.0)
+    parser.add_argument('--include', action='append', default=[], metavar='GLOB')
+    parser.add_argument('--exclude', action='append', default=[], metavar='GLOB')
+    parser.add_argument('--no-recursive', action='store_true', help="only scan the top level of each folder")
+    parser.add_argument('--no-cache', action='store_true', help="ignore and do not update the measurement cache")
+    parser.add_argument('--cache-path', type=Path, help="measurement cache database")
+    parser.add_argument('--temp-wav', action='store_true',
+                        help="extract video audio to a temporary WAV instead of streaming it")
+    parser.add_argument('--remux', action='store_true',
+                        help="write each video with all its audio streams normalised (video stream-copied) "
+                             "instead of a WAV of its audio")
+    parser.add_argument('--all-streams', action='store_true',
+                        help="write one WAV per audio stream of each video instead of just the first")
+    parser.add_argument('--retries', type=int, default=0,
+                        help="retry files that hit transient I/O errors this many times")
+    parser.add_argument('--retry-backoff', type=float, default=2.0,
+                        help="seconds before the first retry, doubling each time (default 2)")
+    parser.add_argument('--precision', choices=PRECISIONS, default='float64',
+                        help="sample format to process in; float32 halves memory use")
+    parser.add_argument('--curves', choices=CURVE_FORMATS,
+                        help="write momentary/short-term loudness curves beside each output")
+    parser.add_argument('--link-stems', metavar='MODE',
+                        help="normalise stems of a mix with one shared gain: 'suffix' groups "
+                             "<mix>_DX/_MX/_FX files, 'folder' groups each folder, anything else "
+                             "is a regex whose first group names the mix (not with --watch)")
+    parser.add_argument('--pipeline-depth', type=int, default=1,
+                        help="files queued between the read, process and write stages "
+                             "(0 = one file at a time, default 1)")
+    parser.add_argument('--report-memory', action='store_true',
+                        help="trace allocations for exact peak memory, per file at --pipeline-depth 0 "
+                             "and per batch otherwise (slows processing considerably)")
+    parser.add_argument('--report', type=Path, help="write a .json or .csv report")
+    triage = parser.add_argument_group("triage")
+    triage.add_argument('--estimate', action='store_true',
+                        help="only estimate loudness from sampled blocks and flag files against "
+                             "--target +/- --tolerance; nothing is written except the report")
+    triage.add_argument('--tolerance', type=float, default=1.0, help="allowed deviation in LU (default 1)")
+    triage.add_argument('--estimate-blocks', type=positive_int, default=200,
+                        help="400 ms blocks sampled per file (default 200)")
+    triage.add_argument('--confidence', type=float, default=0.95, help="confidence level (default 0.95)")
+    watch = parser.add_argument_group("watch folders")
+    watch.add_argument('--watch', action='store_true',
+                       help="keep running and normalise files as they arrive in the source folders")
+    watch.add_argument('--jobs', type=int, default=2,
+                       help="files processed (or estimated) at once (default 2); with more than one, "
+                            "--report-memory logs one peak for the whole run instead of per file")
+    watch.add_argument('--settle', type=float, default=5.0,
+                       help="seconds a file must stay unchanged before it is processed (default 5)")
+    watch.add_argument('--poll-interval', type=float,
+                       help="rescan every N seconds instead of using inotify")
+    watch.add_argument('--existing', action='store_true',
+                       help="also process files already in the folders when watching starts")
+    parser.add_argument('-q', '--quiet', action='store_true', help="only print errors and the summary")
+    return parser
+
+
+def settings_from_args(args: argparse.Namespace) -> NormaliserSettings:
+    return NormaliserSettings(
+        target_loudness=args.target, true_peak=args.true_peak,
+        sample_rate=args.sample_rate, bit_depth=args.bit_depth, resample_quality=args.resample_quality,
+        use_limiter=args.limiter, limiter_threshold=args.limiter_threshold,
+        limiter_true_peak=args.limiter_true_peak, limiter_makeup_gain=args.makeup_gain,
+        stream_video_audio=not args.temp_wav, use_cache=not args.no_cache,
+        io_retries=args.retries, retry_backoff=args.retry_backoff, pipeline_depth=args.pipeline_depth,
+        precision=args.precision, export_curves=args.curves or '',
+        link_stems=args.link_stems or '', remux_video=args.remux,
+        all_audio_streams=args.all_streams, report_memory=args.report_memory,
+    )
+
+
+def cli_main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.watch and args.link_stems:
+        # Watch jobs take one file at a time, so a group's stems would each get their own gain
+        parser.error("--link-stems cannot be used with --watch: stems arrive and are normalised one "
+                     "file at a time; link them in a batch run once the whole group is in")
+    settings = settings_from_args(args)
+    print_lock = threading.Lock()
+
+    def log(message, color=None):
+        if not args.quiet or color == 'error':
+            with print_lock:
+                print(message.rstrip('\n'), file=sys.stderr if color == 'error' else sys.stdout, flush=True)
+
+    if args.estimate:
+        return estimate_main(args, log)
+    cache = None
+    if settings.use_cache:
+        cache = LoudnessCache(args.cache_path) if args.cache_path else LoudnessCache()
+    if args.watch:
+        return watch_main(args, settings, cache, log)
+    normaliser = BatchNormaliser(settings, log=log, cache=cache)
+
+    try:
+        for source in args.sources:
+            if source.is_file():
+                root, (audio_files, video_files) = source.parent, (
+                    ([source], []) if source.suffix.lower() in AUDIO_EXTENSIONS else ([], [source]))
+            else:
+                root = source
+                audio_files, video_files = discover_media(source, not args.no_recursive,
+                                                          args.include, args.exclude)
+            log(f"{source}: found {len(audio_files)} audio files and {len(video_files)} video files", 'accent')
+
+            def mirrored_output_dir(file_path, root=root):
+                folder = args.output / file_path.parent.relative_to(root)
+                folder.mkdir(parents=True, exist_ok=True)
+                return folder
+            normaliser.process_files(audio_files, video_files, mirrored_output_dir if args.output else None)
+    except Exception as e:
+        print(f"Error during processing: {str(e)}\n{traceback.format_exc()}", file=sys.stderr)
+        return 2
+    finally:
+        if cache is not None:
+            cache.close()
+
+    results = normaliser.results
+    if args.report:
+        write_report(results, args.report, peak_memory_mb=normaliser.peak_memory_mb)
+    failures = normaliser.failures()
+    skipped = sum(r.status == 'skipped' for r in results)
+    if results and not args.quiet:
+        print('\n' + summary_table(results) + '\n')
+    if failures:
+        print("\nFailed files:", file=sys.stderr)
+        for r in failures:
+            print(f"  {r.source}: {r.error}", file=sys.stderr)
+    print(f"Processed {len(results) - len(failures) - skipped}, skipped {skipped}, failed {len(failures)}")
+    return 1 if failures else 0
+
+
+def watch_main(args: argparse.Namespace, settings: NormaliserSettings, cache: Optional[LoudnessCache],
+               log: Callable[..., None]) -> int:
+    from watch_folder import WatchFolder
+
+    watcher = WatchFolder(args.sources, settings, output=args.output, cache=cache, jobs=args.jobs,
+                          settle=args.settle, poll_interval=args.poll_interval,
+                          recursive=not args.no_recursive, include=args.include, exclude=args.exclude,
+                          log=log)
+    try:
+        watcher.run(process_existing=args.existing)
+    except KeyboardInterrupt:
+        log("Stopping; waiting for files in progress")
+    finally:
+        if cache is not None:
+            cache.close()
+    return 0
+
+
+def estimate_main(args: argparse.Namespace, log: Callable[..., None]) -> int:
+    from loudness_estimate import ESTIMATE_STATUSES, EstimateResult, estimate_file, estimate_table
+
+    sources = []
+    for source in args.sources:
+        if source.is_file():
+            sources.append(source)
+        else:
+            audio_files, video_files = discover_media(source, not args.no_recursive, args.include, args.exclude)
+            sources.extend(audio_files)
+            if video_files:
+                log(f"{source}: skipping {len(video_files)} video files (estimates need seekable audio)")
+    log(f"Estimating {len(sources)} files", 'accent')
+
+    def estimate(path):
+        result = estimate_file(path, args.target, args.tolerance, args.estimate_blocks, args.confidence)
+        if result.status == 'error':
+            log(f"✗ {path.name}: {result.error}", 'error')
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        results = list(pool.map(estimate, sources))
+
+    if args.report:
+        write_report(results, args.report, ESTIMATE_STATUSES, EstimateResult)
+    if results and not args.quiet:
+        print('\n' + estimate_table(results) + '\n')
+    counts = {status: sum(r.status == status for r in results) for status in ESTIMATE_STATUSES}
+    print(', '.join(f"{status}: {count}" for status, count in counts.items()))
+    return 1 if counts['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli_main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Block-wise polyphase resampling for the SammyJ Batch Loudness Normaliser.
+
+The rate change is reduced to a rational up/down pair and a Kaiser-windowed
+low-pass prototype is split into `up` polyphase branches. Filter banks are
+built once per (source rate, target rate, quality, dtype) and cached, so a
+batch at one rate pays for the design a single time. Resampler keeps its own
+input history, so audio can be pushed through in blocks of any size and the
+output is identical to resampling the whole signal at once.
+
+Quality presets (zero crossings per side / passband edge / Kaiser beta):
+
+    'fast'      8 / 0.85 / 6.0   ~60 dB stopband, passband to ~0.85 x Nyquist.
+                                 Roughly 4x cheaper than 'high'. Previews,
+                                 speech, material that is re-encoded lossy.
+    'balanced' 16 / 0.90 / 8.6   ~90 dB stopband, passband to ~0.90 x Nyquist.
+                                 Default; transparent for 24-bit delivery of
+                                 typical programme material.
+    'high'     32 / 0.95 / 12.0  ~120 dB stopband, passband to ~0.95 x Nyquist.
+                                 Twice the cost of 'balanced'. Masters and
+                                 archive transfers.
+
+Cost per output sample is proportional to the zero-crossing count (and to
+max(up, down) / up), and memory per block to block size x taps x channels.
+"""
+
+from functools import lru_cache
+from math import gcd
+from typing import NamedTuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+QUALITY_PRESETS = {
+    'fast': (8, 0.85, 6.0),
+    'balanced': (16, 0.90, 8.6),
+    'high': (32, 0.95, 12.0),
+}
+DEFAULT_QUALITY = 'balanced'
+
+# Output samples computed per internal step; bounds the size of the
+# (samples, channels, taps) window view that is reduced at once
+DEFAULT_BLOCK_SIZE = 1 << 15
+
+
+class PolyphaseBank(NamedTuple):
+    """Polyphase decomposition of a resampling filter"""
+    up: int
+    down: int
+    branches: np.ndarray   # (up, taps): branch p, coefficients time-reversed
+    delay: int             # prototype group delay, in upsampled samples
+
+    @property
+    def taps(self) -> int:
+        return self.branches.shape[1]
+
+
+@lru_cache(maxsize=None)
+def polyphase_bank(src_rate: int, dst_rate: int, quality: str = DEFAULT_QUALITY,
+                   dtype: str = 'float64') -> PolyphaseBank:
+    """Design (once) the polyphase filter bank for a rate pair and preset"""
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f"Unknown resampling quality '{quality}' "
+                         f"(choose from {', '.join(QUALITY_PRESETS)})")
+    zero_crossings, rolloff, beta = QUALITY_PRESETS[quality]
+    g = gcd(int(src_rate), int(dst_rate))
+    up, down = int(dst_rate) // g, int(src_rate) // g
+
+    length = 2 * zero_crossings * max(up, down) + 1
+    prototype = signal.firwin(length, rolloff / max(up, down), window=('kaiser', beta)) * up
+    taps = -(-length // up)
+    padded = np.zeros(taps * up)
+    padded[:length] = prototype
+    # Branch p holds h[p], h[p + up], h[p + 2 up], ...; reversed so a
+    # forward window over the input lines up with it
+    branches = padded.reshape(taps, up).T[:, ::-1].astype(dtype)
+    branches.setflags(write=False)
+    return PolyphaseBank(up, down, branches, (length - 1) // 2)
+
+
+class Resampler:
+    """Streaming polyphase resampler for (samples,) or (samples, channels) audio.
+
+    Call process() with consecutive blocks and flush() once at the end; the
+    concatenated outputs have ceil(input samples x dst / src) samples.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int, channels: int = 1,
+                 quality: str = DEFAULT_QUALITY, dtype=np.float64,
+                 block_size: int = DEFAULT_BLOCK_SIZE):
+        self.dtype = np.dtype(dtype)
+        self.bank = polyphase_bank(src_rate, dst_rate, quality, self.dtype.name)
+        self.channels = channels
+        self.block_size = block_size
+        self.samples_in = 0
+        self._next_out = 0
+        # Inputs before the start of the signal are zeros
+        self._buffer = np.zeros((self.bank.taps, channels), dtype=self.dtype)
+        self._buffer_start = -self.bank.taps
+
+    def _input_index(self, n):
+        """Newest input sample contributing to output n"""
+        return (n * self.bank.down + self.bank.delay) // self.bank.up
+
+    def _compute(self, n_end: int) -> np.ndarray:
+        """Outputs [next_out, n_end), which must all be covered by the buffer"""
+        if n_end <= self._next_out:
+            return np.zeros((0, self.channels), dtype=self.dtype)
+        up, taps = self.bank.up, self.bank.taps
+        pieces = []
+        windows = sliding_window_view(self._buffer, taps, axis=0)   # (rows, channels, taps)
+        for n0 in range(self._next_out, n_end, self.block_size):
+            n1 = min(n0 + self.block_size, n_end)
+            out = np.empty((n1 - n0, self.channels), dtype=self.dtype)
+            # Outputs n0 + r, n0 + r + up, ... share a branch and step through
+            # the input by `down`, i.e. a strided slice of the window view
+            for r in range(min(up, n1 - n0)):
+                n = n0 + r
+                m = n * self.bank.down + self.bank.delay
+                first_row = m // up - taps + 1 - self._buffer_start
+                count = len(range(n, n1, up))
+                rows = windows[first_row:first_row + (count - 1) * self.bank.down + 1:self.bank.down]
+                out[r::up] = np.einsum('qct,t->qc', rows, self.bank.branches[m % up])
+            pieces.append(out)
+        self._next_out = n_end
+        # Drop input no longer needed by any future output
+        keep_from = self._input_index(self._next_out) - taps + 1 - self._buffer_start
+        if keep_from > 0:
+            self._buffer = self._buffer[keep_from:].copy()
+            self._buffer_start += keep_from
+        return np.concatenate(pieces) if len(pieces) > 1 else pieces[0]
+
+    def _append(self, block: np.ndarray):
+        self._buffer = np.concatenate([self._buffer, block])
+
+    def _available(self) -> int:
+        """First output index that still needs input beyond the buffer"""
+        buffer_end = self._buffer_start + len(self._buffer)
+        # Largest n with _input_index(n) <= buffer_end - 1
+        return ((buffer_end * self.bank.up - self.bank.delay - 1) // self.bank.down) + 1
+
+    def _shape(self, block):
+        block = np.asarray(block, dtype=self.dtype)
+        return block.reshape(-1, 1) if block.ndim == 1 else block
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Resample the next block; returns every output that is complete"""
+        block = self._shape(block)
+        self.samples_in += len(block)
+        self._append(block)
+        return self._compute(max(self._next_out, self._available()))
+
+    def flush(self) -> np.ndarray:
+        """Remaining outputs, treating the input as followed by silence"""
+        total = -(-self.samples_in * self.bank.up // self.bank.down)
+        if total > self._next_out:
+            needed = self._input_index(total - 1) + 1 - (self._buffer_start + len(self._buffer))
+            if needed > 0:
+                self._append(np.zeros((needed, self.channels), dtype=self.dtype))
+        return self._compute(max(total, self._next_out))
+
+
+def resample(audio: np.ndarray, src_rate: int, dst_rate: int, quality: str = DEFAULT_QUALITY,
+             block_size: int = DEFAULT_BLOCK_SIZE) -> np.ndarray:
+    """Resample a whole signal along axis 0, block by block.
+
+    float32 input is processed in float32; anything else in float64.
+    """
+    if src_rate == dst_rate:
+        return audio
+    dtype = np.float32 if audio.dtype == np.float32 else np.float64
+    channels = 1 if audio.ndim == 1 else audio.shape[1]
+    resampler = Resampler(src_rate, dst_rate, channels, quality, dtype)
+    step = max(1, block_size * resampler.bank.down // resampler.bank.up)
+    pieces = [resampler.process(audio[i:i + step]) for i in range(0, len(audio), step)]
+    pieces.append(resampler.flush())
+    out = np.concatenate(pieces)
+    return out[:, 0] if audio.ndim == 1 else out
@@ -0,0 +1,66 @@
+"""Tests for download_cache.DownloadCache (run with pytest from Utilities/)"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import download_cache  # noqa: E402
+from download_cache import DownloadCache  # noqa: E402
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = DownloadCache(tmp_path / 'cache')
+    yield cache
+    cache.close()
+
+
+def store(cache, tmp_path, contents=b'picture' * 1000):
+    source = tmp_path / 'download.mp4'
+    source.write_bytes(contents)
+    download = cache.store('youtube:abcdefghijk', 'bv*', source)
+    cache.release(download)
+    return download
+
+
+def touch(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+def test_lookup_finds_a_stored_download(cache, tmp_path):
+    stored = store(cache, tmp_path)
+    found = cache.lookup('youtube:abcdefghijk', 'bv*')
+    assert found is not None and found.video == stored.video
+    assert cache.lookup('youtube:abcdefghijk', 'ba') is None
+
+
+def test_touched_object_is_rehashed_without_holding_the_lock(cache, tmp_path, monkeypatch):
+    stored = store(cache, tmp_path)
+    touch(stored.video)
+    hashed_unlocked = []
+    sha256_file = download_cache.sha256_file
+
+    def checking_sha256_file(path):
+        hashed_unlocked.append(not cache._lock.locked())
+        return sha256_file(path)
+    monkeypatch.setattr(download_cache, 'sha256_file', checking_sha256_file)
+
+    assert cache.lookup('youtube:abcdefghijk', 'bv*') is not None
+    assert hashed_unlocked == [True]
+    # The new mtime is trusted from then on
+    assert cache.lookup('youtube:abcdefghijk', 'bv*') is not None
+    assert hashed_unlocked == [True]
+
+
+def test_damaged_object_is_dropped(cache, tmp_path):
+    stored = store(cache, tmp_path)
+    os.chmod(stored.video, 0o644)
+    stored.video.write_bytes(b'PICTURE' * 1000)
+    touch(stored.video)
+
+    assert cache.lookup('youtube:abcdefghijk', 'bv*') is None
+    assert not stored.video.exists()
+    assert cache.total_bytes() == 0
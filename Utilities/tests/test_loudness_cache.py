@@ -0,0 +1,69 @@
+"""Tests for loudness_cache.LoudnessCache (run with pytest from Utilities/)"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from loudness_cache import LoudnessCache  # noqa: E402
+from loudness_meter import LoudnessMeasurement  # noqa: E402
+
+LEVELS = LoudnessMeasurement(-20.5, -3.25)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = LoudnessCache(tmp_path / 'cache.sqlite')
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'take.wav'
+    path.write_bytes(bytes(range(256)) * 1024)
+    return path
+
+
+def test_hit_for_an_unchanged_file(cache, source):
+    cache.put(cache.key_for(source), 'source', LEVELS, 4.5, 48000)
+
+    cached = cache.get(cache.key_for(source), 'source')
+
+    assert cached.levels == LEVELS and cached.lra == 4.5 and cached.sample_rate == 48000
+    assert cache.get(cache.key_for(source), 'other analysis') is None
+
+
+def test_miss_after_the_size_changes(cache, source):
+    cache.put(cache.key_for(source), 'source', LEVELS, 4.5, 48000)
+    with open(source, 'ab') as f:
+        f.write(b'\0')
+    assert cache.get(cache.key_for(source), 'source') is None
+
+
+def test_miss_after_the_contents_and_mtime_change(cache, source):
+    cache.put(cache.key_for(source), 'source', LEVELS, 4.5, 48000)
+    st = os.stat(source)
+    source.write_bytes(bytes(reversed(range(256))) * 1024)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert cache.get(cache.key_for(source), 'source') is None
+
+
+def test_touched_but_unchanged_file_is_still_a_hit(cache, source):
+    # A new mtime only forces the content hash to be recomputed
+    cache.put(cache.key_for(source), 'source', LEVELS, 4.5, 48000)
+    st = os.stat(source)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert cache.get(cache.key_for(source), 'source') is not None
+
+
+def test_recorded_output_is_forgotten_once_deleted(cache, source, tmp_path):
+    output = tmp_path / 'take_normalized.wav'
+    output.write_bytes(b'RIFF')
+    cache.record_output(cache.key_for(source), 'settings', output)
+
+    assert cache.output_for(cache.key_for(source), 'settings') == output
+    assert cache.output_for(cache.key_for(source), 'other settings') is None
+    output.unlink()
+    assert cache.output_for(cache.key_for(source), 'settings') is None
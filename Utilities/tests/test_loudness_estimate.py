@@ -0,0 +1,51 @@
+"""Tests for loudness_estimate (run with pytest from Utilities/)"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from loudness_estimate import estimate_file  # noqa: E402
+from loudness_meter import integrated_loudness  # noqa: E402
+
+RATE = 48000
+
+
+def write_noise(path, seconds: float, level: float = 0.05):
+    audio = np.random.default_rng(0).standard_normal((int(seconds * RATE), 2)) * level
+    sf.write(str(path), audio, RATE, subtype='FLOAT')
+    return audio
+
+
+def test_short_file_is_measured_in_full(tmp_path):
+    path = tmp_path / 'short.wav'
+    audio = write_noise(path, 10)
+
+    result = estimate_file(path, target=-23.0)
+
+    assert result.exact and result.read_fraction == 1.0
+    assert result.loudness == result.low == result.high
+    assert result.loudness == pytest.approx(integrated_loudness(audio, RATE), abs=1e-6)
+    assert result.status == 'out of spec'
+
+
+def test_long_file_is_sampled_and_classified(tmp_path):
+    path = tmp_path / 'long.wav'
+    audio = write_noise(path, 120)
+    true_loudness = integrated_loudness(audio, RATE)
+
+    result = estimate_file(path, target=round(true_loudness), tolerance=1.0, blocks=40)
+
+    assert not result.exact and result.blocks == 40 and result.read_fraction < 0.5
+    assert result.low <= true_loudness <= result.high
+    assert result.status == 'in spec'
+
+
+def test_unreadable_file_is_an_error(tmp_path):
+    path = tmp_path / 'broken.wav'
+    path.write_bytes(b'not audio')
+    result = estimate_file(path, target=-23.0)
+    assert result.status == 'error' and result.error
@@ -0,0 +1,55 @@
+"""Tests for the loudness_meter BS.1770 engine (run with pytest from Utilities/)"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from loudness_meter import LoudnessAnalyzer, analyse, integrated_loudness  # noqa: E402
+
+RATE = 48000
+
+
+def tone(seconds: float, level_db: float, frequency: float = 1000.0) -> np.ndarray:
+    """Stereo sine with the given peak level in dBFS on both channels"""
+    t = np.arange(int(seconds * RATE)) / RATE
+    return np.repeat((10 ** (level_db / 20) * np.sin(2 * np.pi * frequency * t))[:, None], 2, axis=1)
+
+
+# EBU Tech 3341 test signals 1-3: expected -23, -33 and -23 LKFS, +/-0.1 LU
+@pytest.mark.parametrize('segments, expected', [
+    ([(20, -23.0)], -23.0),
+    ([(20, -33.0)], -33.0),
+    ([(10, -36.0), (60, -23.0), (10, -36.0)], -23.0),
+])
+def test_ebu_3341_reference_signals(segments, expected):
+    audio = np.concatenate([tone(seconds, level) for seconds, level in segments])
+    assert integrated_loudness(audio, RATE) == pytest.approx(expected, abs=0.1)
+    assert integrated_loudness(audio.astype(np.float32), RATE) == pytest.approx(expected, abs=0.1)
+
+
+def test_agrees_with_pyloudnorm_on_gated_noise():
+    pyln = pytest.importorskip('pyloudnorm')
+    rng = np.random.default_rng(0)
+    audio = rng.standard_normal((30 * RATE, 2)) * 0.05
+    # Quiet passage for the relative gate, digital silence for the absolute one
+    audio[5 * RATE:8 * RATE] *= 0.01
+    audio[12 * RATE:15 * RATE] = 0
+    assert integrated_loudness(audio, RATE) == pytest.approx(pyln.Meter(RATE).integrated_loudness(audio), abs=0.01)
+
+
+def test_chunked_feeding_matches_whole_signal():
+    audio = np.random.default_rng(1).standard_normal((7 * RATE + 123, 2)) * 0.1
+    audio[2 * RATE:4 * RATE] = 0
+    whole = analyse(audio, RATE)
+    chunked = LoudnessAnalyzer(RATE, 2)
+    for start in range(0, len(audio), 4321):
+        chunked.feed(audio[start:start + 4321])
+    assert chunked.integrated_loudness() == pytest.approx(whole.integrated_loudness(), abs=1e-9)
+    np.testing.assert_allclose(chunked.momentary_loudness(), whole.momentary_loudness(), atol=1e-9)
+
+
+def test_silence_has_no_loudness():
+    assert integrated_loudness(np.zeros((5 * RATE, 2)), RATE) == -np.inf
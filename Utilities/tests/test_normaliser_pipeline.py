@@ -0,0 +1,149 @@
+"""Tests for normaliser_pipeline.BatchNormaliser (run with pytest from Utilities/)"""
+
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from loudness_cache import LoudnessCache  # noqa: E402
+from normaliser_pipeline import SILENT_ERROR, BatchNormaliser, NormaliserSettings, cli_main  # noqa: E402
+
+RATE = 48000
+
+
+def write_wav(path: Path, audio: np.ndarray) -> Path:
+    sf.write(str(path), audio, RATE, subtype='PCM_24')
+    return path
+
+
+def noise(seconds: float, level: float = 0.1, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((int(seconds * RATE), 2)) * level
+
+
+def test_silent_file_is_failed_not_written(tmp_path):
+    source = write_wav(tmp_path / 'silent.wav', np.zeros((3 * RATE, 2)))
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    normaliser = BatchNormaliser(NormaliserSettings(use_cache=False, output_path=str(out_dir)))
+
+    results = normaliser.process_files([source], [])
+
+    assert [r.status for r in results] == ['error']
+    assert results[0].error == SILENT_ERROR
+    assert results[0].output == ''
+    assert list(out_dir.iterdir()) == []
+
+
+def test_pipeline_keeps_each_files_lines_together(tmp_path):
+    sources = [(write_wav(tmp_path / f'take{i}.wav', noise(2, seed=i)), 'audio') for i in range(2)]
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    lines = []
+    normaliser = BatchNormaliser(NormaliserSettings(use_cache=False, output_path=str(out_dir)),
+                                 lambda message, color=None: lines.append(message.strip()))
+    # A slow disk: the next file is rendered while this one is still being written
+    write = normaliser.write
+    normaliser.write = lambda rendered: (time.sleep(0.3), write(rendered))[1]
+
+    normaliser._run_pipeline(sources, None, depth=2)
+
+    assert [r.status for r in normaliser.results] == ['ok', 'ok']
+    starts = [i for i, line in enumerate(lines) if line.startswith('Processing:')]
+    saves = [i for i, line in enumerate(lines) if line.startswith('✓ Saved:')]
+    assert [lines[i] for i in starts] == ['Processing: take0.wav', 'Processing: take1.wav']
+    assert starts[0] < saves[0] < starts[1] < saves[1]
+
+
+def test_buffer_memory_is_reported_per_file_without_tracing(tmp_path):
+    sources = [write_wav(tmp_path / f'take{i}.wav', noise(2, seed=i)) for i in range(2)]
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    lines = []
+    normaliser = BatchNormaliser(NormaliserSettings(use_cache=False, output_path=str(out_dir)),
+                                 lambda message, color=None: lines.append(message.strip()))
+
+    results = normaliser.process_files(sources, [])
+
+    # 2 s of stereo float64, decoded and rendered
+    expected = round(2 * 2 * RATE * 2 * 8 / 2 ** 20, 1)
+    assert [r.buffer_memory_mb for r in results] == [expected, expected]
+    assert [line for line in lines if line.startswith('Audio buffers:')] == [f"Audio buffers: {expected:.0f} MB"] * 2
+    assert all(r.peak_memory_mb is None for r in results) and normaliser.peak_memory_mb is None
+    assert not tracemalloc.is_tracing()
+
+
+@pytest.mark.parametrize('depth', [0, 1])
+def test_traced_peak_is_per_file_only_when_files_run_one_at_a_time(tmp_path, depth):
+    sources = [write_wav(tmp_path / f'take{i}.wav', noise(2, seed=i)) for i in range(2)]
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    lines = []
+    settings = NormaliserSettings(use_cache=False, output_path=str(out_dir), pipeline_depth=depth, report_memory=True)
+    normaliser = BatchNormaliser(settings, lambda message, color=None: lines.append(message.strip()))
+
+    results = normaliser.process_files(sources, [])
+
+    per_file = [line for line in lines if 'peak memory:' in line]
+    if depth == 0:
+        assert all(r.peak_memory_mb is not None for r in results) and len(per_file) == 2
+        assert normaliser.peak_memory_mb is None
+    else:
+        assert all(r.peak_memory_mb is None for r in results) and per_file == []
+        assert normaliser.peak_memory_mb > 0
+        assert lines[-1].startswith('Peak memory for the batch:')
+
+
+def test_watch_rejects_linked_stems(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        cli_main([str(tmp_path), '--watch', '--link-stems', 'suffix'])
+    assert exit_info.value.code == 2
+    assert '--link-stems cannot be used with --watch' in capsys.readouterr().err
+
+
+def test_linked_stems_are_cached_and_named_without_the_limiter(tmp_path):
+    stems = [write_wav(tmp_path / f'reel1_{suffix}.wav', noise(2, level, seed))
+             for seed, (suffix, level) in enumerate([('DX', 0.1), ('MX', 0.03)])]
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    cache = LoudnessCache(tmp_path / 'cache.sqlite')
+
+    def run(**settings):
+        lines = []
+        settings = NormaliserSettings(output_path=str(out_dir), link_stems='suffix', use_limiter=True, **settings)
+        results = BatchNormaliser(settings, lambda message, color=None: lines.append(message.strip()),
+                                  cache).process_files(stems, [])
+        return results, lines
+
+    try:
+        results, _ = run()
+        assert [r.status for r in results] == ['ok', 'ok']
+        assert not any('_lim' in Path(r.output).name for r in results)
+
+        results, lines = run()
+        assert [r.status for r in results] == ['skipped', 'skipped']
+        assert 'Unchanged since last run, skipping' in lines
+
+        # New settings: written again, from the cached measurement
+        results, lines = run(target_loudness=-20.0)
+        assert [r.status for r in results] == ['ok', 'ok'] and all(r.cached_analysis for r in results)
+
+        # One stem changed: the whole group is measured and written again
+        write_wav(stems[1], noise(2, 0.05, seed=7))
+        results, lines = run(target_loudness=-20.0)
+        assert [r.status for r in results] == ['ok', 'ok'] and not any(r.cached_analysis for r in results)
+    finally:
+        cache.close()
+
+
+@pytest.mark.parametrize('blocks', ['0', '-3', 'many'])
+def test_estimate_rejects_fewer_than_one_block(tmp_path, capsys, blocks):
+    with pytest.raises(SystemExit) as exit_info:
+        cli_main([str(tmp_path), '--estimate', '--estimate-blocks', blocks])
+    assert exit_info.value.code == 2
+    assert 'argument --estimate-blocks' in capsys.readouterr().err
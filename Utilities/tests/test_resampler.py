@@ -0,0 +1,49 @@
+"""Tests for resampler.Resampler (run with pytest from Utilities/)"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from resampler import Resampler, resample  # noqa: E402
+
+
+def run_blocks(resampler: Resampler, audio: np.ndarray, sizes) -> np.ndarray:
+    pieces, start = [], 0
+    for size in sizes:
+        pieces.append(resampler.process(audio[start:start + size]))
+        start += size
+    pieces.append(resampler.process(audio[start:]))
+    pieces.append(resampler.flush())
+    return np.concatenate(pieces)
+
+
+@pytest.mark.parametrize('src_rate, dst_rate', [(48000, 44100), (44100, 48000), (96000, 48000)])
+def test_output_does_not_depend_on_block_boundaries(src_rate, dst_rate):
+    rng = np.random.default_rng(0)
+    audio = rng.standard_normal((src_rate // 5 + 17, 2))
+    whole = run_blocks(Resampler(src_rate, dst_rate, 2), audio, [])
+    sizes = rng.integers(1, 3000, 40)
+
+    blocks = run_blocks(Resampler(src_rate, dst_rate, 2), audio, sizes)
+    single_samples = run_blocks(Resampler(src_rate, dst_rate, 2), audio, [1] * 500)
+
+    np.testing.assert_allclose(blocks, whole, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(single_samples, whole, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(resample(audio, src_rate, dst_rate), whole, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('frames', [0, 1, 147, 48000, 48001])
+def test_output_length_is_input_length_scaled_and_rounded_up(frames):
+    out = resample(np.zeros((frames, 2), dtype=np.float32), 48000, 44100)
+    assert out.shape == (-(-frames * 147 // 160), 2)
+    assert out.dtype == np.float32
+
+
+def test_tone_keeps_its_level():
+    t = np.arange(48000) / 48000
+    out = resample(0.5 * np.sin(2 * np.pi * 1000 * t), 48000, 44100)
+    # Away from the edges, where the filter sees the zeros around the signal
+    assert np.sqrt(np.mean(out[2000:-2000] ** 2)) == pytest.approx(0.5 / np.sqrt(2), rel=1e-3)
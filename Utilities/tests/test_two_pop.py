@@ -0,0 +1,53 @@
+"""Tests for two_pop (run with pytest from Utilities/)"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from two_pop import detect, find_two_pop  # noqa: E402
+
+RATE = 48000
+
+
+def head_with_pop(start: int, length: int, level_db: float = -20.0, phase: float = 0.0) -> np.ndarray:
+    """Low noise floor, a 1 kHz pop, then program from pop start + 2 s"""
+    rng = np.random.default_rng(0)
+    audio = rng.standard_normal((6 * RATE, 2)) * 1e-4
+    t = np.arange(length) / RATE
+    audio[start:start + length] += (10 ** (level_db / 20) * np.sin(2 * np.pi * 1000 * t + phase))[:, None]
+    program = start + 2 * RATE
+    audio[program:] += rng.standard_normal((len(audio) - program, 2)) * 0.1
+    return audio
+
+
+# One frame at 24 fps (2000 samples) and at 60 fps (800 samples), starting at any phase
+@pytest.mark.parametrize('length, phase', [(2000, 0.0), (800, 0.0), (2000, 1.3)])
+def test_finds_the_pop_and_its_length(length, phase):
+    pop = detect(head_with_pop(30000, length, phase=phase), RATE)
+
+    assert pop is not None
+    assert abs(pop.start - 30000) <= 2
+    assert abs(pop.length - length) <= 4
+    assert pop.level_db == pytest.approx(-20.0, abs=0.5)
+    assert pop.trim == pop.start + 2 * RATE
+
+
+def test_no_pop_in_plain_program():
+    audio = np.random.default_rng(1).standard_normal((3 * RATE, 2)) * 0.1
+    assert detect(audio, RATE) is None
+
+
+def test_long_tone_is_not_a_pop():
+    # A line-up tone lasts seconds, not a frame
+    assert detect(head_with_pop(30000, RATE), RATE) is None
+
+
+def test_find_two_pop_reads_the_file_head(tmp_path):
+    path = tmp_path / 'mix.wav'
+    sf.write(str(path), head_with_pop(12345, 2000), RATE, subtype='PCM_24')
+    pop = find_two_pop(path)
+    assert pop is not None and abs(pop.start - 12345) <= 2
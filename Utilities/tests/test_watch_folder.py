@@ -0,0 +1,29 @@
+"""Tests for watch_folder.WatchFolder (run with pytest from Utilities/)"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from normaliser_pipeline import NormaliserSettings  # noqa: E402
+from watch_folder import WatchFolder  # noqa: E402
+
+
+@pytest.mark.parametrize('output', ['drop', '.', 'drop/normalised', None])
+def test_wants_sources_but_never_our_outputs(tmp_path, output):
+    drop = tmp_path / 'drop'
+    (drop / 'normalised').mkdir(parents=True)
+    watcher = WatchFolder([drop], NormaliserSettings(), output=tmp_path / output if output else None)
+
+    assert watcher.wants(drop / 'a.wav')
+    assert watcher.wants(drop / 'reel' / 'b.mov')
+    assert not watcher.wants(drop / 'a.wav.part')
+    assert not watcher.wants(tmp_path / 'elsewhere.wav')
+    output_name = drop / 'a_normalized_18lkfs_tp1_5dbfs_20260101_000000.wav'
+    if output == 'drop/normalised':
+        # A separate output folder is told apart by folder alone
+        assert not watcher.wants(drop / 'normalised' / 'c.wav')
+        assert watcher.wants(output_name)
+    else:
+        assert not watcher.wants(output_name)
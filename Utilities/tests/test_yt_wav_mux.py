@@ -0,0 +1,72 @@
+"""Tests for yt_wav_mux's pure helpers (run with pytest from Utilities/)"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from yt_wav_mux import ProgressParser, read_manifest, rendition_paths  # noqa: E402
+
+
+def test_progress_from_ytdlp_template_lines():
+    parser = ProgressParser('download')
+    assert parser.feed('ytmux-progress 25 100 NA 30')
+    assert (parser.current.stage, parser.current.fraction, parser.current.eta) == ('download', 0.25, 30.0)
+    # Size only estimated, ETA unknown
+    assert parser.feed('ytmux-progress 50 NA 200 NA')
+    assert (parser.current.fraction, parser.current.eta) == (0.25, None)
+    assert not parser.feed('[youtube] abc: Downloading webpage')
+
+
+def test_progress_from_ffmpeg_progress_lines():
+    parser = ProgressParser('mux')
+    # Durations come from the banner; with -shortest the shortest input wins
+    assert not parser.feed('  Duration: 00:01:00.00, start: 0.000000, bitrate: 1000 kb/s')
+    assert not parser.feed('  Duration: 00:00:40.00, start: 0.000000, bitrate: 2304 kb/s')
+    assert parser.feed('out_time_us=10000000')
+    assert parser.current is None
+    assert parser.feed('progress=continue')
+    assert parser.current.fraction == pytest.approx(0.25)
+    assert parser.feed('progress=end')
+    assert parser.current.fraction == 1.0
+    assert parser.current.describe() == '100%'
+    assert not parser.feed('Stream mapping:')
+
+
+@pytest.mark.parametrize('out, renditions, expected', [
+    ('clip.mp4', ['mp4'], {'mp4': 'clip.mp4'}),
+    ('clip.mov', ['mp4', 'mov'], {'mp4': 'clip.mp4', 'mov': 'clip.mov'}),
+    ('a/clip.mkv', ['mp4', 'mov'], {'mp4': 'a/clip.mp4', 'mov': 'a/clip.mov'}),
+    ('clip.MP4', ['mp4', 'mov'], {'mp4': 'clip.MP4', 'mov': 'clip.mov'}),
+])
+def test_rendition_paths(out, renditions, expected):
+    assert rendition_paths(out, renditions) == expected
+
+
+def test_read_manifest_with_header_and_relative_paths(tmp_path):
+    manifest = tmp_path / 'jobs.csv'
+    manifest.write_text('output,url,wav\n'
+                        'renders/one.mp4,https://youtu.be/a,mixes/one.wav\n'
+                        '\n'
+                        ',https://youtu.be/b,two.wav\n')
+    jobs = read_manifest(str(manifest))
+    assert [(job.url, job.wav, job.out) for job in jobs] == [
+        ('https://youtu.be/a', str(tmp_path / 'mixes' / 'one.wav'), str(tmp_path / 'renders' / 'one.mp4')),
+        ('https://youtu.be/b', str(tmp_path / 'two.wav'), str(tmp_path / 'two_mux.mp4')),
+    ]
+    assert all(job.status == 'queued' for job in jobs)
+
+
+def test_read_manifest_without_header(tmp_path):
+    manifest = tmp_path / 'jobs.csv'
+    manifest.write_text('https://youtu.be/a,one.wav,out.mov\n')
+    [job] = read_manifest(str(manifest))
+    assert (job.url, job.out) == ('https://youtu.be/a', str(tmp_path / 'out.mov'))
+
+
+def test_read_manifest_rejects_a_row_without_a_wav(tmp_path):
+    manifest = tmp_path / 'jobs.csv'
+    manifest.write_text('url,wav\nhttps://youtu.be/a,\n')
+    with pytest.raises(ValueError, match='row 1'):
+        read_manifest(str(manifest))
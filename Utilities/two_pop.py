@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Find the 2-pop at the head of a mix.
+
+A 2-pop is a single frame of 1 kHz tone placed exactly two seconds before
+the first frame of action, so the program starts at pop start + 2 s. Only
+the first few seconds of the file are read. The tone is found by
+demodulating at 1 kHz and comparing the in-band power with the total power
+over a few milliseconds; the onset is then refined to the first sample that
+rises out of the silence before it.
+
+    python two_pop.py mix.wav
+"""
+
+import sys
+from typing import NamedTuple, Optional
+
+import numpy as np
+import soundfile as sf
+
+POP_FREQUENCY = 1000.0
+PRE_ROLL_SECONDS = 2.0
+# Seconds of the head searched for the pop
+SEARCH_SECONDS = 10.0
+# One frame is 17 ms at 60 fps and 42 ms at 23.976; allow some slop either side
+MIN_POP_SECONDS = 0.012
+MAX_POP_SECONDS = 0.080
+# Analysis window: two cycles of the tone
+WINDOW_SECONDS = 0.002
+# Fraction of the window's power that must sit at 1 kHz, and the quietest pop accepted
+MIN_TONALITY = 0.8
+MIN_LEVEL_DB = -50.0
+
+
+class TwoPop(NamedTuple):
+    """A pop found in a file, in samples at the file's rate"""
+    start: int
+    length: int
+    rate: int
+    level_db: float
+
+    @property
+    def trim(self) -> int:
+        """First sample of program"""
+        return self.start + int(round(PRE_ROLL_SECONDS * self.rate))
+
+    def describe(self) -> str:
+        return (f"2-pop at {self.start / self.rate:.4f} s ({self.length / self.rate * 1000:.1f} ms, "
+                f"{self.level_db:.1f} dBFS); program starts at {self.trim / self.rate:.4f} s")
+
+
+def _moving_mean(x: np.ndarray, width: int) -> np.ndarray:
+    """Centred moving average, same length as x"""
+    sums = np.cumsum(np.concatenate([np.zeros(1, x.dtype), x]))
+    half = width // 2
+    lo = np.clip(np.arange(len(x)) - half, 0, len(x))
+    hi = np.clip(np.arange(len(x)) - half + width, 0, len(x))
+    return (sums[hi] - sums[lo]) / np.maximum(hi - lo, 1)
+
+
+def detect(head: np.ndarray, rate: int) -> Optional[TwoPop]:
+    """First 1 kHz burst of about one frame in head (frames x channels)"""
+    mono = head.mean(axis=1) if head.ndim == 2 else head
+    mono = mono.astype(np.float64)
+    if len(mono) == 0:
+        return None
+    width = max(int(WINDOW_SECONDS * rate), 8)
+
+    # In a pure tone of amplitude A, |mean(x e^-jwt)| = A / 2 and mean(x^2) = A^2 / 2
+    carrier = np.exp(-2j * np.pi * POP_FREQUENCY / rate * np.arange(len(mono)))
+    band = np.abs(_moving_mean(mono * carrier, width)) ** 2 * 2
+    power = _moving_mean(mono * mono, width)
+    floor = 10 ** (MIN_LEVEL_DB / 10) / 2
+    tonal = (band > MIN_TONALITY * power) & (power > floor)
+
+    # Runs of tonal samples, as [start, end) pairs
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], tonal.astype(np.int8), [0]])))
+    for run_start, run_end in zip(edges[::2], edges[1::2]):
+        # Smoothing shortens a burst by about a window; add it back before judging length
+        length = run_end - run_start + width
+        if not MIN_POP_SECONDS * rate <= length <= MAX_POP_SECONDS * rate:
+            continue
+        amplitude = np.sqrt(2 * power[run_start:run_end].mean())
+        # The onset lies within a window of the run; take the first sample above the silence
+        lo = max(run_start - width, 0)
+        quiet = np.abs(mono[max(lo - width, 0):lo])
+        threshold = max(0.05 * amplitude, 4 * quiet.max()) if len(quiet) else 0.05 * amplitude
+        loud = np.flatnonzero(np.abs(mono[lo:run_end]) > threshold)
+        start = lo + int(loud[0]) if len(loud) else int(run_start)
+        # Same for the tail, to report the burst's length
+        hi = min(run_end + width, len(mono))
+        loud = np.flatnonzero(np.abs(mono[run_start:hi]) > threshold)
+        end = run_start + int(loud[-1]) + 1 if len(loud) else int(run_end)
+        # A tone starting near a zero crossing begins below the threshold: step
+        # back over samples that still follow the fitted sine
+        fit = 2 * np.mean(mono[run_start:run_end] * carrier[run_start:run_end])
+        tolerance = 0.02 * amplitude + threshold / 4
+        while start > 0 and abs(mono[start - 1]) <= threshold:
+            predicted = (fit * np.conj(carrier[start - 1])).real
+            if abs(mono[start - 1] - predicted) > tolerance:
+                break
+            start -= 1
+        return TwoPop(start, end - start, rate, 20 * np.log10(amplitude))
+    return None
+
+
+def find_two_pop(path, search_seconds: float = SEARCH_SECONDS) -> Optional[TwoPop]:
+    """Read the head of an audio file and find its 2-pop"""
+    with sf.SoundFile(str(path)) as f:
+        head = f.read(frames=int(search_seconds * f.samplerate), dtype='float32', always_2d=True)
+        rate = f.samplerate
+    return detect(head, rate)
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:]:
+        pop = find_two_pop(name)
+        print(f"{name}: {pop.describe() if pop else 'no 2-pop found'}")
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Watch-folder mode for the SammyJ Batch Loudness Normaliser.
+
+Watches drop folders and normalises audio and video as soon as it has
+finished arriving:
+
+    python normaliser_pipeline.py /shared/drop -o /shared/normalised --watch --target -23
+
+Changes are picked up with inotify on Linux (through libc, no extra
+packages) and by rescanning every --poll-interval seconds elsewhere or when
+inotify is unavailable. A file is only queued once its size and mtime have
+stayed the same for --settle seconds, so copies over the network are not
+read half written. Hidden and partial-download files are ignored until they
+are renamed into place. Queued files are processed in the background by
+--jobs worker threads; a file that changes again is processed again.
+With report_memory set, traced memory is shared by the jobs, so with more
+than one job the peak is logged once for the whole run instead of per file.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from loudness_cache import LoudnessCache
+from normaliser_pipeline import (AUDIO_EXTENSIONS, VIDEO_EXTENSIONS, BatchNormaliser, NormaliserSettings,
+                                 discover_media, matches_patterns)
+
+DEFAULT_SETTLE_SECONDS = 5.0
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_JOBS = 2
+
+# Name prefixes/suffixes of files that are still being written elsewhere
+PARTIAL_SUFFIXES = ('.part', '.partial', '.tmp', '.crdownload', '.download', '.!sync')
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT = struct.Struct('iIII')
+
+
+def _walk_folders(root: Path, recursive: bool) -> Iterable[Path]:
+    yield root
+    if recursive:
+        for folder, subfolders, _ in os.walk(root):
+            for name in subfolders:
+                yield Path(folder) / name
+
+
+class PollingWatcher:
+    """Reports files whose size or mtime changed since the last scan"""
+
+    def __init__(self, roots: Sequence[Path], recursive: bool = True,
+                 interval: float = DEFAULT_POLL_INTERVAL):
+        self.roots = [Path(r) for r in roots]
+        self.recursive = recursive
+        self.interval = interval
+        self._seen = self._scan()
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        seen = {}
+        for root in self.roots:
+            for folder in _walk_folders(root, self.recursive):
+                try:
+                    with os.scandir(folder) as entries:
+                        for entry in entries:
+                            if entry.is_file():
+                                st = entry.stat()
+                                seen[Path(entry.path)] = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    continue
+        return seen
+
+    def changes(self, timeout: float) -> List[Path]:
+        time.sleep(min(timeout, self.interval))
+        seen = self._scan()
+        changed = [path for path, stat in seen.items() if self._seen.get(path) != stat]
+        self._seen = seen
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Reports files touched according to Linux inotify events"""
+
+    def __init__(self, roots: Sequence[Path], recursive: bool = True):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available on this system")
+        self._libc = libc
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.recursive = recursive
+        self._folders: Dict[int, Path] = {}
+        for root in roots:
+            for folder in _walk_folders(Path(root), recursive):
+                self._add(folder)
+
+    def _add(self, folder: Path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(folder)), _WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {folder}")
+        self._folders[wd] = folder
+
+    def changes(self, timeout: float) -> List[Path]:
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return []
+        data = b''
+        while True:
+            try:
+                data += os.read(self._fd, 1 << 16)
+            except BlockingIOError:
+                break
+
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                raise OSError("inotify event queue overflowed")
+            folder = self._folders.get(wd)
+            if folder is None or not name:
+                continue
+            path = folder / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                # A folder created or moved in: watch it and report what it already holds
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    for sub in _walk_folders(path, True):
+                        self._add(sub)
+                        changed.extend(p for p in sub.iterdir() if p.is_file())
+                continue
+            changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def make_watcher(roots: Sequence[Path], recursive: bool = True, poll_interval: Optional[float] = None,
+                 log: Callable[..., None] = print):
+    """inotify where it works, otherwise (or if poll_interval is given) polling"""
+    if poll_interval is None:
+        try:
+            return InotifyWatcher(roots, recursive)
+        except (OSError, AttributeError, TypeError) as e:
+            log(f"inotify unavailable ({e}), polling every {DEFAULT_POLL_INTERVAL:g} s")
+    return PollingWatcher(roots, recursive, poll_interval or DEFAULT_POLL_INTERVAL)
+
+
+class WatchFolder:
+    """Debounce changes under the watched roots and normalise settled files
+    on a bounded pool of worker threads"""
+
+    def __init__(self, roots: Sequence[Path], settings: NormaliserSettings,
+                 output: Optional[Path] = None, cache: Optional[LoudnessCache] = None,
+                 jobs: int = DEFAULT_JOBS, settle: float = DEFAULT_SETTLE_SECONDS,
+                 poll_interval: Optional[float] = None, recursive: bool = True,
+                 include: Sequence[str] = (), exclude: Sequence[str] = (),
+                 log: Callable[..., None] = None):
+        self.roots = [Path(r).resolve() for r in roots]
+        # Concurrent jobs share one trace, so a file's peak would include the others'
+        self.settings = replace(settings, per_file_memory=False) if jobs > 1 else settings
+        self.output = Path(output).resolve() if output else None
+        self.cache = cache
+        self.jobs = jobs
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.recursive = recursive
+        self.include, self.exclude = include, exclude
+        self.log = log or (lambda message, color=None: None)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._pending: Dict[Path, Tuple[int, int, float]] = {}
+        self._in_flight: Set[Path] = set()
+
+    def stop(self):
+        self._stop.set()
+
+    def _root_of(self, path: Path) -> Optional[Path]:
+        for root in self.roots:
+            if path == root or root in path.parents:
+                return root
+        return None
+
+    def wants(self, path: Path) -> bool:
+        """True for media files under a root that are not our own outputs"""
+        name = path.name
+        if name.startswith('.') or name.lower().endswith(PARTIAL_SUFFIXES):
+            return False
+        if path.suffix.lower() not in AUDIO_EXTENSIONS | VIDEO_EXTENSIONS:
+            return False
+        root = self._root_of(path)
+        if root is None:
+            return False
+        # Never feed our own outputs back in: they are told apart by folder,
+        # unless that folder is (or holds) the watched root and so holds the
+        # sources too; then by name, as when they are written beside them
+        output_dir = self.output or (Path(self.settings.output_path).resolve() if self.settings.output_path else None)
+        if output_dir is None or output_dir == root or output_dir in root.parents:
+            if '_normalized_' in name:
+                return False
+        elif output_dir == path.parent or output_dir in path.parents:
+            return False
+        rel_path = path.relative_to(root).as_posix()
+        if self.exclude and matches_patterns(rel_path, self.exclude):
+            return False
+        return not self.include or matches_patterns(rel_path, self.include)
+
+    def output_dir_for(self, path: Path) -> Optional[Path]:
+        if self.output is None:
+            return None
+        folder = self.output / path.parent.relative_to(self._root_of(path))
+        folder.mkdir(parents=True, exist_ok=True)
+        return folder
+
+    def note(self, path: Path):
+        """Restart the settle timer for a changed file"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._pending.pop(path, None)
+            return
+        self._pending[path] = (st.st_size, st.st_mtime_ns, time.monotonic())
+
+    def settled(self) -> List[Path]:
+        """Pending files unchanged for the settle time and not already being processed"""
+        now = time.monotonic()
+        ready = []
+        for path, (size, mtime_ns, since) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self._pending[path] = (st.st_size, st.st_mtime_ns, now)
+            elif now - since >= self.settle and st.st_size > 0:
+                with self._lock:
+                    if path in self._in_flight:
+                        continue
+                    self._in_flight.add(path)
+                del self._pending[path]
+                ready.append(path)
+        return ready
+
+    def process(self, path: Path):
+        kind = 'audio' if path.suffix.lower() in AUDIO_EXTENSIONS else 'video'
+        # Each file's lines are logged together once it is done, so
+        # concurrent jobs do not interleave
+        lines = []
+        try:
+            normaliser = BatchNormaliser(self.settings, log=lambda message, color=None: lines.append((message, color)),
+                                         cache=self.cache)
+            normaliser.process_file(path, kind, self.output_dir_for(path))
+        except Exception as e:
+            lines.append((f"✗ {path.name}: {str(e)}", 'error'))
+        finally:
+            with self._lock:
+                self._in_flight.discard(path)
+                for message, color in lines:
+                    self.log(message, color)
+
+    def run(self, process_existing: bool = False):
+        """Watch until stop() is called (or Ctrl+C)"""
+        watcher = make_watcher(self.roots, self.recursive, self.poll_interval, self.log)
+        self.log(f"Watching {', '.join(map(str, self.roots))} "
+                 f"({type(watcher).__name__.replace('Watcher', '').lower()}, {self.jobs} jobs, "
+                 f"settle {self.settle:g} s)", 'accent')
+        if process_existing:
+            for root in self.roots:
+                audio_files, video_files = discover_media(root, self.recursive, self.include, self.exclude)
+                for path in audio_files + video_files:
+                    if self.wants(path):
+                        self.note(path)
+
+        # Trace for the whole run so concurrent jobs share one session
+        tracing = self.settings.report_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        pool = ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            while not self._stop.is_set():
+                timeout = 1.0 if self._pending else 5.0
+                try:
+                    changed = watcher.changes(min(timeout, self.settle))
+                except OSError as e:
+                    # inotify queue overflow: rescan everything once
+                    self.log(f"{str(e)}, rescanning", 'error')
+                    changed = [p for root in self.roots
+                               for files in discover_media(root, self.recursive) for p in files]
+                for path in changed:
+                    path = Path(path).resolve()
+                    if self.wants(path):
+                        self.note(path)
+                for path in self.settled():
+                    self.log(f"Queued: {path.name}", 'accent')
+                    pool.submit(self.process, path)
+        finally:
+            watcher.close()
+            pool.shutdown(wait=True)
+            if tracing and not self.settings.per_file_memory:
+                self.log(f"Peak memory while watching: {tracemalloc.get_traced_memory()[1] / 2 ** 20:.0f} MB")
+            if tracing:
+                tracemalloc.stop()
@@ -1,26 +1,97 @@
 #!/usr/bin/env python3
 """
 yt_wav_mux — download a YouTube video at highest quality, replace its audio
-with a local WAV (optionally trimming a 2-second 2-pop from the head), and
-mux to MP4 with high-quality AAC.
-
-Requires: yt-dlp and ffmpeg on PATH.
+with a local WAV (optionally trimming the head up to 2 s after its 2-pop,
+found with two_pop.py and cut to the sample), and mux to MP4 with
+high-quality AAC. A MOV with 24-bit PCM can be written in the same pass,
+from one read of the picture and the WAV (--renditions mp4,mov). The MP4 is
+made streamable with +faststart by default; --mp4-layout fragmented or
+reserved avoids faststart's second pass over the file.
+
+Requires: yt-dlp and ffmpeg (on PATH or in the usual Homebrew locations),
+plus numpy and soundfile for 2-pop detection.
 Uses Apple AudioToolbox AAC (aac_at) when available, falling back to
 ffmpeg's native encoder at 320k.
+
+Batch mode takes a CSV manifest with url, wav and output columns (output
+may be left blank), from the GUI or headless:
+
+    python yt_wav_mux.py --batch revisions.csv --downloads 3 --muxes 2
+
+Downloads run on one worker pool and muxes on another, so the network and
+the CPU are busy at the same time; a URL listed against several WAVs is
+downloaded once.
+
+Downloads are kept in a size-bounded cache (see download_cache.py), so a
+new mix against picture fetched before is muxed without downloading again.
+
+The window shows download and mux progress (from yt-dlp's progress template
+and ffmpeg -progress); the tools' full output is written to a log file in
+~/.cache/sweejscripts/logs.
 """
 
+import argparse
+import csv
 import os
 import re
 import shutil
 import subprocess
+import sys
 import tempfile
 import threading
+import time
 import tkinter as tk
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
 from tkinter import filedialog, messagebox, ttk
 
+import soundfile as sf
+
+from download_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, DownloadCache, video_key
+from ffmpeg_capabilities import capabilities, find_tool
+from two_pop import PRE_ROLL_SECONDS, find_two_pop
+
+DEFAULT_DOWNLOADS = 3
+DEFAULT_MUXES = 2
+JOB_STATUSES = ("queued", "downloading", "waiting", "muxing", "done", "failed")
+
+# Output formats written side by side from one mux: name -> (description, extension)
+RENDITIONS = {
+    "mp4": ("MP4, AAC", ".mp4"),
+    "mov": ("MOV, 24-bit PCM", ".mov"),
+}
+DEFAULT_RENDITIONS = ("mp4",)
+
+# How the MP4 index (moov) is laid out:
+#   faststart  - written at the end, then the file is rewritten to move it to the front
+#   fragmented - fragmented MP4, streamable in one write
+#   reserved   - space kept at the front and the index written into it, in one write
+MP4_LAYOUTS = ("faststart", "fragmented", "reserved")
+# Index bytes reserved per second of output: ~16 B per video frame at 60 fps,
+# ~8 B per AAC frame, doubled for headroom
+MOOV_BYTES_PER_SECOND = 4096
+MOOV_BYTES_MIN = 1 << 16
+
+# Progress callbacks fire at most this often (and once at the end)
+PROGRESS_INTERVAL = 0.25
+# Raw tool output echoed to the log when a tool fails
+FAILURE_TAIL_LINES = 15
+LOG_DIR = os.path.join(os.path.expanduser("~"), ".cache", "sweejscripts", "logs")
+
+# yt-dlp --progress-template line; unknown fields print as NA
+YTDLP_PROGRESS = ("ytmux-progress %(progress.downloaded_bytes)s %(progress.total_bytes)s "
+                  "%(progress.total_bytes_estimate)s %(progress.eta)s")
+# Keys ffmpeg writes with -progress
+FFMPEG_PROGRESS = re.compile(
+    r"^(frame|fps|stream_\d+_\d+_q|bitrate|total_size|out_time(_us|_ms)?|dup_frames|drop_frames|speed|progress)="
+)
+INPUT_DURATION = re.compile(r"^\s*Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)")
+
 
 def which_or_die(name):
-    path = shutil.which(name)
+    path = find_tool(name)
     if not path:
         messagebox.showerror("Missing dependency", f"'{name}' not found on PATH.")
         raise SystemExit(1)
@@ -30,17 +101,469 @@ def which_or_die(name):
 def aac_encoder(ffmpeg):
     """Prefer Apple AudioToolbox AAC if this ffmpeg build has it."""
     try:
-        out = subprocess.run(
-            [ffmpeg, "-hide_banner", "-encoders"],
-            capture_output=True, text=True
-        ).stdout
-        if " aac_at " in out:
+        if capabilities(ffmpeg).has_encoder("aac_at"):
             return ["-c:a", "aac_at", "-b:a", "320k"]
     except Exception:
         pass
     return ["-c:a", "aac", "-b:a", "320k"]
 
 
+@dataclass
+class Progress:
+    """How far a download or mux has got."""
+    stage: str                          # "download" or "mux"
+    fraction: Optional[float] = None    # 0-1, None while unknown
+    eta: Optional[float] = None         # seconds
+
+    def describe(self):
+        if self.fraction is None:
+            return "…"
+        text = f"{self.fraction:.0%}"
+        if self.eta is not None and self.fraction < 1:
+            text += f" (ETA {int(self.eta) // 60}:{int(self.eta) % 60:02d})"
+        return text
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None     # "NA" / "N/A"
+
+
+class ProgressParser:
+    """Picks yt-dlp --progress-template and ffmpeg -progress lines out of a
+    tool's output; current holds the latest Progress."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.current = None
+        self.started = time.monotonic()
+        self.durations = []
+        self.out_time = 0.0
+
+    def feed(self, line):
+        """Update from one output line; False if it is ordinary log output."""
+        if line.startswith("ytmux-progress "):
+            done, total, estimate, eta = (_number(v) for v in line.split()[1:5])
+            total = total or estimate
+            self.current = Progress(self.stage, min(done / total, 1.0) if done is not None and total else None, eta)
+            return True
+        match = INPUT_DURATION.match(line)
+        if match:
+            hours, minutes, seconds = match.groups()
+            self.durations.append(int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+            return False
+        if not FFMPEG_PROGRESS.match(line):
+            return False
+        key, _, value = line.partition("=")
+        if key == "out_time_us" and _number(value) is not None:
+            self.out_time = _number(value) / 1e6
+        elif key == "progress":
+            # With -shortest the output is as long as the shortest input
+            duration = min(self.durations) if self.durations else None
+            fraction = 1.0 if value == "end" else min(self.out_time / duration, 1.0) if duration else None
+            eta = None
+            if fraction:
+                eta = (time.monotonic() - self.started) * (1 - fraction) / fraction
+            self.current = Progress(self.stage, fraction, eta)
+        return True
+
+
+def run_proc(cmd, log, progress=None, raw=None):
+    """Run cmd, passing each non-empty output line to raw (default log);
+    raise on failure.
+
+    With progress, yt-dlp and ffmpeg are asked for machine-readable
+    progress, which is kept out of the output and passed to
+    progress(Progress) at most every PROGRESS_INTERVAL seconds. When raw
+    is separate from log, the last lines of output are logged on failure.
+    """
+    raw = raw or log
+    tool = os.path.basename(cmd[0]).lower()
+    if progress is not None:
+        if "ffmpeg" in tool:
+            cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+        elif "yt-dlp" in tool:
+            cmd = [cmd[0], "--newline", "--progress-template", "download:" + YTDLP_PROGRESS, *cmd[1:]]
+    log("$ " + " ".join(cmd))
+    parser = ProgressParser("mux" if "ffmpeg" in tool else "download")
+    tail = deque(maxlen=FAILURE_TAIL_LINES)
+    reported = 0.0
+    proc = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True, bufsize=1
+    )
+    for line in proc.stdout:
+        line = line.rstrip()
+        if not line:
+            continue
+        if progress is not None and parser.feed(line):
+            now = time.monotonic()
+            if parser.current is not None and now - reported >= PROGRESS_INTERVAL:
+                reported = now
+                progress(parser.current)
+            continue
+        raw(line)
+        tail.append(line)
+    proc.wait()
+    if proc.returncode != 0:
+        if raw is not log:
+            for line in tail:
+                log(line)
+        raise RuntimeError(f"{os.path.basename(cmd[0])} exited {proc.returncode}")
+    if progress is not None:
+        progress(Progress(parser.stage, 1.0, 0.0))
+
+
+def video_format(prefer_h264, renditions=DEFAULT_RENDITIONS):
+    """yt-dlp format selector for the picture (we discard YT audio anyway);
+    a MOV rendition needs H.264 picture."""
+    prefer_h264 = prefer_h264 or "mov" in renditions
+    return "bv*[vcodec^=avc]/bv*[ext=mp4]/bv*" if prefer_h264 else "bv*/b"
+
+
+def download_video(ytdlp, url, workdir, fmt, thumbnail, log, progress=None, raw=None):
+    """Download url into workdir; returns (video path, thumbnail path or None).
+
+    progress and raw are as for run_proc.
+    """
+    dl_cmd = [
+        ytdlp, "-f", fmt, "--no-playlist",
+        "-o", os.path.join(workdir, "video.%(ext)s"),
+    ]
+    if thumbnail:
+        dl_cmd += ["--write-thumbnail", "--convert-thumbnails", "png"]
+    dl_cmd.append(url)
+    run_proc(dl_cmd, log, progress, raw)
+    files = os.listdir(workdir)
+    vids = [f for f in files if f.startswith("video.") and not f.endswith(".png")]
+    if not vids:
+        raise RuntimeError("Download produced no video file.")
+    thumbs = [f for f in files if f.endswith(".png")]
+    return os.path.join(workdir, vids[0]), os.path.join(workdir, thumbs[0]) if thumbs else None
+
+
+def fetch_video(ytdlp, url, workdir, fmt, thumbnail, log, cache=None, progress=None, raw=None):
+    """download_video through the download cache, if there is one.
+
+    Returns (video path, thumbnail path or None, cached download or None);
+    a cached download must be released once the mux is done with it.
+    """
+    key = video_key(url, ytdlp) if cache is not None else None
+    if key is not None:
+        cached = cache.lookup(key, fmt, thumbnail)
+        if cached is None:
+            video_path, thumb = download_video(ytdlp, url, workdir, fmt, thumbnail, log, progress, raw)
+            cached = cache.store(key, fmt, video_path, thumb)
+        else:
+            log(f"Using cached download of {key} ({fmt})")
+        return str(cached.video), str(cached.thumbnail) if cached.thumbnail else None, cached
+    return (*download_video(ytdlp, url, workdir, fmt, thumbnail, log, progress, raw), None)
+
+
+def pop_trim(wav, log):
+    """Samples to cut from the head of wav: up to 2 s after its 2-pop, or
+    the first 2 s if no pop is found."""
+    try:
+        pop = find_two_pop(wav)
+        rate = sf.info(wav).samplerate
+    except Exception as e:
+        raise RuntimeError(f"Cannot read {os.path.basename(wav)} to find its 2-pop: {e}")
+    if pop is not None:
+        log(f"{os.path.basename(wav)}: {pop.describe()}")
+        return pop.trim
+    log(f"{os.path.basename(wav)}: no 2-pop found; trimming the first {PRE_ROLL_SECONDS:g} s")
+    return int(PRE_ROLL_SECONDS * rate)
+
+
+def mp4_layout_args(layout, seconds=None):
+    """Muxer options for an MP4 layout (see MP4_LAYOUTS); reserved needs the
+    output's length, or an upper bound on it."""
+    if layout == "fragmented":
+        return ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"]
+    if layout == "reserved":
+        return ["-moov_size", str(max(int(seconds * MOOV_BYTES_PER_SECOND), MOOV_BYTES_MIN))]
+    return ["-movflags", "+faststart"]
+
+
+def rendition_args(ffmpeg, name, mp4_layout="faststart", seconds=None):
+    """Audio codec and container options for one rendition."""
+    if name == "mov":
+        return ["-c:a", "pcm_s24le"]
+    return [*aac_encoder(ffmpeg), *mp4_layout_args(mp4_layout, seconds)]
+
+
+def rendition_paths(out, renditions):
+    """Output path per rendition: out with its extension replaced by the
+    rendition's container's, so out.mkv gives out.mp4 and out.mov rather
+    than an MP4 named .mkv."""
+    base, ext = os.path.splitext(out)
+    return {name: out if ext.lower() == RENDITIONS[name][1] else base + RENDITIONS[name][1]
+            for name in renditions}
+
+
+def mux_command(ffmpeg, video_path, wav, outputs, trim_samples=0, mp4_layout="faststart"):
+    """ffmpeg command: video stream copied, WAV -> each rendition's audio
+    codec, original audio dropped.
+
+    outputs maps rendition names to paths (see rendition_paths); all of them
+    are written from one read of the inputs, with the WAV decoded once.
+    trim_samples are cut from the head of the WAV (see pop_trim), and
+    mp4_layout is one of MP4_LAYOUTS.
+    """
+    # -shortest means the output is no longer than the WAV
+    seconds = sf.info(wav).duration if mp4_layout == "reserved" else None
+    cmd = [ffmpeg, "-hide_banner", "-y"]
+    cmd += ["-i", video_path, "-i", wav]
+    audio = ["1:a:0"] * len(outputs)
+    if trim_samples:
+        # Counted in the WAV's own samples, before any resampling by the encoder
+        graph = f"[1:a:0]atrim=start_sample={trim_samples},asetpts=PTS-STARTPTS"
+        audio = [f"[a{i}]" for i in range(len(outputs))]
+        graph += (f",asplit={len(outputs)}" + "".join(audio)) if len(outputs) > 1 else audio[0]
+        cmd += ["-filter_complex", graph]
+    for (name, out), audio_map in zip(outputs.items(), audio):
+        cmd += [
+            "-map", "0:v:0", "-map", audio_map,
+            "-c:v", "copy",
+            *rendition_args(ffmpeg, name, mp4_layout, seconds),
+            "-shortest",
+            out,
+        ]
+    return cmd
+
+
+def save_thumbnail(thumb, out, log):
+    if thumb:
+        thumb_out = os.path.splitext(out)[0] + ".png"
+        shutil.copy2(thumb, thumb_out)
+        log(f"Thumbnail saved: {thumb_out}")
+    else:
+        log("No thumbnail found for this video.")
+
+
+# ---------- batch ----------
+
+@dataclass
+class MuxJob:
+    """One manifest row and how far it has got."""
+    url: str
+    wav: str
+    out: str
+    status: str = "queued"      # one of JOB_STATUSES
+    error: str = ""
+    seconds: float = 0.0
+
+
+def default_output(wav):
+    base = os.path.splitext(os.path.basename(wav))[0]
+    return os.path.join(os.path.dirname(wav), f"{base}_mux.mp4")
+
+
+def read_manifest(path):
+    """Jobs from a CSV of url, wav, output (header row optional; relative
+    paths are taken from the manifest's folder; a blank output means
+    <wav>_mux.mp4)."""
+    folder = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = [row for row in csv.reader(f) if any(cell.strip() for cell in row)]
+    # A header names its columns, in any order
+    if rows and "url" in (cell.strip().lower() for cell in rows[0]):
+        header = [cell.strip().lower() for cell in rows.pop(0)]
+        columns = [header.index(name) if name in header else None for name in ("url", "wav", "output")]
+    else:
+        columns = [0, 1, 2]
+
+    jobs = []
+    for line, row in enumerate(rows, start=1):
+        url, wav, out = (row[c].strip() if c is not None and c < len(row) else "" for c in columns)
+        if not url or not wav:
+            raise ValueError(f"{path}: row {line} needs a URL and a WAV")
+        wav = os.path.join(folder, os.path.expanduser(wav))
+        out = os.path.join(folder, os.path.expanduser(out)) if out else default_output(wav)
+        jobs.append(MuxJob(url, wav, out))
+    return jobs
+
+
+class BatchMuxer:
+    """Run mux jobs with downloads on one thread pool and muxes on another.
+
+    Each video is fetched once, however many rows name it and however its
+    URL is spelled (from the cache, if given, or into its own temporary
+    folder), and released when the last job using it has been
+    muxed. log(line) receives
+    progress messages and raw(line) tool output (default log);
+    on_status(job) is called from worker threads whenever a
+    job's status changes, and on_progress(job, Progress), if given, as its
+    download or mux moves along.
+    """
+
+    def __init__(self, ytdlp, ffmpeg, prefer_h264=False, trim_pop=False, thumbnails=False,
+                 downloads=DEFAULT_DOWNLOADS, muxes=DEFAULT_MUXES, log=None, on_status=None, cache=None,
+                 on_progress=None, raw=None, renditions=DEFAULT_RENDITIONS, mp4_layout="faststart"):
+        self.ytdlp = ytdlp
+        self.ffmpeg = ffmpeg
+        self.fmt = video_format(prefer_h264, renditions)
+        self.renditions = renditions
+        self.mp4_layout = mp4_layout
+        self.trim_pop = trim_pop
+        self.thumbnails = thumbnails
+        self.downloads = downloads
+        self.muxes = muxes
+        self.log = log or (lambda line: None)
+        self.on_status = on_status or (lambda job: None)
+        self.cache = cache
+        self.on_progress = on_progress
+        self.raw = raw
+        self._lock = threading.Lock()
+
+    def _set(self, job, status, error=""):
+        job.status, job.error = status, error
+        self.on_status(job)
+
+    def _progress(self, *jobs):
+        """run_proc progress callback reporting to on_progress for jobs."""
+        if self.on_progress is None:
+            return None
+
+        def report(progress):
+            for job in jobs:
+                self.on_progress(job, progress)
+        return report
+
+    def run(self, jobs):
+        """Process every job; returns them with their final status."""
+        tmproot = tempfile.mkdtemp(prefix="ytmux_batch_", dir=self.cache.partial_dir if self.cache else None)
+        # Rows are grouped by video where the URL alone identifies it
+        users = {}
+        for job in jobs:
+            users.setdefault(video_key(job.url) or job.url, []).append(job)
+        remaining = {video: len(video_jobs) for video, video_jobs in users.items()}
+        started = {id(job): time.monotonic() for job in jobs}
+        fetched = {}
+
+        def download(video, workdir):
+            for job in users[video]:
+                self._set(job, "downloading")
+            os.makedirs(workdir)
+            video_path, thumb, fetched[video] = fetch_video(
+                self.ytdlp, users[video][0].url, workdir, self.fmt, self.thumbnails, self.log, self.cache,
+                self._progress(*users[video]), self.raw)
+            return video_path, thumb
+
+        def mux(job, video_path, thumb):
+            self._set(job, "muxing")
+            os.makedirs(os.path.dirname(os.path.abspath(job.out)), exist_ok=True)
+            trim = pop_trim(job.wav, self.log) if self.trim_pop else 0
+            outputs = rendition_paths(job.out, self.renditions)
+            run_proc(mux_command(self.ffmpeg, video_path, job.wav, outputs, trim, self.mp4_layout), self.log,
+                     self._progress(job), self.raw)
+            if self.thumbnails:
+                save_thumbnail(thumb, job.out, self.log)
+
+        def finish(video, job, workdir, error=None):
+            job.seconds = time.monotonic() - started[id(job)]
+            self._set(job, "failed" if error else "done", str(error or ""))
+            with self._lock:
+                remaining[video] -= 1
+                if remaining[video] == 0:
+                    if fetched.get(video) is not None:
+                        self.cache.release(fetched[video])
+                    shutil.rmtree(workdir, ignore_errors=True)
+
+        def downloaded(video, job, workdir, future):
+            if future.exception() is not None:
+                finish(video, job, workdir, future.exception())
+                return
+            self._set(job, "waiting")
+            mux_future = mux_pool.submit(mux, job, *future.result())
+            mux_future.add_done_callback(lambda f: finish(video, job, workdir, f.exception()))
+
+        mux_pool = ThreadPoolExecutor(max_workers=self.muxes)
+        download_pool = ThreadPoolExecutor(max_workers=self.downloads)
+        try:
+            for index, (video, video_jobs) in enumerate(users.items()):
+                workdir = os.path.join(tmproot, str(index))
+                future = download_pool.submit(download, video, workdir)
+                for job in video_jobs:
+                    future.add_done_callback(
+                        lambda f, video=video, job=job, workdir=workdir: downloaded(video, job, workdir, f))
+            # Every download has handed its muxes over once this returns
+            download_pool.shutdown(wait=True)
+            mux_pool.shutdown(wait=True)
+        finally:
+            download_pool.shutdown(wait=False, cancel_futures=True)
+            mux_pool.shutdown(wait=False, cancel_futures=True)
+            shutil.rmtree(tmproot, ignore_errors=True)
+        return jobs
+
+
+def batch_main(argv):
+    """Headless batch run; exit status 1 if any job failed."""
+    parser = argparse.ArgumentParser(description="Download and mux every row of a CSV manifest.")
+    parser.add_argument("--batch", required=True, metavar="MANIFEST", help="CSV of url, wav, output")
+    parser.add_argument("--downloads", type=int, default=DEFAULT_DOWNLOADS,
+                        help=f"concurrent downloads (default {DEFAULT_DOWNLOADS})")
+    parser.add_argument("--muxes", type=int, default=DEFAULT_MUXES,
+                        help=f"concurrent muxes (default {DEFAULT_MUXES})")
+    parser.add_argument("--trim-pop", action="store_true", help="cut each WAV at 2 s after its 2-pop")
+    parser.add_argument("--prefer-h264", action="store_true")
+    parser.add_argument("--renditions", default=",".join(DEFAULT_RENDITIONS),
+                        help="comma-separated outputs written in one pass: "
+                             + ", ".join(f"{name} ({desc})" for name, (desc, _) in RENDITIONS.items())
+                             + f" (default {','.join(DEFAULT_RENDITIONS)})")
+    parser.add_argument("--mp4-layout", choices=MP4_LAYOUTS, default="faststart",
+                        help="where the MP4 index goes: faststart rewrites the file to put it first; "
+                             "fragmented and reserved write the file once (default faststart)")
+    parser.add_argument("--thumbnails", action="store_true", help="save each thumbnail beside its output")
+    parser.add_argument("--no-cache", action="store_true", help="always download; do not use the download cache")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR))
+    parser.add_argument("--cache-size", type=float, default=DEFAULT_MAX_BYTES / 2 ** 30,
+                        help=f"download cache limit in GB (default {DEFAULT_MAX_BYTES / 2 ** 30:g})")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print yt-dlp and ffmpeg output")
+    args = parser.parse_args(argv)
+    renditions = tuple(dict.fromkeys(name.strip().lower() for name in args.renditions.split(",") if name.strip()))
+    unknown = [name for name in renditions if name not in RENDITIONS]
+    if unknown or not renditions:
+        parser.error(f"unknown rendition(s): {', '.join(unknown) or '(none given)'}")
+
+    tools = {name: find_tool(name) for name in ("yt-dlp", "ffmpeg")}
+    missing = [name for name, path in tools.items() if not path]
+    if missing:
+        print(f"Not found on PATH: {', '.join(missing)}", file=sys.stderr)
+        return 2
+    try:
+        jobs = read_manifest(args.batch)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    print_lock = threading.Lock()
+
+    def log(line):
+        if args.verbose:
+            with print_lock:
+                print(line, flush=True)
+
+    def on_status(job):
+        with print_lock:
+            detail = f": {job.error}" if job.error else ""
+            print(f"[{job.status:>11}] {os.path.basename(job.out)}{detail}", flush=True)
+
+    cache = None if args.no_cache else DownloadCache(args.cache_dir, int(args.cache_size * 2 ** 30))
+    try:
+        BatchMuxer(tools["yt-dlp"], tools["ffmpeg"], args.prefer_h264, args.trim_pop, args.thumbnails,
+                   args.downloads, args.muxes, log, on_status, cache,
+                   renditions=renditions, mp4_layout=args.mp4_layout).run(jobs)
+    finally:
+        if cache is not None:
+            cache.close()
+    failed = [job for job in jobs if job.status == "failed"]
+    print(f"\n{len(jobs) - len(failed)} muxed, {len(failed)} failed")
+    return 1 if failed else 0
+
+
 class MuxApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -57,8 +580,16 @@ class MuxApp(tk.Tk):
         self.trim_pop = tk.BooleanVar(value=False)
         self.prefer_h264 = tk.BooleanVar(value=False)
         self.grab_thumb = tk.BooleanVar(value=False)
+        self.use_cache = tk.BooleanVar(value=True)
+        self.also_mov = tk.BooleanVar(value=False)
+        self.mp4_layout = tk.StringVar(value="faststart")
+        self.cache = None
         self._out_user_edited = False
         self._running = False
+        # Raw yt-dlp/ffmpeg output goes here rather than into the log widget
+        self.log_path = os.path.join(LOG_DIR, f"yt_wav_mux_{time.strftime('%Y%m%d-%H%M%S')}.log")
+        self._log_file = None
+        self._log_lock = threading.Lock()
 
         pad = {"padx": 8, "pady": 4}
         frm = ttk.Frame(self, padding=8)
@@ -79,7 +610,7 @@ class MuxApp(tk.Tk):
         ttk.Button(frm, text="Save as…", command=self.pick_out).grid(row=2, column=2, **pad)
 
         ttk.Checkbutton(
-            frm, text="Trim 2-pop (remove first 2 s of WAV)", variable=self.trim_pop
+            frm, text="Trim 2-pop (cut the WAV 2 s after its pop)", variable=self.trim_pop
         ).grid(row=3, column=1, sticky="w", **pad)
         ttk.Checkbutton(
             frm, text="Prefer H.264 (QuickTime-safe; may cap resolution)",
@@ -89,17 +620,44 @@ class MuxApp(tk.Tk):
             frm, text="Save thumbnail as PNG (alongside output)",
             variable=self.grab_thumb
         ).grid(row=5, column=1, sticky="w", **pad)
-
-        self.go_btn = ttk.Button(frm, text="Download && Mux", command=self.start)
-        self.go_btn.grid(row=6, column=1, sticky="e", **pad)
+        ttk.Checkbutton(
+            frm, text="Cache downloads (new mixes against the same picture skip the download)",
+            variable=self.use_cache
+        ).grid(row=6, column=1, sticky="w", **pad)
+        ttk.Checkbutton(
+            frm, text="Also write a MOV with 24-bit PCM (same pass; downloads H.264 picture)",
+            variable=self.also_mov
+        ).grid(row=7, column=1, sticky="w", **pad)
+
+        ttk.Label(frm, text="MP4 layout").grid(row=8, column=0, sticky="w", **pad)
+        ttk.Combobox(
+            frm, textvariable=self.mp4_layout, values=MP4_LAYOUTS, state="readonly", width=12
+        ).grid(row=8, column=1, sticky="w", **pad)
+
+        btns = ttk.Frame(frm)
+        btns.grid(row=9, column=1, columnspan=2, sticky="e", **pad)
+        self.batch_btn = ttk.Button(btns, text="Batch from CSV…", command=self.start_batch)
+        self.batch_btn.pack(side="left", padx=(0, 8))
+        self.go_btn = ttk.Button(btns, text="Download && Mux", command=self.start)
+        self.go_btn.pack(side="left")
 
         self.status = tk.StringVar(value="Ready.")
         ttk.Label(frm, textvariable=self.status, anchor="w").grid(
-            row=7, column=0, columnspan=3, sticky="ew", **pad
+            row=10, column=0, columnspan=2, sticky="ew", **pad
         )
+        self.progress = ttk.Progressbar(frm, mode="determinate", maximum=100, length=160)
+        self.progress.grid(row=10, column=2, sticky="e", **pad)
+
+        self.jobs_view = ttk.Treeview(frm, columns=("status", "output"), height=6)
+        self.jobs_view.heading("#0", text="Job")
+        self.jobs_view.heading("status", text="Status")
+        self.jobs_view.heading("output", text="Output")
+        self.jobs_view.column("#0", width=50, stretch=False)
+        self.jobs_view.column("status", width=200, stretch=False)
+        self._job_rows = {}
 
         self.log = tk.Text(frm, height=12, width=80, state="disabled", wrap="none")
-        self.log.grid(row=8, column=0, columnspan=3, sticky="nsew", **pad)
+        self.log.grid(row=12, column=0, columnspan=3, sticky="nsew", **pad)
 
     # ---------- UI helpers ----------
 
@@ -110,8 +668,7 @@ class MuxApp(tk.Tk):
         if path:
             self.wav.set(path)
             if not self._out_user_edited:
-                base = os.path.splitext(os.path.basename(path))[0]
-                self.out.set(os.path.join(os.path.dirname(path), f"{base}_mux.mp4"))
+                self.out.set(default_output(path))
 
     def pick_out(self):
         initial = self.out.get()
@@ -131,10 +688,59 @@ class MuxApp(tk.Tk):
         self.log.insert("end", text.rstrip() + "\n")
         self.log.see("end")
         self.log.configure(state="disabled")
+        self.raw_line(text)
+
+    def post_log(self, text):
+        """log_line from any thread."""
+        self.after(0, self.log_line, text)
+
+    def raw_line(self, text):
+        """Append to the tool output log file; safe from any thread."""
+        with self._log_lock:
+            try:
+                if self._log_file is None:
+                    os.makedirs(LOG_DIR, exist_ok=True)
+                    self._log_file = open(self.log_path, "a", encoding="utf-8", buffering=1)
+                self._log_file.write(text.rstrip() + "\n")
+            except OSError:
+                pass    # losing the raw log must not stop a mux
 
     def set_status(self, text):
         self.status.set(text)
 
+    def show_progress(self, stage, progress):
+        self.set_status(f"{stage} {progress.describe()}")
+        self.progress.configure(value=(progress.fraction or 0) * 100)
+
+    def renditions(self):
+        return DEFAULT_RENDITIONS + (("mov",) if self.also_mov.get() else ())
+
+    def download_cache(self):
+        """The shared download cache, opened on first use (None when disabled)."""
+        if not self.use_cache.get():
+            return None
+        if self.cache is None:
+            self.cache = DownloadCache()
+        return self.cache
+
+    def set_running(self, running):
+        self._running = running
+        if running:
+            self.progress.configure(value=0)
+        state = "disabled" if running else "normal"
+        self.go_btn.configure(state=state)
+        self.batch_btn.configure(state=state)
+
+    def show_job(self, job):
+        status = f"{job.status}: {job.error}" if job.error else job.status
+        if job.status in ("done", "failed"):
+            status += f" ({job.seconds:.0f} s)"
+        self.jobs_view.item(self._job_rows[id(job)], values=(status, job.out))
+
+    def show_job_progress(self, job, progress):
+        if job.status in ("downloading", "muxing"):
+            self.jobs_view.item(self._job_rows[id(job)], values=(f"{job.status} {progress.describe()}", job.out))
+
     # ---------- pipeline ----------
 
     def start(self):
@@ -150,90 +756,112 @@ class MuxApp(tk.Tk):
         if not out:
             messagebox.showwarning("Missing input", "Set an output path.")
             return
-        if os.path.exists(out) and not messagebox.askyesno(
-            "Overwrite?", f"{out}\nalready exists. Overwrite?"
+        existing = [path for path in rendition_paths(out, self.renditions()).values() if os.path.exists(path)]
+        if existing and not messagebox.askyesno(
+            "Overwrite?", "Already exists:\n" + "\n".join(existing) + "\n\nOverwrite?"
         ):
             return
-        self._running = True
-        self.go_btn.configure(state="disabled")
+        self.set_running(True)
         threading.Thread(target=self.run_pipeline, args=(url, wav, out), daemon=True).start()
 
-    def run_proc(self, cmd):
-        self.log_line("$ " + " ".join(cmd))
-        proc = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-            text=True, bufsize=1
+    def start_batch(self):
+        if self._running:
+            return
+        path = filedialog.askopenfilename(
+            title="Select batch manifest (url, wav, output)",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*")]
         )
-        for line in proc.stdout:
-            # keep yt-dlp progress lines readable without flooding
-            line = line.rstrip()
-            if line:
-                self.after(0, self.log_line, line)
-        proc.wait()
-        if proc.returncode != 0:
-            raise RuntimeError(f"{os.path.basename(cmd[0])} exited {proc.returncode}")
+        if not path:
+            return
+        try:
+            jobs = read_manifest(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Manifest", str(e))
+            return
+        missing = [job.wav for job in jobs if not os.path.isfile(job.wav)]
+        if missing:
+            messagebox.showwarning("Missing WAVs", "Not found:\n" + "\n".join(missing[:10]))
+            return
+        existing = [path for job in jobs for path in rendition_paths(job.out, self.renditions()).values()
+                    if os.path.exists(path)]
+        if existing and not messagebox.askyesno(
+            "Overwrite?", f"{len(existing)} output(s) already exist. Overwrite?"
+        ):
+            return
+
+        self.jobs_view.delete(*self.jobs_view.get_children())
+        self._job_rows = {
+            id(job): self.jobs_view.insert("", "end", text=str(i), values=(job.status, job.out))
+            for i, job in enumerate(jobs, start=1)
+        }
+        self.jobs_view.grid(row=11, column=0, columnspan=3, sticky="nsew", padx=8, pady=4)
+        self.set_running(True)
+        threading.Thread(target=self.run_batch, args=(jobs,), daemon=True).start()
+
+    def run_proc(self, cmd, stage):
+        run_proc(cmd, self.post_log, lambda progress: self.after(0, self.show_progress, stage, progress),
+                 self.raw_line)
+
+    def run_batch(self, jobs):
+        self.after(0, self.set_status, f"Batch: {len(jobs)} jobs…")
+        self.post_log(f"Tool output: {self.log_path}")
+        try:
+            BatchMuxer(
+                self.ytdlp, self.ffmpeg, self.prefer_h264.get(), self.trim_pop.get(), self.grab_thumb.get(),
+                log=self.post_log,
+                on_status=lambda job: self.after(0, self.show_job, job),
+                cache=self.download_cache(),
+                on_progress=lambda job, progress: self.after(0, self.show_job_progress, job, progress),
+                raw=self.raw_line,
+                renditions=self.renditions(),
+                mp4_layout=self.mp4_layout.get(),
+            ).run(jobs)
+            failed = sum(job.status == "failed" for job in jobs)
+            summary = f"Batch done: {len(jobs) - failed} muxed, {failed} failed"
+            self.after(0, self.set_status, summary)
+            self.after(0, (messagebox.showwarning if failed else messagebox.showinfo), "Batch", summary)
+        except Exception as e:
+            self.after(0, self.set_status, f"Batch failed: {e}")
+            self.after(0, messagebox.showerror, "Error", str(e))
+        finally:
+            self.after(0, self.set_running, False)
 
     def run_pipeline(self, url, wav, out):
-        tmpdir = tempfile.mkdtemp(prefix="ytmux_")
+        cache = self.download_cache()
+        tmpdir = tempfile.mkdtemp(prefix="ytmux_", dir=cache.partial_dir if cache else None)
+        log = self.post_log
+        cached = None
+        log(f"Tool output: {self.log_path}")
         try:
             # 1) Download best video-only stream (we discard YT audio anyway)
             self.after(0, self.set_status, "Downloading video…")
-            if self.prefer_h264.get():
-                fmt = "bv*[vcodec^=avc]/bv*[ext=mp4]/bv*"
-            else:
-                fmt = "bv*/b"
-            vid_tmpl = os.path.join(tmpdir, "video.%(ext)s")
-            dl_cmd = [
-                self.ytdlp, "-f", fmt, "--no-playlist",
-                "-o", vid_tmpl,
-            ]
-            if self.grab_thumb.get():
-                dl_cmd += ["--write-thumbnail", "--convert-thumbnails", "png"]
-            dl_cmd.append(url)
-            self.run_proc(dl_cmd)
-            files = os.listdir(tmpdir)
-            vids = [f for f in files if f.startswith("video.") and not f.endswith(".png")]
-            if not vids:
-                raise RuntimeError("Download produced no video file.")
-            video_path = os.path.join(tmpdir, vids[0])
-
+            video_path, thumb, cached = fetch_video(
+                self.ytdlp, url, tmpdir, video_format(self.prefer_h264.get(), self.renditions()), self.grab_thumb.get(), log, cache,
+                lambda progress: self.after(0, self.show_progress, "Downloading video…", progress), self.raw_line
+            )
             if self.grab_thumb.get():
-                thumbs = [f for f in files if f.endswith(".png")]
-                if thumbs:
-                    thumb_out = os.path.splitext(out)[0] + ".png"
-                    shutil.copy2(os.path.join(tmpdir, thumbs[0]), thumb_out)
-                    self.after(0, self.log_line, f"Thumbnail saved: {thumb_out}")
-                else:
-                    self.after(0, self.log_line, "No thumbnail found for this video.")
+                save_thumbnail(thumb, out, log)
 
             # 2) Mux: video stream copied, WAV -> AAC, original audio dropped
             self.after(0, self.set_status, "Muxing…")
-            cmd = [self.ffmpeg, "-hide_banner", "-y"]
-            cmd += ["-i", video_path]
-            if self.trim_pop.get():
-                cmd += ["-ss", "2", "-i", wav]
-            else:
-                cmd += ["-i", wav]
-            cmd += [
-                "-map", "0:v:0", "-map", "1:a:0",
-                "-c:v", "copy",
-                *aac_encoder(self.ffmpeg),
-                "-movflags", "+faststart",
-                "-shortest",
-                out,
-            ]
-            self.run_proc(cmd)
+            trim = pop_trim(wav, log) if self.trim_pop.get() else 0
+            outputs = rendition_paths(out, self.renditions())
+            self.run_proc(mux_command(self.ffmpeg, video_path, wav, outputs, trim, self.mp4_layout.get()), "Muxing…")
 
             self.after(0, self.set_status, f"Done: {out}")
-            self.after(0, messagebox.showinfo, "Done", f"Written:\n{out}")
+            self.after(0, messagebox.showinfo, "Done", "Written:\n" + "\n".join(outputs.values()))
         except Exception as e:
             self.after(0, self.set_status, f"Failed: {e}")
             self.after(0, messagebox.showerror, "Error", str(e))
         finally:
+            if cached is not None:
+                cache.release(cached)
             shutil.rmtree(tmpdir, ignore_errors=True)
-            self._running = False
-            self.after(0, lambda: self.go_btn.configure(state="normal"))
+            self.after(0, self.set_running, False)
 
 
 if __name__ == "__main__":
+    # Any arguments mean a headless batch run
+    if len(sys.argv) > 1:
+        sys.exit(batch_main(sys.argv[1:]))
     MuxApp().mainloop()